@@ -1,4 +1,7 @@
 import os
 from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Las vistas async (p. ej. relay.views.template_fields) corren en el event loop
+# del servidor ASGI y comparten un AsyncDopplerRelayClient por loop
+# (relay.services.doppler_relay_async.get_async_client).
 application = get_asgi_application()
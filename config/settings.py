@@ -116,14 +116,102 @@ DOPPLER_RELAY = {
     "TIMEOUT": 30,
     "DEFAULT_FROM_EMAIL": env("DOPPLER_RELAY_FROM_EMAIL", default=""),
     "DEFAULT_FROM_NAME": env("DOPPLER_RELAY_FROM_NAME", default=""),
+    # Destinatarios por llamada a /templates/{id}/message en envíos masivos
+    "BULK_BATCH_SIZE": env.int("DOPPLER_RELAY_BULK_BATCH_SIZE", default=1),
+    # Lotes en vuelo simultáneos por cuenta (entero o dict {"<account_id>": n, "default": n})
+    "BULK_CONCURRENCY": env.int("DOPPLER_RELAY_BULK_CONCURRENCY", default=1),
+    # Destinatarios procesados entre checkpoints de progreso (reanudación de envíos)
+    "BULK_CHECKPOINT_EVERY": env.int("DOPPLER_RELAY_BULK_CHECKPOINT_EVERY", default=100),
+    # Conexiones keep-alive por host del cliente compartido (get_client); se amplía
+    # automáticamente hasta la mayor BULK_CONCURRENCY
+    "HTTP_POOL_MAXSIZE": env.int("DOPPLER_RELAY_HTTP_POOL_MAXSIZE", default=10),
+    # Segundos que se cachean los metadatos de plantillas (nombre, asunto, variables)
+    "TEMPLATE_CACHE_TTL": env.int("DOPPLER_RELAY_TEMPLATE_CACHE_TTL", default=600),
+    # Tamaño máximo (bytes de base64) del cache en memoria de adjuntos codificados por SHA-256
+    "ATTACHMENT_CACHE_MAX_BYTES": env.int("DOPPLER_RELAY_ATTACHMENT_CACHE_MAX_BYTES", default=64 * 1024 * 1024),
+    # Límites de conexiones del cliente asyncio (AsyncDopplerRelayClient)
+    "ASYNC_MAX_CONNECTIONS": env.int("DOPPLER_RELAY_ASYNC_MAX_CONNECTIONS", default=100),
+    "ASYNC_MAX_KEEPALIVE": env.int("DOPPLER_RELAY_ASYNC_MAX_KEEPALIVE", default=20),
+    # Token bucket por cuenta (peticiones/segundo; 0 = sin límite). RATE acepta un
+    # dict por cuenta {"<account_id>": n, "default": n}. Compartido vía CACHES.
+    "RATE_LIMIT": {
+        "RATE": env.float("DOPPLER_RELAY_RATE_LIMIT", default=0),
+        "BURST": env.int("DOPPLER_RELAY_RATE_BURST", default=0),
+        "CACHE_ALIAS": "default",
+    },
+    # Reintentos (solo red/429/5xx): intentos por llamada, plazo total por llamada y
+    # segundos de espera acumulables por envío masivo
+    "RETRY": {
+        "MAX_ATTEMPTS": env.int("DOPPLER_RELAY_RETRY_MAX_ATTEMPTS", default=3),
+        "BASE_DELAY": 0.8,
+        "MAX_DELAY": 8,
+        "CALL_DEADLINE": env.int("DOPPLER_RELAY_RETRY_CALL_DEADLINE", default=60),
+        "BULK_BUDGET_SECONDS": env.int("DOPPLER_RELAY_RETRY_BULK_BUDGET", default=300),
+    },
+    # Inserción por lotes de EmailMessage durante envíos masivos: filas por bulk_create
+    # y segundos máximos que una fila espera en el buffer
+    "PERSIST": {
+        "BATCH_SIZE": env.int("DOPPLER_RELAY_PERSIST_BATCH_SIZE", default=500),
+        "FLUSH_SECONDS": env.float("DOPPLER_RELAY_PERSIST_FLUSH_SECONDS", default=2.0),
+    },
+    # Omitir destinatarios del índice de supresión (rebotes, spam, desuscritos)
+    "SUPPRESSION_ENABLED": env.bool("DOPPLER_RELAY_SUPPRESSION_ENABLED", default=True),
+    # Cola de trabajos (manage.py run_jobs): intentos por trabajo, segundos base del
+    # backoff entre reintentos y lease de un trabajo en ejecución
+    "JOBS": {
+        "MAX_ATTEMPTS": env.int("DOPPLER_RELAY_JOBS_MAX_ATTEMPTS", default=3),
+        "RETRY_DELAY": env.int("DOPPLER_RELAY_JOBS_RETRY_DELAY", default=30),
+        "LEASE_SECONDS": env.int("DOPPLER_RELAY_JOBS_LEASE_SECONDS", default=120),
+    },
+    # Circuit breaker por (cuenta, familia de endpoint); FAILURE_THRESHOLD=0 lo desactiva
+    "CIRCUIT_BREAKER": {
+        "FAILURE_THRESHOLD": env.int("DOPPLER_RELAY_CIRCUIT_FAILURES", default=5),
+        "WINDOW": 60,
+        "RESET_TIMEOUT": env.int("DOPPLER_RELAY_CIRCUIT_RESET_SECONDS", default=30),
+        "HALF_OPEN_CALLS": 1,
+    },
+    # Trazas HTTP (logger "relay.http"): off | basic | headers | body
+    "TRACE": {
+        "LEVEL": env("DOPPLER_RELAY_TRACE_LEVEL", default="off"),
+        "SAMPLE_RATE": env.float("DOPPLER_RELAY_TRACE_SAMPLE_RATE", default=1.0),
+        "MAX_BODY_CHARS": env.int("DOPPLER_RELAY_TRACE_MAX_BODY_CHARS", default=2000),
+    },
 }
 
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        # Solo emite a DEBUG cuando las trazas están activas
+        "relay.http": {
+            "handlers": ["console"],
+            "level": "WARNING" if DOPPLER_RELAY["TRACE"]["LEVEL"] == "off" else "DEBUG",
+            "propagate": False,
+        },
+    },
+}
+
+# Cache compartido (limitador de ritmo, plantillas). Por defecto memoria local por
+# proceso; para compartir entre scheduler/admin/web usar p. ej.
+# CACHE_URL=dbcache://relay_cache (requiere `manage.py createcachetable`) o redis://...
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+
 # Config por defecto para reportería (ajustable por .env via environ.Env si se desea)
 DOPPLER_REPORTS = {
     "TIMEOUT": int(env("DOPPLER_REPORTS_TIMEOUT", default=30)),
     "POLL_INITIAL_DELAY": int(env("DOPPLER_REPORTS_POLL_INITIAL_DELAY", default=2)),
     "POLL_MAX_DELAY": int(env("DOPPLER_REPORTS_POLL_MAX_DELAY", default=15)),
     "POLL_TOTAL_TIMEOUT": int(env("DOPPLER_REPORTS_POLL_TOTAL_TIMEOUT", default=15 * 60)),
+    # Descarga del CSV en streaming (bytes por chunk) y reintentos con Range del enlace externo
+    "DOWNLOAD_CHUNK_SIZE": int(env("DOPPLER_REPORTS_DOWNLOAD_CHUNK_SIZE", default=1024 * 1024)),
+    "DOWNLOAD_RETRIES": int(env("DOPPLER_REPORTS_DOWNLOAD_RETRIES", default=3)),
+    # Solicitudes/consultas/descargas de reportes en vuelo por cuenta (entero o dict {"<account_id>": n, "default": n})
+    "CONCURRENCY": int(env("DOPPLER_REPORTS_CONCURRENCY", default=4)),
+    # Minutos de solape al pedir el delta desde la marca de agua (eventos publicados con retraso)
+    "INCREMENTAL_OVERLAP_MINUTES": int(env("DOPPLER_REPORTS_INCREMENTAL_OVERLAP_MINUTES", default=15)),
 }
 
 
@@ -19,9 +19,12 @@ from django.utils import timezone
 from django.utils.html import format_html
 from django.db import models, connection
 
-from .models import EmailMessage, BulkSend, Attachment, UserEmailConfig
-from .services.doppler_relay import DopplerRelayClient, DopplerRelayError
-from .services.bulk_processing import process_bulk_id
+from .models import EmailMessage, BulkSend, BulkSendRecipient, Attachment, Job, SuppressedRecipient, UserEmailConfig
+from .services.doppler_relay import DopplerRelayError, get_client
+from .services.template_cache import get_template_metadata
+from .services.bulk_processing import can_resume
+from .services.jobs import enqueue_bulk_send
+from .services.preflight import enqueue_preflight
 
 
 logger = logging.getLogger(__name__)
@@ -130,7 +133,7 @@ class EmailMessageAdmin(admin.ModelAdmin):
 
     def send_email(self, request, queryset):
         from django.utils import timezone
-        client = DopplerRelayClient()
+        client = get_client()
         success = 0
         errors = 0
 
@@ -283,6 +286,55 @@ class AttachmentAdmin(admin.ModelAdmin):
     file_link.short_description = 'Archivo'
 
 
+@admin.register(SuppressedRecipient)
+class SuppressedRecipientAdmin(admin.ModelAdmin):
+    list_display = ('email', 'reason', 'source', 'last_seen', 'created_at')
+    list_filter = ('reason', 'source')
+    search_fields = ('email',)
+    readonly_fields = ('event_id', 'created_at', 'last_seen')
+    list_per_page = 100
+    show_full_result_count = False
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'payload', 'status', 'attempts', 'max_attempts', 'run_after', 'locked_by', 'updated_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('created_at', 'updated_at', 'locked_at', 'locked_by', 'last_error')
+    ordering = ('-id',)
+    actions = ['reencolar']
+
+    def reencolar(self, request, queryset):
+        # Devuelve a la cola trabajos agotados (dead) con un intento extra
+        count = 0
+        for job in queryset.filter(status=Job.DEAD):
+            job.status = Job.QUEUED
+            job.max_attempts = job.attempts + 1
+            job.run_after = timezone.now()
+            job.save(update_fields=['status', 'max_attempts', 'run_after', 'updated_at'])
+            count += 1
+        messages.info(request, f"{count} trabajo(s) reencolado(s).")
+    reencolar.short_description = 'Reencolar trabajos fallidos'
+
+
+@admin.register(BulkSendRecipient)
+class BulkSendRecipientAdmin(admin.ModelAdmin):
+    list_display = ('bulk', 'position', 'email', 'status', 'message_id', 'error_code', 'error')
+    list_filter = ('status', 'error_code')
+    search_fields = ('email', 'message_id')
+    list_per_page = 100
+    # Evita el COUNT(*) completo en envíos de cientos de miles de filas
+    show_full_result_count = False
+    ordering = ('bulk', 'position')
+    raw_id_fields = ('bulk',)
+
+    def get_readonly_fields(self, request, obj=None):
+        return [f.name for f in self.model._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+
 class BulkSendForm(forms.ModelForm):
     TEMPLATE_CACHE_PREFIX = "relay:templates"
     TEMPLATE_CACHE_FRESH_SECONDS = 300
@@ -505,7 +557,7 @@ class BulkSendForm(forms.ModelForm):
 
     def _load_templates_from_api(self, account_id) -> list[tuple[str, str]]:
         start = time.perf_counter()
-        client = DopplerRelayClient()
+        client = get_client()
         data = client.list_templates(account_id)
         latency_ms = (time.perf_counter() - start) * 1000
         choices = self._normalize_template_items(data)
@@ -580,13 +632,15 @@ class BulkSendAdmin(admin.ModelAdmin):
     form = BulkSendForm
     list_display = ("id", "template_display", "subject", "created_at", "scheduled_at",
                     "status", "attachment_count", "report_link_v2")
-    readonly_fields = ("result", "log", "status", "created_at", "processing_started_at",
-                       "template_name", "variables", "post_reports_status", "post_reports_loaded_at")
+    readonly_fields = ("result", "recipients_link", "preflight", "preflight_link", "log", "status", "created_at",
+                       "processing_started_at", "checkpoint", "template_name", "variables", "post_reports_status", "post_reports_loaded_at")
 
     def get_exclude(self, request, obj=None):
-        base = list(super().get_exclude(request, obj) or [])
+        base = list(super().get_exclude(request, obj) or []) + ["preflight_file"]
         technical = [
+            "preflight",
             "processing_started_at",
+            "checkpoint",
             "post_reports_status",
             "post_reports_loaded_at",
             "template_name",
@@ -643,15 +697,28 @@ class BulkSendAdmin(admin.ModelAdmin):
         return ''
     report_link_v2.short_description = 'Reporte v2'
 
+    def recipients_link(self, obj: BulkSend):
+        # Los resultados por destinatario se ven paginados en su propio listado
+        if not obj.pk:
+            return ""
+        url = reverse("admin:relay_bulksendrecipient_changelist") + f"?bulk__id__exact={obj.pk}"
+        return format_html('<a href="{}">Ver destinatarios</a>', url)
+    recipients_link.short_description = 'Destinatarios'
+
+    def preflight_link(self, obj: BulkSend):
+        if not obj.preflight_file:
+            return ""
+        return format_html('<a href="{}">Descargar filas inválidas</a>', obj.preflight_file.url)
+    preflight_link.short_description = 'Filas inválidas'
+
     def save_model(self, request, obj: BulkSend, form, change):
         # Persistir template_name como caché para el listado
         try:
             if obj.template_id:
-                client = DopplerRelayClient()
                 account = getattr(settings, 'DOPPLER_RELAY', {}) or {}
                 account_id = account.get('ACCOUNT_ID')
                 if account_id:
-                    data = client.get_template(
+                    data = get_template_metadata(
                         int(account_id), str(obj.template_id))
                     name = (data.get('name') or '').strip()
                     if name:
@@ -660,26 +727,22 @@ class BulkSendAdmin(admin.ModelAdmin):
             pass
         super().save_model(request, obj, form, change)
 
-    actions = ["procesar_envio_masivo"]
+    actions = ["procesar_envio_masivo", "reanudar_envio_masivo", "validar_archivo"]
 
     def procesar_envio_masivo(self, request, queryset):
-        # Ejecutar en background para no bloquear la request del admin
-        from django.utils import timezone
-        import threading
+        # Encolar para el worker (manage.py run_jobs) en lugar de ocupar el worker web
         scheduled_any = False
         for bulk in queryset:
             if bulk.status != "pending":
                 messages.warning(request, f"BulkSend {bulk.id} ya procesado.")
                 continue
-            bulk.processing_started_at = timezone.now()
-            bulk.log = ((bulk.log or "") +
-                        "\n[BG] Envío iniciado desde admin").strip()
-            bulk.save(update_fields=["processing_started_at", "log"])
-            threading.Thread(target=process_bulk_id, args=(
-                bulk.id,), daemon=True).start()
-            messages.info(
-                request, f"BulkSend {bulk.id} en proceso (background). Revise el estado en la lista.")
             scheduled_any = True
+            job = enqueue_bulk_send(bulk, source="admin")
+            if job is None:
+                messages.warning(request, f"BulkSend {bulk.id} ya está en cola.")
+                continue
+            messages.info(
+                request, f"BulkSend {bulk.id} encolado (job {job.pk}). Revise el estado en la lista.")
         if scheduled_any:
             return
         import csv
@@ -694,9 +757,8 @@ class BulkSendAdmin(admin.ModelAdmin):
             recipients = []
             try:
                 # Obtener información de la plantilla para validar variables
-                client = DopplerRelayClient()
                 ACCOUNT_ID = settings.DOPPLER_RELAY["ACCOUNT_ID"]
-                template_info = client.get_template_fields(
+                template_info = get_template_metadata(
                     ACCOUNT_ID, bulk.template_id)
                 required_vars = set(template_info["variables"])
 
@@ -825,7 +887,8 @@ class BulkSendAdmin(admin.ModelAdmin):
                     recipients=recipients,
                     subject=subject,
                     adj_list=adj_list,
-                    user=request.user  # ¡ESTO FALTABA!
+                    user=request.user,  # ¡ESTO FALTABA!
+                    idempotency_prefix=f"bulk-{bulk.pk}",
                 )
                 bulk.result = response.content.decode(
                     "utf-8") if hasattr(response, 'content') else json.dumps(response)
@@ -860,6 +923,34 @@ class BulkSendAdmin(admin.ModelAdmin):
             messages.info(request, f"BulkSend {bulk.id} procesado.")
     procesar_envio_masivo.short_description = "Procesar envío masivo seleccionado"
 
+    def reanudar_envio_masivo(self, request, queryset):
+        # Continúa desde el último checkpoint sin reenviar lo ya procesado. Solo envíos en error
+        # o sin progreso reciente; el trabajo vuelve a comprobarlo al tomarlo (claim_bulk)
+        for bulk in queryset:
+            if not can_resume(bulk):
+                messages.warning(request, f"BulkSend {bulk.id} no tiene progreso para reanudar o sigue en curso.")
+                continue
+            job = enqueue_bulk_send(bulk, resume=True, source="admin")
+            if job is None:
+                messages.warning(request, f"BulkSend {bulk.id} ya está en cola.")
+                continue
+            messages.info(
+                request, f"BulkSend {bulk.id} encolado para reanudar desde el destinatario "
+                         f"{bulk.checkpoint.get('offset')} (job {job.pk}).")
+    reanudar_envio_masivo.short_description = "Reanudar envío masivo desde el último checkpoint"
+
+    def validar_archivo(self, request, queryset):
+        # Vuelve a correr el preflight (p. ej. tras cambiar el mapeo de variables)
+        for bulk in queryset:
+            job = enqueue_preflight(bulk.pk)
+            if job is None:
+                messages.warning(request, f"BulkSend {bulk.id} ya tiene una validación en cola.")
+                continue
+            bulk.preflight = {"status": "queued"}
+            bulk.save(update_fields=["preflight"])
+            messages.info(request, f"BulkSend {bulk.id}: validación del archivo encolada (job {job.pk}).")
+    validar_archivo.short_description = "Validar archivo de destinatarios"
+
     # Vista de reporte local (consulta BD)
 
     def view_report(self, request, pk: int):
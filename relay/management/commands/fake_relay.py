@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from relay.services.fake_relay import FakeRelayConfig, FakeRelayServer
+
+
+class Command(BaseCommand):
+    help = "Levanta un servidor local que imita la API de Doppler Relay (pruebas de carga sin la API real)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--latency", type=float, default=0.0, help="Segundos de latencia por petición")
+        parser.add_argument("--jitter", type=float, default=0.0, help="Latencia aleatoria adicional (0..jitter)")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de respuestas 503")
+        parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fracción de respuestas 429")
+        parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After de los 429 (segundos)")
+        parser.add_argument("--quota", type=int, default=0,
+                            help="Destinatarios aceptados antes de responder 402 (0 = sin límite)")
+        parser.add_argument("--bounce-rate", type=float, default=0.0, help="Fracción de entregas rebotadas")
+        parser.add_argument("--report-delay", type=float, default=0.0,
+                            help="Segundos hasta que un reporte queda procesado")
+        parser.add_argument("--report-rows", type=int, default=0, help="Filas sintéticas extra por reporte")
+        parser.add_argument("--page-size", type=int, default=100)
+        parser.add_argument("--templates", type=int, default=1, help="Plantillas precargadas")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        config = FakeRelayConfig(
+            latency=options["latency"], jitter=options["jitter"], error_rate=options["error_rate"],
+            rate_limit_rate=options["rate_limit_rate"], retry_after=options["retry_after"],
+            quota=options["quota"], bounce_rate=options["bounce_rate"], report_delay=options["report_delay"],
+            report_rows=options["report_rows"], page_size=max(1, options["page_size"]),
+            seed=options["seed"], templates=options["templates"])
+        server = FakeRelayServer((options["host"], options["port"]), config)
+        self.stdout.write(self.style.SUCCESS(
+            f"Doppler Relay simulado en {server.base_url} "
+            f"(usar DOPPLER_RELAY_BASE_URL={server.base_url}); Ctrl+C para detener"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            state = server.state
+            self.stdout.write(
+                f"Peticiones: {state.requests}, destinatarios aceptados: {state.accepted}, "
+                f"reportes: {len(state.reports)}")
@@ -1,19 +1,45 @@
 ﻿from __future__ import annotations
 
+import signal
+import threading
+from datetime import timedelta
+
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.utils import timezone
 
 from relay.models import BulkSend
-from relay.services.bulk_processing import process_bulk_id
+from relay.services.bulk_processing import can_resume, process_bulk_id
+from relay.services.bulk_scheduler import (
+    DEFAULT_LEASE_SECONDS, DEFAULT_MAX_SLEEP, Heartbeat, last_progress, run_daemon,
+)
 
 BATCH_SIZE = 50
+# Minutos sin checkpoint para considerar muerto un envío en "processing"
+STALE_MINUTES = 15
 
 
 class Command(BaseCommand):
     help = "Procesa envíos masivos programados (scheduled_at <= now) sin Celery"
 
+    def add_arguments(self, parser):
+        parser.add_argument("--resume", action="store_true",
+                            help="Reanudar también envíos interrumpidos desde su último checkpoint")
+        parser.add_argument("--stale-minutes", type=int, default=STALE_MINUTES,
+                            help="Minutos sin progreso para considerar interrumpido un envío")
+        parser.add_argument("--daemon", action="store_true",
+                            help="Quedarse corriendo: toma envíos apenas vencen (hasta SIGTERM/SIGINT)")
+        parser.add_argument("--workers", type=int, default=2,
+                            help="Envíos en paralelo en modo daemon")
+        parser.add_argument("--lease-seconds", type=int, default=DEFAULT_LEASE_SECONDS,
+                            help="Segundos sin heartbeat tras los que otro daemon retoma un envío")
+        parser.add_argument("--max-sleep", type=float, default=DEFAULT_MAX_SLEEP,
+                            help="Máximo de segundos entre revisiones en modo daemon")
+
     def handle(self, *args, **options):
+        if options.get("daemon"):
+            self._run_daemon(options)
+            return
         now = timezone.now()
         # Seleccionar candidatos programados (scheduled_at no nulo y en el pasado)
         qs = (
@@ -28,14 +54,45 @@ class Command(BaseCommand):
             if not acquired:
                 continue
             try:
-                self._process_bulk(bulk)
+                self._process_bulk(bulk, lease_seconds=options["lease_seconds"])
                 processed += 1
             except Exception as exc:
                 bulk.status = "error"
                 bulk.log = (bulk.log or "") + f"\n[Scheduler] Error: {exc}"
                 bulk.save(update_fields=["status", "log"])
 
+        resumed = 0
+        if options.get("resume"):
+            cutoff = now - timedelta(minutes=options["stale_minutes"])
+            for bulk in BulkSend.objects.filter(status="processing").order_by("processing_started_at")[:BATCH_SIZE]:
+                if not can_resume(bulk) or not self._claim_stale(bulk.id, cutoff):
+                    continue
+                try:
+                    self._process_bulk(bulk, resume=True, lease_seconds=options["lease_seconds"])
+                    resumed += 1
+                except Exception as exc:
+                    bulk.refresh_from_db()
+                    bulk.status = "error"
+                    bulk.log = (bulk.log or "") + f"\n[Scheduler] Error al reanudar: {exc}"
+                    bulk.save(update_fields=["status", "log"])
+
         self.stdout.write(self.style.SUCCESS(f"Scheduler procesó {processed} envíos"))
+        if resumed:
+            self.stdout.write(self.style.SUCCESS(f"Scheduler reanudó {resumed} envíos"))
+
+    def _run_daemon(self, options) -> None:
+        stop = threading.Event()
+
+        def _stop(signum, frame):
+            self.stdout.write("Deteniendo scheduler (se terminan los envíos en curso)...")
+            stop.set()
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+        workers = max(1, options["workers"])
+        self.stdout.write(self.style.SUCCESS(f"Scheduler daemon iniciado con {workers} worker(s)"))
+        run_daemon(workers=workers, lease_seconds=options["lease_seconds"],
+                   max_sleep=options["max_sleep"], stop=stop)
 
     def _acquire(self, bulk_id: int) -> bool:
         try:
@@ -47,12 +104,35 @@ class Command(BaseCommand):
                 )
                 if not row:
                     return False
-                row.processing_started_at = timezone.now()
-                row.save(update_fields=["processing_started_at"])
+                # En "processing" dentro del lock: un trabajo encolado ya no lo toma
+                row.status = "processing"
+                row.processing_started_at = row.heartbeat_at = timezone.now()
+                row.save(update_fields=["status", "processing_started_at", "heartbeat_at"])
+                return True
+        except Exception:
+            return False
+
+    def _claim_stale(self, bulk_id: int, cutoff) -> bool:
+        # Solo si nadie avanzó el envío desde ``cutoff`` (ni checkpoint ni otro reanudador)
+        try:
+            with transaction.atomic():
+                row = (
+                    BulkSend.objects.select_for_update(skip_locked=True)
+                    .filter(id=bulk_id, status="processing")
+                    .first()
+                )
+                if not row or last_progress(row) > cutoff:
+                    return False
+                row.processing_started_at = row.heartbeat_at = timezone.now()
+                row.save(update_fields=["processing_started_at", "heartbeat_at"])
                 return True
         except Exception:
             return False
 
-    def _process_bulk(self, bulk: BulkSend) -> None:
-        # Delegar el procesamiento completo al helper unificado
-        process_bulk_id(bulk.id)
+    def _process_bulk(self, bulk: BulkSend, *, resume: bool = False,
+                      lease_seconds: int = DEFAULT_LEASE_SECONDS) -> None:
+        # Delegar el procesamiento completo al helper unificado; el heartbeat
+        # evita que un daemon lo dé por caído mientras avanza
+        with Heartbeat(BulkSend, bulk.id, max(1.0, lease_seconds / 3)):
+            process_bulk_id(bulk.id, resume=resume)
+
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from relay.services.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = "Ejecuta los trabajos en cola (relay.Job) con un pool acotado de hilos"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2,
+                            help="Trabajos en paralelo")
+        parser.add_argument("--poll-seconds", type=float, default=5.0,
+                            help="Segundos entre revisiones de la cola cuando está vacía")
+        parser.add_argument("--lease-seconds", type=int, default=None,
+                            help="Segundos sin renovar el lease tras los que otro worker retoma el trabajo")
+        parser.add_argument("--once", action="store_true",
+                            help="Procesar lo que haya listo y salir (para cron/timer)")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+
+        def _stop(signum, frame):
+            self.stdout.write("Deteniendo worker (se terminan los trabajos en curso)...")
+            stop.set()
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+        workers = max(1, options["workers"])
+        if not options["once"]:
+            self.stdout.write(self.style.SUCCESS(f"Worker de trabajos iniciado con {workers} hilo(s)"))
+        taken = run_worker(workers=workers, poll_seconds=options["poll_seconds"],
+                           lease_seconds=options["lease_seconds"], stop=stop, once=options["once"])
+        self.stdout.write(self.style.SUCCESS(f"Worker ejecutó {taken} trabajo(s)"))
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from relay.models import SuppressedRecipient
+from relay.services.suppression import backfill_from_deliveries, sync_from_events
+
+
+class Command(BaseCommand):
+    help = "Actualiza el índice de supresión desde Event (incremental) y, opcionalmente, desde reports_deliveries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from-reports", action="store_true",
+                            help="Recorrer además todo reports_deliveries (carga inicial)")
+
+    def handle(self, *args, **options):
+        written = sync_from_events()
+        if options.get("from_reports"):
+            written += backfill_from_deliveries()
+        total = SuppressedRecipient.objects.count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Supresiones actualizadas: {written} (total en índice: {total})"))
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("relay", "20251107120000_add_template_name_postreports"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bulksend",
+            name="checkpoint",
+            field=models.JSONField(default=dict, blank=True),
+        ),
+    ]
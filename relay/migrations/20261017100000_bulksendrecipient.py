@@ -0,0 +1,32 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("relay", "20261017090000_bulksend_checkpoint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BulkSendRecipient",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("position", models.PositiveIntegerField()),
+                ("email", models.CharField(max_length=254)),
+                ("status", models.CharField(max_length=16)),
+                ("message_id", models.CharField(blank=True, max_length=64, null=True)),
+                ("error_code", models.CharField(blank=True, max_length=32, null=True)),
+                ("error", models.CharField(blank=True, max_length=255, null=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("bulk", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                           related_name="recipients", to="relay.bulksend")),
+            ],
+            options={
+                "verbose_name": "Destinatario de envío masivo",
+                "verbose_name_plural": "Destinatarios de envíos masivos",
+                "indexes": [models.Index(fields=["bulk", "status"], name="relay_bulks_bulk_id_f5e4c0_idx")],
+                "constraints": [models.UniqueConstraint(fields=("bulk", "position"), name="bulksendrecipient_bulk_position")],
+            },
+        ),
+    ]
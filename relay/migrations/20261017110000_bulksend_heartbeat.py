@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("relay", "20261017100000_bulksendrecipient"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bulksend",
+            name="heartbeat_at",
+            field=models.DateTimeField(null=True, blank=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relay', '20261017120000_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SuppressedRecipient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.CharField(max_length=254, unique=True)),
+                ('reason', models.CharField(max_length=16)),
+                ('source', models.CharField(default='manual', max_length=16)),
+                ('event_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Destinatario suprimido',
+                'verbose_name_plural': 'Destinatarios suprimidos',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relay', '20261017130000_suppressedrecipient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulksend',
+            name='preflight',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='bulksend',
+            name='preflight_file',
+            field=models.FileField(blank=True, null=True, upload_to='bulk_preflight/'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('relay', '20261017150000_syncwatermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emailmessage',
+            name='bulk',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='messages', to='relay.bulksend'),
+        ),
+        migrations.AddField(
+            model_name='emailmessage',
+            name='bulk_position',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
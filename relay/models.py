@@ -1,9 +1,12 @@
 # Modelo para registrar envíos masivos con plantilla
 from __future__ import annotations
 import base64
-from django.db import models
+from django.db import models, transaction
 from django.core.files.base import ContentFile
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from relay.services.attachments import encode_stream
 
 
 class UserEmailConfig(models.Model):
@@ -103,8 +106,12 @@ class Attachment(models.Model):
         return self.name
 
     def to_doppler_format(self):
-        """Convierte el archivo a formato base64 para Doppler"""
-        content = base64.b64encode(self.file.read()).decode('utf-8')
+        """Convierte el archivo a formato base64 para Doppler.
+
+        El base64 se cachea por SHA-256 del contenido (``relay.services.attachments``).
+        """
+        with self.file.open('rb') as f:
+            _, content = encode_stream(f)
         # Usar el nombre real del archivo en lugar del nombre personalizado
         filename = self.file.name.split(
             '/')[-1] if '/' in self.file.name else self.file.name
@@ -149,6 +156,13 @@ class BulkSend(models.Model):
     )
     # Flag/ts de trabajo para evitar solapes (uso interno)
     processing_started_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Progreso del envío para reanudar: {offset, ok, error, errors, updated_at}
+    checkpoint = models.JSONField(default=dict, blank=True)
+    # Lease del worker del scheduler daemon (se renueva mientras procesa)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Pre-validación del archivo de destinatarios (ver relay.services.preflight)
+    preflight = models.JSONField(default=dict, blank=True)
+    preflight_file = models.FileField(upload_to="bulk_preflight/", blank=True, null=True)
 
     # Trazabilidad de reportería post-envío (automatizada)
     post_reports_status = models.CharField(max_length=16, blank=True, null=True)
@@ -159,12 +173,11 @@ class BulkSend(models.Model):
         try:
             if self.template_id and not self.template_name:
                 from django.conf import settings
-                from .services.doppler_relay import DopplerRelayClient
+                from .services.template_cache import get_template_metadata
                 account = getattr(settings, 'DOPPLER_RELAY', {}) or {}
                 account_id = account.get('ACCOUNT_ID')
                 if account_id:
-                    client = DopplerRelayClient()
-                    data = client.get_template(int(account_id), str(self.template_id))
+                    data = get_template_metadata(int(account_id), str(self.template_id))
                     name = (data.get('name') or '').strip()
                     if name:
                         self.template_name = name
@@ -175,12 +188,126 @@ class BulkSend(models.Model):
             # No bloquear el guardado si la API falla
             if self.template_id and not self.template_name:
                 self.template_name = str(self.template_id)
+        # Pre-validar en background cuando se guarda un archivo nuevo (alta o reemplazo)
+        file_changed = False
+        if kwargs.get("update_fields") is None and self.recipients_file:
+            previous = None
+            if self.pk:
+                previous = type(self).objects.filter(pk=self.pk).values_list("recipients_file", flat=True).first()
+            file_changed = previous != self.recipients_file.name
+            if file_changed:
+                self.preflight = {"status": "queued"}
         super().save(*args, **kwargs)
+        if file_changed:
+            from .services.preflight import enqueue_preflight
+            transaction.on_commit(lambda: enqueue_preflight(self.pk))
 
     def __str__(self):
         return f"BulkSend {self.id} - {self.template_id} ({self.created_at:%Y-%m-%d %H:%M})"
 
 
+class BulkSendRecipient(models.Model):
+    """Resultado de un destinatario de un BulkSend (una fila por destinatario)."""
+    bulk = models.ForeignKey(BulkSend, on_delete=models.CASCADE, related_name="recipients")
+    # Posición del destinatario en el archivo (0-based), para ordenar y reanudar
+    position = models.PositiveIntegerField()
+    email = models.CharField(max_length=254)
+    status = models.CharField(max_length=16)
+    message_id = models.CharField(max_length=64, blank=True, null=True)
+    # Status HTTP de la API, "invalid" (validación local) o "api"
+    error_code = models.CharField(max_length=32, blank=True, null=True)
+    error = models.CharField(max_length=255, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Destinatario de envío masivo"
+        verbose_name_plural = "Destinatarios de envíos masivos"
+        constraints = [
+            models.UniqueConstraint(fields=["bulk", "position"], name="bulksendrecipient_bulk_position"),
+        ]
+        indexes = [
+            models.Index(fields=["bulk", "status"]),
+        ]
+
+    def __str__(self):
+        return f"{self.email} ({self.status})"
+
+
+class SuppressedRecipient(models.Model):
+    """Dirección que no debe recibir más envíos (rebote, spam o desuscripción)."""
+    email = models.CharField(max_length=254, unique=True)
+    reason = models.CharField(max_length=16)
+    # Origen de la primera detección: report | event | manual
+    source = models.CharField(max_length=16, default="manual")
+    # Último Event procesado que la generó (marca de agua de sync_from_events)
+    event_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Destinatario suprimido"
+        verbose_name_plural = "Destinatarios suprimidos"
+
+    def save(self, *args, **kwargs):
+        self.email = (self.email or "").strip().lower()
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.email} ({self.reason})"
+
+
+class SyncWatermark(models.Model):
+    """Último id ya recorrido por una sincronización incremental (p. ej. ``Event`` -> supresiones)."""
+    name = models.CharField(max_length=64, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Marca de agua de sincronización"
+        verbose_name_plural = "Marcas de agua de sincronización"
+
+    def __str__(self):
+        return f"{self.name} hasta {self.last_id}"
+
+
+class Job(models.Model):
+    """Trabajo en cola para el worker (``manage.py run_jobs``)."""
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    DEAD = "dead"
+    STATUS_CHOICES = [
+        (QUEUED, "En cola"),
+        (RUNNING, "En ejecución"),
+        (DONE, "Terminado"),
+        (DEAD, "Fallido (sin más reintentos)"),
+    ]
+
+    kind = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # No se toma antes de esta fecha (reintentos con backoff)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Lease del worker que lo ejecuta; se renueva mientras corre
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=128, blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Trabajo en cola"
+        verbose_name_plural = "Trabajos en cola"
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} - {self.kind} ({self.status})"
+
+
 class EmailMessage(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -219,6 +346,11 @@ class EmailMessage(models.Model):
     status = models.CharField(max_length=64, default="created")
     location = models.URLField(blank=True, null=True)
     meta = models.JSONField(default=dict, blank=True)
+    # Envío masivo y posición en su archivo; al reanudar se borran los
+    # posteriores al checkpoint igual que sus BulkSendRecipient
+    bulk = models.ForeignKey(
+        BulkSend, on_delete=models.SET_NULL, null=True, blank=True, related_name="messages")
+    bulk_position = models.PositiveIntegerField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.id} - {self.subject}"
@@ -0,0 +1,96 @@
+"""Codificación base64 de adjuntos, una sola vez por contenido.
+
+El base64 de cada archivo se guarda en memoria del proceso indexado por el
+SHA-256 de su contenido (LRU acotado por ``ATTACHMENT_CACHE_MAX_BYTES``), de
+modo que un mismo PDF adjunto a varios envíos, o reenviado en reintentos, se
+codifica una vez. El resultado es un :class:`Base64Content`: todos los payloads
+de un envío masivo comparten la misma cadena por referencia y
+``build_template_message`` no vuelve a validarla por destinatario.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import IO, Any
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+READ_CHUNK = 1024 * 1024
+
+_cache: OrderedDict[str, "Base64Content"] = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+
+class Base64Content(str):
+    """Cadena base64 ya validada (no se decodifica de nuevo al armar payloads)."""
+
+
+def _max_bytes() -> int:
+    cfg = getattr(settings, "DOPPLER_RELAY", {}) or {}
+    return int(cfg.get("ATTACHMENT_CACHE_MAX_BYTES", DEFAULT_CACHE_MAX_BYTES))
+
+
+def ensure_base64(content: Any) -> Base64Content:
+    """Normaliza el contenido de un adjunto a base64.
+
+    ``Base64Content`` se devuelve tal cual; ``bytes`` se codifica; una cadena se
+    valida una vez y, si no es base64, se codifica su texto UTF-8.
+    """
+    if isinstance(content, Base64Content):
+        return content
+    if isinstance(content, (bytes, bytearray)):
+        return Base64Content(base64.b64encode(content).decode("ascii"))
+    text = str(content)
+    try:
+        base64.b64decode(text)
+        return Base64Content(text)
+    except (binascii.Error, ValueError):
+        return Base64Content(base64.b64encode(text.encode()).decode("ascii"))
+
+
+def _remember(digest: str, encoded: Base64Content) -> None:
+    global _cache_bytes
+    limit = _max_bytes()
+    if len(encoded) > limit:
+        return
+    with _cache_lock:
+        if digest in _cache:
+            return
+        _cache[digest] = encoded
+        _cache_bytes += len(encoded)
+        while _cache_bytes > limit and _cache:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted)
+
+
+def encode_stream(stream: IO[bytes]) -> tuple[str, Base64Content]:
+    """``(sha256, base64)`` del contenido de ``stream``; codifica solo si no está en cache."""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(READ_CHUNK), b""):
+        digest.update(chunk)
+    key = digest.hexdigest()
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return key, cached
+    stream.seek(0)
+    encoded = Base64Content(base64.b64encode(stream.read()).decode("ascii"))
+    _remember(key, encoded)
+    logger.debug("Adjunto %s codificado (%d chars base64)", key[:12], len(encoded))
+    return key, encoded
+
+
+def clear_cache() -> None:
+    global _cache_bytes
+    with _cache_lock:
+        _cache.clear()
+        _cache_bytes = 0
@@ -0,0 +1,69 @@
+"""Escritura por lotes de filas generadas durante un envío.
+
+:class:`BufferedWriter` acumula instancias sin guardar y las inserta con
+``bulk_create`` cuando el buffer llega a ``batch_size`` o pasan
+``flush_seconds`` desde el último volcado, y siempre al cerrar. Así la latencia
+de la base de datos deja de frenar el ciclo de envío (un INSERT por lote en
+lugar de uno por destinatario).
+
+    with BufferedWriter(EmailMessage) as writer:
+        for outcome in ...:
+            writer.add(EmailMessage(...))
+"""
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any
+
+from django.conf import settings
+from django.db import models
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_SECONDS = 2.0
+
+
+def _config() -> dict[str, Any]:
+    cfg = getattr(settings, "DOPPLER_RELAY", {}) or {}
+    return cfg.get("PERSIST", {}) or {}
+
+
+class BufferedWriter:
+    def __init__(self, model: type[models.Model], *, batch_size: int | None = None,
+                 flush_seconds: float | None = None):
+        cfg = _config()
+        self.model = model
+        self.batch_size = max(1, int(batch_size if batch_size is not None
+                                     else cfg.get("BATCH_SIZE", DEFAULT_BATCH_SIZE)))
+        self.flush_seconds = float(flush_seconds if flush_seconds is not None
+                                   else cfg.get("FLUSH_SECONDS", DEFAULT_FLUSH_SECONDS))
+        self._buffer: list[models.Model] = []
+        self._last_flush = time.monotonic()
+        self.written = 0
+
+    def add(self, obj: models.Model) -> None:
+        self._buffer.append(obj)
+        self.maybe_flush()
+
+    def maybe_flush(self) -> None:
+        """Vuelca si se alcanzó el umbral de tamaño o de tiempo."""
+        if len(self._buffer) >= self.batch_size or (
+                self._buffer and time.monotonic() - self._last_flush >= self.flush_seconds):
+            self.flush()
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        pending, self._buffer = self._buffer, []
+        self.model.objects.bulk_create(pending, batch_size=self.batch_size)
+        self.written += len(pending)
+        logger.debug("Insertadas %d filas de %s", len(pending), self.model.__name__)
+
+    def __enter__(self) -> "BufferedWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.flush()
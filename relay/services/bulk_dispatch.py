@@ -0,0 +1,227 @@
+"""Despacho por lotes de envíos masivos con plantilla.
+
+Agrupa destinatarios en lotes configurables (``DOPPLER_RELAY['BULK_BATCH_SIZE']``)
+por cada llamada a ``/templates/{id}/message`` y reparte el resultado de la API
+por destinatario. Si un lote es rechazado por un problema atribuible a sus
+destinatarios (validación 400/422), se divide a la mitad hasta aislar a los
+destinatarios problemáticos, sin perder el resto del lote.
+
+Los lotes pueden despacharse en paralelo (``DOPPLER_RELAY['BULK_CONCURRENCY']``)
+con un pool de hilos acotado; los resultados se entregan en el orden de entrada.
+"""
+from __future__ import annotations
+
+import logging
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Iterable, Iterator
+
+from django.conf import settings
+
+from .doppler_relay import DopplerRelayClient, DopplerRelayError
+from .retry import RetryBudget, idempotency_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1
+DEFAULT_CONCURRENCY = 1
+# Errores HTTP que indican un problema con el contenido del lote (no con la API)
+RECIPIENT_ERROR_STATUSES = {400, 422}
+
+
+def bulk_batch_size(value: int | None = None) -> int:
+    """Tamaño de lote efectivo: argumento explícito > settings > 1 (un destinatario por llamada)."""
+    cfg = getattr(settings, "DOPPLER_RELAY", {}) or {}
+    raw = value if value is not None else cfg.get("BULK_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+    try:
+        size = int(raw)
+    except (TypeError, ValueError):
+        size = DEFAULT_BATCH_SIZE
+    return max(1, size)
+
+
+def bulk_concurrency(account_id: Any = None, value: int | None = None) -> int:
+    """Hilos de envío simultáneos para una cuenta.
+
+    ``BULK_CONCURRENCY`` admite un entero global o un dict por cuenta, p. ej.
+    ``{"9518": 8, "default": 2}``.
+    """
+    cfg = getattr(settings, "DOPPLER_RELAY", {}) or {}
+    raw: Any = value if value is not None else cfg.get("BULK_CONCURRENCY", DEFAULT_CONCURRENCY)
+    if isinstance(raw, dict):
+        raw = raw.get(str(account_id), raw.get("default", DEFAULT_CONCURRENCY))
+    try:
+        workers = int(raw)
+    except (TypeError, ValueError):
+        workers = DEFAULT_CONCURRENCY
+    return max(1, workers)
+
+
+def build_recipient_payload(recipient: dict[str, Any], *, is_valid_email) -> dict[str, Any]:
+    """Normaliza un destinatario al formato que espera ``send_template_message``.
+
+    Lanza ``ValueError`` si el email no es válido o si una etapa previa marcó
+    el destinatario como inválido (clave ``error``).
+    """
+    if recipient.get("error"):
+        raise ValueError(recipient["error"])
+    email = str(recipient["email"]).strip()
+    if not email or not is_valid_email(email):
+        raise ValueError(f"Email inválido: {email}")
+
+    variables: dict[str, Any] = {}
+    if "substitution_data" in recipient:
+        variables = recipient["substitution_data"]
+    elif "variables" in recipient:
+        variables = {
+            str(k).strip(): str(v).strip()
+            for k, v in recipient.get("variables", {}).items()
+            if v is not None  # Ignorar valores None
+        }
+
+    return {
+        "email": email,
+        "name": recipient.get("name", ""),
+        "variables": variables,
+        "type": "to",
+    }
+
+
+def _is_recipient_error(exc: Exception) -> bool:
+    if isinstance(exc, DopplerRelayError):
+        return exc.status in RECIPIENT_ERROR_STATUSES
+    return isinstance(exc, ValueError)
+
+
+def _error_outcome(payload: dict[str, Any], exc: Exception) -> dict[str, Any]:
+    outcome = {
+        "email": payload["email"],
+        "status": "error",
+        "error": str(exc),
+        "variables": payload.get("variables", {}),
+    }
+    if isinstance(exc, DopplerRelayError):
+        outcome["details"] = exc.payload
+        outcome["error_code"] = str(exc.status or "api")
+    else:
+        outcome["error_code"] = "invalid"
+    return outcome
+
+
+def _map_outcomes(payloads: list[dict[str, Any]], sent: dict[str, Any]) -> list[dict[str, Any]]:
+    """Asocia la respuesta de la API a cada destinatario del lote (en el mismo orden)."""
+    by_email: dict[str, list[dict[str, Any]]] = {}
+    for item in sent.get("resultados") or []:
+        key = str(item.get("email", "")).strip().lower()
+        by_email.setdefault(key, []).append(item)
+
+    outcomes = []
+    for payload in payloads:
+        matches = by_email.get(payload["email"].lower())
+        if not matches:
+            # send_template_message descarta destinatarios sin variables
+            outcomes.append(_error_outcome(
+                payload, ValueError("No hay destinatarios con variables para procesar")))
+            continue
+        item = matches.pop(0)
+        outcomes.append({
+            "email": payload["email"],
+            "status": "ok",
+            "message_id": str(item.get("message_id") or ""),
+            "variables": payload.get("variables", {}),
+        })
+    return outcomes
+
+
+def dispatch_chunk(
+    client: DopplerRelayClient,
+    account_id: str,
+    template_id: str,
+    base_model: dict[str, Any],
+    payloads: list[dict[str, Any]],
+    *,
+    retry_budget: RetryBudget | None = None,
+    key_prefix: str | None = None,
+) -> list[dict[str, Any]]:
+    """Envía un lote de destinatarios en una sola llamada y devuelve un resultado por destinatario.
+
+    Ante un error atribuible a los destinatarios, divide el lote en mitades y
+    reintenta cada una; errores de la API (cuota, autenticación, 5xx) marcan el
+    lote completo como fallido sin multiplicar llamadas.
+
+    Con ``key_prefix`` la ``Idempotency-Key`` del lote se deriva de sus
+    destinatarios, de modo que reprocesar el mismo envío reutiliza la clave.
+    """
+    model = dict(base_model)
+    model["recipients"] = payloads
+    key = None
+    if key_prefix:
+        key = idempotency_key(key_prefix, template_id, emails=(p["email"] for p in payloads))
+    try:
+        sent = client.send_template_message(
+            account_id=account_id,
+            template_id=str(template_id),
+            recipients_model=model,
+            idempotency_key=key,
+            retry_budget=retry_budget,
+        )
+    except Exception as exc:
+        if len(payloads) > 1 and _is_recipient_error(exc):
+            mid = len(payloads) // 2
+            logger.warning(
+                "Lote rechazado, dividiendo en lotes menores",
+                extra={"template_id": template_id, "size": len(payloads), "error": str(exc)},
+            )
+            options = {"retry_budget": retry_budget, "key_prefix": key_prefix}
+            return (
+                dispatch_chunk(client, account_id, template_id, base_model, payloads[:mid], **options)
+                + dispatch_chunk(client, account_id, template_id, base_model, payloads[mid:], **options)
+            )
+        return [_error_outcome(payload, exc) for payload in payloads]
+    return _map_outcomes(payloads, sent)
+
+
+def dispatch_chunks(
+    client: DopplerRelayClient,
+    account_id: str,
+    template_id: str,
+    base_model: dict[str, Any],
+    chunks: Iterable[list[dict[str, Any]]],
+    *,
+    concurrency: int = 1,
+    retry_budget: RetryBudget | None = None,
+    key_prefix: str | None = None,
+) -> Iterator[list[dict[str, Any]]]:
+    """Despacha lotes con hasta ``concurrency`` llamadas en vuelo y produce sus resultados en orden.
+
+    Los lotes se consumen de forma perezosa (como máximo ``2 * concurrency``
+    pendientes), de modo que el iterable de entrada puede ser un generador.
+    Solo el envío HTTP ocurre en los hilos; el consumidor procesa los
+    resultados en el hilo que itera. Todos los lotes comparten un
+    ``RetryBudget`` (por defecto ``RETRY['BULK_BUDGET_SECONDS']``).
+
+    Un lote vacío no llama a la API: produce ``[]`` en su turno, lo que le
+    devuelve el control al consumidor (p. ej. tras una racha de filas inválidas).
+    """
+    options = {
+        "retry_budget": retry_budget if retry_budget is not None else RetryBudget.for_bulk(),
+        "key_prefix": key_prefix,
+    }
+    if concurrency <= 1:
+        for chunk in chunks:
+            yield dispatch_chunk(client, account_id, template_id, base_model, chunk, **options) if chunk else []
+        return
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="relay-bulk") as executor:
+        in_flight: deque = deque()
+        for chunk in chunks:
+            if chunk:
+                future = executor.submit(dispatch_chunk, client, account_id, template_id, base_model, chunk, **options)
+            else:
+                future = Future()
+                future.set_result([])
+            in_flight.append(future)
+            if len(in_flight) >= concurrency * 2:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
@@ -2,92 +2,198 @@ from __future__ import annotations
 
 import csv
 import io
+import itertools
 import json
-from typing import Any
+from datetime import datetime, timedelta
+from typing import Any, Iterable, Iterator
 
+from dateutil.parser import isoparse
 from django.utils import timezone
 
-from relay.models import BulkSend, UserEmailConfig
-from relay.services.doppler_relay import DopplerRelayClient
-from relay.views import process_bulk_template_send
+from relay.models import BulkSend, BulkSendRecipient, EmailMessage, UserEmailConfig
+from relay.services import suppression
+from relay.services.buffered_writer import BufferedWriter
+from relay.services.template_cache import get_template_metadata
+from relay.views import iter_bulk_template_send
 from django.conf import settings
 
 
-def _detect_reader(content: str) -> tuple[csv.DictReader, list[str], str | None]:
-    def parse_with(delim: str):
-        rdr = csv.DictReader(io.StringIO(content), delimiter=delim)
-        hdrs = [h.strip().lower() for h in (rdr.fieldnames or [])]
-        return rdr, hdrs
+EMAIL_COLUMNS = ["email", "\ufeffemail", "correo", "e-mail", "mail", "email_address", "correo_electronico"]
+# Errores de destinatario que se guardan como muestra en el resumen del envío
+MAX_ERROR_SAMPLES = 100
+DEFAULT_CHECKPOINT_EVERY = 100
+# Segundos sin progreso para considerar interrumpido un envío en "processing"
+# (igual al lease por defecto de la cola de trabajos)
+DEFAULT_RESUME_LEASE_SECONDS = 120
 
+
+def checkpoint_every() -> int:
+    cfg = getattr(settings, "DOPPLER_RELAY", {}) or {}
+    return max(1, int(cfg.get("BULK_CHECKPOINT_EVERY", DEFAULT_CHECKPOINT_EVERY)))
+
+
+def last_progress(bulk: BulkSend) -> datetime:
+    """Última señal de vida del envío: inicio, heartbeat o checkpoint."""
+    marks = [bulk.processing_started_at, bulk.heartbeat_at]
+    updated = (bulk.checkpoint or {}).get("updated_at")
+    if updated:
+        try:
+            marks.append(isoparse(updated))
+        except (TypeError, ValueError):
+            pass
+    marks = [m for m in marks if m is not None]
+    return max(marks) if marks else timezone.now() - timedelta(days=3650)
+
+
+def can_resume(bulk: BulkSend, *, lease_seconds: int = DEFAULT_RESUME_LEASE_SECONDS,
+               now: datetime | None = None) -> bool:
+    """Hay progreso guardado de un envío que no terminó y nadie lo está procesando.
+
+    Un envío en ``processing`` solo se considera interrumpido si no avanzó en
+    ``lease_seconds``; si sigue vivo, reanudarlo lo enviaría dos veces.
+    """
+    if not (bulk.checkpoint or {}).get("offset"):
+        return False
+    if bulk.status == "error":
+        return True
+    now = now or timezone.now()
+    return bulk.status == "processing" and last_progress(bulk) <= now - timedelta(seconds=lease_seconds)
+
+
+def _detect_delimiter(header_line: str) -> str:
+    """Delimitador del CSV a partir de la línea de encabezados."""
     for d in [";", ","]:
-        r, h = parse_with(d)
-        if any(v in h for v in ["email", "correo", "e-mail", "mail", "email_address", "correo_electronico", "\ufeffemail"]):
-            return r, h, d
+        headers = [h.strip().lower() for h in next(csv.reader([header_line], delimiter=d), [])]
+        if any(v in headers for v in EMAIL_COLUMNS):
+            return d
     # Fallback sniffer
     try:
-        sample = content[:2048]
-        dialect = csv.Sniffer().sniff(sample, delimiters=",;")
-        r, h = parse_with(dialect.delimiter)
-        return r, h, dialect.delimiter
+        return csv.Sniffer().sniff(header_line, delimiters=",;").delimiter
     except Exception:
-        r, h = parse_with(",")
-        return r, h, ","
+        return ","
+
+
+def read_csv_rows(stream) -> tuple[list[str], Iterator[dict[str, Any]]]:
+    """Etapa 1: decodifica el archivo en streaming.
+
+    Devuelve los encabezados normalizados y un generador de filas con claves
+    normalizadas; solo se mantiene en memoria la fila en curso.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    header_line = text.readline()
+    delimiter = _detect_delimiter(header_line)
+    reader = csv.DictReader(itertools.chain([header_line], text), delimiter=delimiter)
+    headers = [h.strip().lower() for h in (reader.fieldnames or [])]
+
+    def rows() -> Iterator[dict[str, Any]]:
+        for row in reader:
+            yield {str(k).strip().lower(): (v.strip() if isinstance(v, str) else v) for k, v in row.items()}
+
+    return headers, rows()
+
 
+def _email_column(headers: list[str]) -> str:
+    for v in EMAIL_COLUMNS:
+        if v in headers:
+            return v
+    raise ValueError(f"El archivo CSV debe tener una columna 'email'. Columnas: {headers}")
 
-def process_bulk_id(bulk_id: int) -> None:
+
+def _variables_mapping(bulk: BulkSend) -> dict[str, str]:
+    # Mapeo de variables soportando dict o string JSON
+    vm_raw = getattr(bulk, "variables", None)
+    if isinstance(vm_raw, str):
+        vm_raw = vm_raw.strip()
+        variables_mapping = json.loads(vm_raw) if vm_raw else {}
+    elif isinstance(vm_raw, dict):
+        variables_mapping = vm_raw
+    else:
+        variables_mapping = {}
+    if not isinstance(variables_mapping, dict):
+        return {}
+    return {k: v for k, v in variables_mapping.items() if isinstance(k, str) and isinstance(v, str) and not k.startswith("__")}
+
+
+def iter_recipients(rows: Iterable[dict[str, Any]], *, email_col: str, variables_mapping: dict[str, str],
+                    required_vars: set[str]) -> Iterator[dict[str, Any]]:
+    """Etapas 2 y 3: fila -> destinatario y validación de variables requeridas.
+
+    Las filas inválidas no abortan el envío: salen marcadas con ``error`` y se
+    reportan como fallidas para ese destinatario.
+    """
+    for clean in rows:
+        email_value = clean.get(email_col) or clean.get("email") or clean.get("\ufeffemail")
+        if not email_value:
+            continue
+        if variables_mapping:
+            variables = {tpl_var: clean.get(csv_col.lower()) for tpl_var, csv_col in variables_mapping.items()}
+        else:
+            variables = {k: v for k, v in clean.items() if k not in (email_col, "email", "\ufeffemail") and v}
+        recipient = {"email": email_value, "name": clean.get("nombres", "") or clean.get("name", ""), "variables": variables}
+        missing = required_vars - set(variables.keys()) if required_vars else set()
+        if missing:
+            recipient["error"] = f"Faltan variables requeridas para {email_value}: {', '.join(sorted(missing))}"
+        yield recipient
+
+
+def recipient_row(bulk: BulkSend, position: int, outcome: dict[str, Any]) -> BulkSendRecipient:
+    """Fila compacta del resultado de un destinatario (sin payloads ni headers)."""
+    error = outcome.get("error")
+    return BulkSendRecipient(
+        bulk=bulk,
+        position=position,
+        email=str(outcome.get("email") or "")[:254],
+        status=outcome["status"],
+        message_id=outcome.get("message_id") or None,
+        error_code=outcome.get("error_code") if error else outcome.get("reason"),
+        error=str(error)[:255] if error else None,
+    )
+
+
+def process_bulk_id(bulk_id: int, *, resume: bool = False) -> None:
+    """Procesa un BulkSend completo guardando checkpoints de progreso.
+
+    Con ``resume=True`` retoma desde ``bulk.checkpoint``: se saltan los
+    destinatarios ya procesados y los contadores continúan desde el checkpoint.
+    El resultado de cada destinatario va a ``BulkSendRecipient`` (insertado por
+    lotes); ``result`` solo guarda el resumen.
+    """
     bulk = BulkSend.objects.get(id=bulk_id)
+    preflight = bulk.preflight or {}
+    if preflight.get("status") == "failed":
+        # Archivo ilegible, sin columnas de la plantilla o sin destinatarios válidos
+        missing = ", ".join(preflight.get("missing_columns") or [])
+        reason = preflight.get("error") or (f"columnas faltantes: {missing}" if missing else "sin destinatarios válidos")
+        bulk.status = "error"
+        bulk.log = ((bulk.log or "") + f"\n[BG] Preflight fallido, no se envía ({reason})").strip()
+        bulk.save(update_fields=["status", "log"])
+        return
+    checkpoint = dict(bulk.checkpoint or {}) if resume else {}
+    offset = int(checkpoint.get("offset") or 0)
+    bulk.status = "processing"
+    bulk.checkpoint = checkpoint
+    if offset:
+        bulk.log = ((bulk.log or "") + f"\n[BG] Reanudando desde el destinatario {offset}").strip()
+    bulk.save(update_fields=["status", "checkpoint", "log"])
 
     # Obtener variables requeridas por la plantilla
     try:
-        client = DopplerRelayClient()
         account_id = settings.DOPPLER_RELAY.get("ACCOUNT_ID", 0)
-        template_info: dict[str, Any] = client.get_template_fields(account_id, bulk.template_id)
+        template_info: dict[str, Any] = get_template_metadata(account_id, bulk.template_id)
         required_vars = set(template_info.get("variables", []) or [])
     except Exception:
         required_vars = set()
 
-    recipients: list[dict] = []
+    stream = None
     try:
-        with bulk.recipients_file.open("rb") as f:
-            content = f.read().decode("utf-8-sig")
-            reader, headers, _delim = _detect_reader(content)
-
-            # Columna email
-            email_col = None
-            for v in ["email", "\ufeffemail", "correo", "e-mail", "mail", "email_address", "correo_electronico"]:
-                if v in headers:
-                    email_col = v
-                    break
-            if not email_col:
-                raise ValueError(f"El archivo CSV debe tener una columna 'email'. Columnas: {headers}")
-
-            # Mapeo de variables soportando dict o string JSON
-            vm_raw = getattr(bulk, "variables", None)
-            if isinstance(vm_raw, str):
-                vm_raw = vm_raw.strip()
-                variables_mapping = json.loads(vm_raw) if vm_raw else {}
-            elif isinstance(vm_raw, dict):
-                variables_mapping = vm_raw
-            else:
-                variables_mapping = {}
-            if isinstance(variables_mapping, dict):
-                variables_mapping = {k: v for k, v in variables_mapping.items() if isinstance(k, str) and isinstance(v, str) and not k.startswith("__")}
-
-            for row in reader:
-                clean = {str(k).strip().lower(): (v.strip() if isinstance(v, str) else v) for k, v in row.items()}
-                email_value = clean.get(email_col) or clean.get("email") or clean.get("\ufeffemail")
-                if not email_value:
-                    continue
-                if variables_mapping:
-                    variables = {tpl_var: clean.get(csv_col.lower()) for tpl_var, csv_col in variables_mapping.items()}
-                else:
-                    variables = {k: v for k, v in clean.items() if k not in (email_col, "email", "\ufeffemail") and v}
-                missing = required_vars - set(variables.keys()) if required_vars else set()
-                if missing:
-                    raise ValueError(f"Faltan variables requeridas para {email_value}: {', '.join(sorted(missing))}")
-                recipients.append({"email": email_value, "name": clean.get("nombres", "") or clean.get("name", ""), "variables": variables})
+        stream = bulk.recipients_file.open("rb")
+        headers, rows = read_csv_rows(stream)
+        email_col = _email_column(headers)
+        variables_mapping = _variables_mapping(bulk)
     except Exception as e:
-        bulk.result = json.dumps({"error": str(e), "recipients": recipients, "template_id": bulk.template_id})
+        if stream is not None:
+            stream.close()
+        bulk.result = json.dumps({"error": str(e), "template_id": bulk.template_id})
         bulk.log = ((bulk.log or "") + f"\n[BG] Error leyendo archivo: {e}").strip()
         bulk.status = "error"
         bulk.save(update_fields=["result", "log", "status"])
@@ -111,8 +217,30 @@ def process_bulk_id(bulk_id: int) -> None:
     except Exception:
         pass
 
+    summary: dict[str, Any] = {"template_id": bulk.template_id, "total": offset,
+                               "ok": int(checkpoint.get("ok") or 0), "error": int(checkpoint.get("error") or 0),
+                               "suppressed": int(checkpoint.get("suppressed") or 0),
+                               "errors": list(checkpoint.get("errors") or [])}
+
+    # Filas de un intento anterior posteriores al checkpoint se vuelven a generar
+    BulkSendRecipient.objects.filter(bulk=bulk, position__gte=offset).delete()
+    EmailMessage.objects.filter(bulk=bulk, bulk_position__gte=offset).delete()
+    rows_writer = BufferedWriter(BulkSendRecipient)
+
+    def _save_checkpoint() -> None:
+        # offset = destinatarios ya resueltos (en orden de archivo)
+        rows_writer.flush()
+        bulk.checkpoint = {"offset": summary["total"], "ok": summary["ok"], "error": summary["error"],
+                           "suppressed": summary["suppressed"], "errors": list(summary["errors"]), "updated_at": timezone.now().isoformat()}
+        bulk.save(update_fields=["checkpoint"])
+
     try:
-        response = process_bulk_template_send(
+        recipients = iter_recipients(
+            rows, email_col=email_col, variables_mapping=variables_mapping, required_vars=required_vars)
+        if offset:
+            recipients = itertools.islice(recipients, offset, None)
+        # Etapa 4: despacho por lotes; el envío empieza con el primer lote leído
+        for outcome in iter_bulk_template_send(
             template_id=bulk.template_id,
             recipients=recipients,
             subject=subject,
@@ -120,23 +248,39 @@ def process_bulk_id(bulk_id: int) -> None:
             from_email=from_email,
             from_name=from_name,
             user=None,
-        )
-        bulk.result = (response.content.decode("utf-8") if hasattr(response, "content") else json.dumps(response))
+            idempotency_prefix=f"bulk-{bulk.pk}",
+            checkpoint_every=checkpoint_every(),
+            on_checkpoint=_save_checkpoint,
+            suppressed=suppression.load_index(),
+            bulk=bulk,
+            start_position=offset,
+        ):
+            rows_writer.add(recipient_row(bulk, summary["total"], outcome))
+            summary["total"] += 1
+            summary[outcome["status"]] += 1
+            if outcome["status"] == "error" and len(summary["errors"]) < MAX_ERROR_SAMPLES:
+                summary["errors"].append({"email": outcome["email"], "error": outcome["error"]})
+        summary["errors_truncated"] = summary["error"] > len(summary["errors"])
+        _save_checkpoint()
+        bulk.result = json.dumps(summary)
         bulk.status = "done"
         bulk.log = ((bulk.log or "") + f"\n[BG] Ejecutado a {timezone.now().isoformat()}").strip()
     except Exception as e:
         import traceback
         api_error = getattr(e, "payload", None)
+        # Solo el resumen parcial: nunca la lista de destinatarios ni el contenido de adjuntos
         bulk.result = json.dumps({
-            "error": str(e),
+            **summary,
+            "error_message": str(e),
             "traceback": traceback.format_exc(),
-            "recipients": recipients,
             "subject": subject,
-            "attachments": adj_list,
-            "template_id": bulk.template_id,
+            "attachments": [att.get("filename") for att in adj_list],
             "api_error": api_error,
-        })
+        }, default=str)
         bulk.status = "error"
         bulk.log = ((bulk.log or "") + f"\n[BG] Error en envío: {e}").strip()
-    bulk.save(update_fields=["result", "status", "log", "processing_started_at"])
+    finally:
+        stream.close()
+        rows_writer.flush()
+    bulk.save(update_fields=["result", "status", "log", "processing_started_at", "checkpoint"])
 
@@ -0,0 +1,195 @@
+"""Scheduler de envíos programados en modo daemon.
+
+Varios workers (hilos de este proceso o varios procesos/hosts) toman envíos
+vencidos con ``SELECT ... FOR UPDATE SKIP LOCKED``; el que gana el lock lo marca
+``processing`` dentro de la misma transacción, así ningún otro worker lo vuelve
+a tomar. Mientras corre, un hilo renueva ``heartbeat_at`` cada
+``lease_seconds / 3``; si el proceso muere, al vencer el lease otro daemon lo
+retoma desde su checkpoint.
+
+Entre rondas el daemon duerme hasta el próximo ``scheduled_at`` (con tope
+``max_sleep``), por lo que varios envíos programados a la misma hora arrancan
+en paralelo segundos después de vencer.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any
+
+from django.db import close_old_connections, connection, models, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from relay.models import BulkSend
+from relay.services.bulk_processing import last_progress, process_bulk_id
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_SECONDS = 60
+DEFAULT_MAX_SLEEP = 60.0
+
+
+def claim_due_bulk(now: datetime | None = None) -> int | None:
+    """Toma el envío programado vencido más antiguo; ``None`` si no hay."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        bulk = (
+            BulkSend.objects.select_for_update(skip_locked=True)
+            .filter(status="pending", scheduled_at__isnull=False, scheduled_at__lte=now)
+            .order_by("scheduled_at")
+            .first()
+        )
+        if bulk is None:
+            return None
+        bulk.status = "processing"
+        bulk.processing_started_at = bulk.heartbeat_at = now
+        bulk.log = ((bulk.log or "") + "\n[Scheduler] Tomado por daemon").strip()
+        bulk.save(update_fields=["status", "processing_started_at", "heartbeat_at", "log"])
+        return bulk.id
+
+
+def claim_stale_bulk(lease_seconds: int, now: datetime | None = None) -> int | None:
+    """Toma un envío en ``processing`` cuyo lease venció (worker caído).
+
+    Sin ``heartbeat_at`` (tomado por un camino que no lo registró) el lease se
+    mide desde ``processing_started_at``.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=lease_seconds)
+    with transaction.atomic():
+        candidates = (
+            BulkSend.objects.select_for_update(skip_locked=True)
+            .annotate(lease_at=Coalesce("heartbeat_at", "processing_started_at"))
+            .filter(status="processing", lease_at__lt=cutoff)
+            .order_by("lease_at")
+        )
+        for bulk in candidates[:10]:
+            if last_progress(bulk) > cutoff:
+                continue
+            bulk.processing_started_at = bulk.heartbeat_at = now
+            bulk.log = ((bulk.log or "") + "\n[Scheduler] Lease vencido: se reanuda").strip()
+            bulk.save(update_fields=["processing_started_at", "heartbeat_at", "log"])
+            return bulk.id
+    return None
+
+
+def claim_bulk(bulk_id: int, *, resume: bool, lease_seconds: int, source: str,
+               now: datetime | None = None) -> bool:
+    """Toma un envío concreto para procesarlo; ``False`` si otro worker lo tiene o ya terminó.
+
+    Sin ``resume`` solo se toma un envío ``pending``. Con ``resume``, uno en
+    ``error`` o en ``processing`` sin progreso desde hace ``lease_seconds``.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=lease_seconds)
+    with transaction.atomic():
+        bulk = BulkSend.objects.select_for_update(skip_locked=True).filter(pk=bulk_id).first()
+        if bulk is None:
+            return False
+        if resume:
+            if bulk.status not in ("error", "processing"):
+                return False
+            if bulk.status == "processing" and last_progress(bulk) > cutoff:
+                return False
+        elif bulk.status != "pending":
+            return False
+        bulk.status = "processing"
+        bulk.processing_started_at = bulk.heartbeat_at = now
+        bulk.log = ((bulk.log or "") + f"\n[{source}] Tomado para procesar").strip()
+        bulk.save(update_fields=["status", "processing_started_at", "heartbeat_at", "log"])
+        return True
+
+
+def next_due_at() -> datetime | None:
+    return (
+        BulkSend.objects.filter(status="pending", scheduled_at__isnull=False)
+        .order_by("scheduled_at")
+        .values_list("scheduled_at", flat=True)
+        .first()
+    )
+
+
+class Heartbeat:
+    """Renueva en un hilo un campo de fecha (lease) de una fila mientras está activo."""
+
+    def __init__(self, model: type[models.Model], pk: Any, interval: float, *, field: str = "heartbeat_at"):
+        self.model = model
+        self.pk = pk
+        self.field = field
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"heartbeat-{model._meta.model_name}-{pk}", daemon=True)
+
+    def _run(self) -> None:
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    self.model.objects.filter(pk=self.pk).update(**{self.field: timezone.now()})
+                except Exception as exc:
+                    logger.warning("No se pudo renovar el lease de %s %s: %s",
+                                   self.model.__name__, self.pk, exc)
+        finally:
+            connection.close()
+
+    def __enter__(self) -> "Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join(timeout=self.interval)
+
+
+def run_claimed(bulk_id: int, *, resume: bool, lease_seconds: int) -> None:
+    close_old_connections()
+    try:
+        with Heartbeat(BulkSend, bulk_id, max(1.0, lease_seconds / 3)):
+            process_bulk_id(bulk_id, resume=resume)
+    except Exception as exc:
+        logger.exception("Error procesando BulkSend %s", bulk_id)
+        bulk = BulkSend.objects.get(pk=bulk_id)
+        bulk.status = "error"
+        bulk.log = (bulk.log or "") + f"\n[Scheduler] Error: {exc}"
+        bulk.save(update_fields=["status", "log"])
+    finally:
+        connection.close()
+
+
+def run_daemon(*, workers: int, lease_seconds: int = DEFAULT_LEASE_SECONDS,
+               max_sleep: float = DEFAULT_MAX_SLEEP, stop: threading.Event | None = None) -> None:
+    """Bucle principal: reparte envíos vencidos entre ``workers`` hilos hasta ``stop``."""
+    stop = stop or threading.Event()
+    running: set[Future] = set()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-worker") as pool:
+        while not stop.is_set():
+            running = {f for f in running if not f.done()}
+            claimed = False
+            while len(running) < workers and not stop.is_set():
+                close_old_connections()
+                resume = False
+                bulk_id = claim_due_bulk()
+                if bulk_id is None:
+                    bulk_id, resume = claim_stale_bulk(lease_seconds), True
+                if bulk_id is None:
+                    break
+                logger.info("BulkSend %s tomado (reanudación=%s)", bulk_id, resume)
+                running.add(pool.submit(run_claimed, bulk_id, resume=resume, lease_seconds=lease_seconds))
+                claimed = True
+            if claimed:
+                continue
+            stop.wait(_sleep_seconds(max_sleep, busy=len(running) >= workers))
+        logger.info("Daemon detenido; esperando %d envío(s) en curso", len(running))
+
+
+def _sleep_seconds(max_sleep: float, *, busy: bool) -> float:
+    # Con todos los workers ocupados se revisa seguido si alguno se liberó
+    if busy:
+        return 1.0
+    due = next_due_at()
+    if due is None:
+        return max_sleep
+    return min(max(0.5, (due - timezone.now()).total_seconds()), max_sleep)
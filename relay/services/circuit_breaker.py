@@ -0,0 +1,198 @@
+"""Circuit breaker por (cuenta, familia de endpoint) para las llamadas a Doppler.
+
+Estados:
+
+- ``closed``: las llamadas pasan; se cuentan fallos (red, 5xx) en una ventana.
+- ``open``: al alcanzar ``FAILURE_THRESHOLD`` fallos en ``WINDOW`` segundos se
+  rechazan las llamadas sin tocar la red durante ``RESET_TIMEOUT`` segundos.
+- ``half_open``: vencido el bloqueo se deja pasar un número limitado de sondas;
+  un éxito cierra el circuito y un fallo lo vuelve a abrir. Una sonda que no
+  se cierra (``record_*``/``release``) en ``RESET_TIMEOUT`` se da por perdida.
+
+El estado es por proceso (cada worker detecta la degradación por su cuenta).
+``snapshot()`` expone las métricas de todos los circuitos.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+from collections import deque
+from typing import Any
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_WINDOW = 60.0
+DEFAULT_RESET_TIMEOUT = 30.0
+DEFAULT_HALF_OPEN_CALLS = 1
+
+FAMILIES = ("messages", "templates", "deliveries", "events", "reportrequest")
+_FAMILY_RE = re.compile(r"/accounts/[^/?#]+/([A-Za-z]+)|/reports/(reportrequest)")
+# Envío con plantilla: es un envío de mensajes, no CRUD de plantillas
+_TEMPLATE_SEND_RE = re.compile(r"/accounts/[^/?#]+/templates/[^/?#]+/message(?:[/?#]|$)")
+
+
+def endpoint_family(path: str) -> str:
+    """Familia de endpoint de un path/URL de la API (``other`` si no es conocida)."""
+    if _TEMPLATE_SEND_RE.search(path or ""):
+        return "messages"
+    match = _FAMILY_RE.search(path or "")
+    if not match:
+        return "other"
+    family = (match.group(1) or match.group(2)).lower()
+    return family if family in FAMILIES else "other"
+
+
+def _cfg() -> dict[str, Any]:
+    return (getattr(settings, "DOPPLER_RELAY", {}) or {}).get("CIRCUIT_BREAKER") or {}
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, *, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 window: float = DEFAULT_WINDOW, reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+                 half_open_calls: int = DEFAULT_HALF_OPEN_CALLS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = max(half_open_calls, 1)
+        self.state = CLOSED
+        self._failures: deque = deque()
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_at = 0.0
+        self._lock = threading.Lock()
+        self.metrics = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0
+
+    def retry_in(self) -> float:
+        """Segundos hasta la próxima sonda (0 si el circuito no está abierto)."""
+        if self.state != OPEN:
+            return 0.0
+        return max(self._opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        """Indica si la llamada puede salir; cada ``True`` debe cerrarse con ``record_*`` o ``release``."""
+        if not self.enabled:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now - self._opened_at < self.reset_timeout:
+                    self.metrics["rejected"] += 1
+                    return False
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_calls and now - self._probe_at >= self.reset_timeout:
+                    # Sondas que nunca informaron su resultado: no bloquean el circuito para siempre
+                    logger.warning("Circuito %s: sondas sin resultado, se liberan", self.name)
+                    self._probes = 0
+                if self._probes >= self.half_open_calls:
+                    self.metrics["rejected"] += 1
+                    return False
+                self._probes += 1
+                self._probe_at = now
+            return True
+
+    def release(self) -> None:
+        """Devuelve el permiso de ``allow`` sin resultado (la llamada falló antes de llegar a Doppler)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record_success(self) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.metrics["successes"] += 1
+            if self.state == HALF_OPEN:
+                self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.metrics["failures"] += 1
+            if self.state == HALF_OPEN:
+                self._open(now)
+                return
+            self._failures.append(now)
+            while self._failures and now - self._failures[0] > self.window:
+                self._failures.popleft()
+            if self.state == CLOSED and len(self._failures) >= self.failure_threshold:
+                self._open(now)
+
+    def _open(self, now: float) -> None:
+        self._opened_at = now
+        self.metrics["opened"] += 1
+        self._transition(OPEN)
+        logger.error(
+            "Circuito abierto para %s", self.name,
+            extra={"circuit": self.name, "reset_timeout": self.reset_timeout},
+        )
+
+    def _transition(self, state: str) -> None:
+        if state != OPEN:
+            self._failures.clear()
+        self._probes = 0
+        if state != self.state:
+            logger.info("Circuito %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "recent_failures": len(self._failures),
+            "retry_in": round(self.retry_in(), 2),
+            **self.metrics,
+        }
+
+
+_BREAKERS: dict[tuple[str, str], CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def get_breaker(account_id: Any, family: str) -> CircuitBreaker:
+    key = (str(account_id), family)
+    breaker = _BREAKERS.get(key)
+    if breaker is None:
+        with _BREAKERS_LOCK:
+            breaker = _BREAKERS.get(key)
+            if breaker is None:
+                cfg = _cfg()
+                breaker = CircuitBreaker(
+                    f"{key[0]}:{family}",
+                    failure_threshold=int(cfg.get("FAILURE_THRESHOLD", DEFAULT_FAILURE_THRESHOLD)),
+                    window=float(cfg.get("WINDOW", DEFAULT_WINDOW)),
+                    reset_timeout=float(cfg.get("RESET_TIMEOUT", DEFAULT_RESET_TIMEOUT)),
+                    half_open_calls=int(cfg.get("HALF_OPEN_CALLS", DEFAULT_HALF_OPEN_CALLS)),
+                )
+                _BREAKERS[key] = breaker
+    return breaker
+
+
+def snapshot() -> list[dict[str, Any]]:
+    """Métricas de todos los circuitos conocidos en este proceso."""
+    with _BREAKERS_LOCK:
+        breakers = list(_BREAKERS.values())
+    return [breaker.snapshot() for breaker in breakers]
+
+
+def reset() -> None:
+    with _BREAKERS_LOCK:
+        _BREAKERS.clear()
@@ -2,56 +2,35 @@ from __future__ import annotations
 from datetime import datetime
 import logging
 import base64
+import hashlib
 import json
+import os
+import re
+import threading
 from typing import Any, Dict, Iterable, List, Optional, Tuple
-from collections import deque
+from collections import OrderedDict
 from urllib.parse import urljoin
 
 import requests
+from requests.adapters import HTTPAdapter
 import time
-from tenacity import retry, stop_after_attempt, wait_exponential
+import uuid
 from dateutil.parser import isoparse
 from django.conf import settings
 from django.utils import timezone
 
+from . import circuit_breaker, rate_limit, tracing
+from .attachments import ensure_base64
+from .pagination import PageIterator, next_link
+from .retry import IDEMPOTENCY_HEADER, RetryBudget, RetryPolicy
+
 
 DEFAULT_BASE_URL = "https://api.dopplerrelay.com/"
+DEFAULT_POOL_MAXSIZE = 10
 USER_AGENT = "doppler-relay-python/1.0"
 ADMIN_USER_AGENT = "relay-admin/1.0"
 
 logger = logging.getLogger(__name__)
-_TEMPLATE_CIRCUIT_STATE: Dict[str, Dict[str, Any]] = {}
-_TEMPLATE_FAILURE_WINDOW = 60
-_TEMPLATE_CIRCUIT_BLOCK = 60
-
-
-def _template_circuit_state(account_key: str) -> Dict[str, Any]:
-    state = _TEMPLATE_CIRCUIT_STATE.setdefault(
-        account_key,
-        {"failures": deque(), "block_until": 0.0},
-    )
-    return state
-
-
-def _register_template_failure(account_key: str) -> None:
-    state = _template_circuit_state(account_key)
-    now = time.monotonic()
-    failures: deque = state["failures"]
-    failures.append(now)
-    while failures and now - failures[0] > _TEMPLATE_FAILURE_WINDOW:
-        failures.popleft()
-    if len(failures) >= 3:
-        state["block_until"] = now + _TEMPLATE_CIRCUIT_BLOCK
-        logger.error(
-            "list_templates circuit open",
-            extra={"account": account_key, "block_seconds": _TEMPLATE_CIRCUIT_BLOCK},
-        )
-
-
-def _reset_template_circuit(account_key: str) -> None:
-    state = _template_circuit_state(account_key)
-    state["failures"].clear()
-    state["block_until"] = 0.0
 
 
 def _templates_count(payload: Any) -> int:
@@ -79,6 +58,292 @@ def _parse_retry_after(value: str | None) -> float:
 
 
 
+def _api_error_message(status: int, data: Any, method: str | None, url: Any) -> str:
+    """Mensaje legible para una respuesta de error de la API."""
+    # Si es un error de límite excedido, dar un mensaje más amigable
+    if status == 402 and isinstance(data, dict) and data.get("errorCode") == 1:
+        reset_date = datetime.fromisoformat(
+            data["resetDate"].replace("Z", "+00:00"))
+        reset_date_local = reset_date.astimezone(
+            timezone.localtime().tzinfo)
+        return (
+            f"Se ha alcanzado el límite de envíos ({data['deliveriesCount']}/{data['limit']} "
+            f"envíos {data['period']}). El límite se reiniciará el "
+            f"{reset_date_local.strftime('%Y-%m-%d %H:%M:%S')} hora local."
+        )
+    # Para otros errores, mostrar información detallada
+    error_message = f"HTTP {status} en {method} {url}\n"
+    if isinstance(data, dict):
+        if "title" in data:
+            error_message += f"\nError: {data['title']}"
+        if "detail" in data:
+            error_message += f"\nDetalle: {data['detail']}"
+        if "errors" in data:
+            error_message += f"\nErrors: {data['errors']}"
+    return error_message
+
+
+def _window_path(path: str, from_iso: str | None, to_iso: str | None) -> str:
+    """Agrega el rango from/to (ISO 8601, validado) a un path de listado."""
+    params = {}
+    if from_iso:
+        _ = isoparse(from_iso)
+        params["from"] = from_iso
+    if to_iso:
+        _ = isoparse(to_iso)
+        params["to"] = to_iso
+    return path + ("" if not params else "?" +
+                   "&".join(f"{k}={v}" for k, v in params.items()))
+
+
+def build_message_payload(from_email: str, subject: str, html: str | None = None, text: str | None = None,
+                          *, from_name: str | None = None, to: Iterable[tuple[str, str | None]] = (),
+                          cc: Iterable[tuple[str, str | None]] = (), bcc: Iterable[tuple[str, str | None]] = (),
+                          reply_to: str | None = None, headers: dict[str, str] | None = None,
+                          tags: list[str] | None = None, metadata: dict[str, Any] | None = None,
+                          attachments: list[tuple[str, bytes, str]] | None = None) -> dict[str, Any]:
+    """Payload de ``POST /accounts/{id}/messages``."""
+    if not html and not text:
+        raise ValueError("Debes proveer 'html' o 'text'.")
+    recipients = []
+    for email, name in to:
+        recipients.append(
+            {"type": "to", "email": email, "name": name or ""})
+    for email, name in cc:
+        recipients.append(
+            {"type": "cc", "email": email, "name": name or ""})
+    for email, name in bcc:
+        recipients.append(
+            {"type": "bcc", "email": email, "name": name or ""})
+    payload: dict[str, Any] = {
+        "from_email": from_email,
+        "from_name": from_name,
+        "subject": subject,
+        "recipients": recipients,
+    }
+    if html:
+        payload["html"] = html
+    if text:
+        payload["text"] = text
+    if reply_to:
+        payload["reply_to"] = reply_to
+    if headers:
+        payload["headers"] = headers
+    if tags:
+        payload["tags"] = tags
+    if metadata:
+        payload["metadata"] = metadata
+    if attachments:
+        payload["attachments"] = [{
+            "name": fname,
+            "content": base64.b64encode(content).decode("ascii"),
+            "type": mime or "application/octet-stream"
+        } for (fname, content, mime) in attachments]
+    return payload
+
+
+def build_template_message(template_id: str, recipients_model: dict[str, Any]) -> dict[str, Any]:
+    """Arma y valida el payload de ``POST /templates/{id}/message``.
+
+    Lanza ``ValueError`` si el modelo no tiene remitente o destinatarios con variables.
+    """
+    # Validación del modelo de datos
+    if not isinstance(recipients_model, dict):
+        raise ValueError("recipients_model debe ser un diccionario")
+
+    # Extraer y validar los destinatarios
+    if "recipients" not in recipients_model:
+        if "model" in recipients_model and "recipients" in recipients_model["model"]:
+            recipients_model = recipients_model["model"]
+        else:
+            raise ValueError(
+                "El modelo debe contener una lista de destinatarios")
+
+    recipients = recipients_model["recipients"]
+    if not recipients:
+        raise ValueError("La lista de destinatarios está vacía")
+
+    # Validación y configuración del remitente
+    model = recipients_model.get("model", {})
+    from_email = str(recipients_model.get(
+        "from_email", model.get("from_email", ""))).strip()
+    from_name = str(recipients_model.get(
+        "from_name", model.get("from_name", ""))).strip()
+    subject = str(recipients_model.get(
+        "subject", model.get("subject", ""))).strip()
+
+    if not from_email:
+        raise ValueError("from_email es requerido")
+
+    # Validación de la plantilla
+    if not template_id:
+        raise ValueError("template_id es requerido")
+
+    # Preparar el modelo para el envío
+    model = {
+        "from_email": from_email,
+        "from_name": from_name,
+        "reply_to": {
+            "email": from_email,
+            "name": from_name
+        },
+        "subject": subject,
+        "templateId": str(template_id),
+        "model": {},  # Variables globales del template
+        "recipients": []
+    }
+
+    # Procesar los destinatarios y sus variables
+    for recipient in recipients:
+        email = str(recipient.get("email", "")).strip()
+        if not email:
+            continue
+
+        # Las variables vienen en el campo 'variables' del recipiente
+        recipient_variables = recipient.get("variables", {})
+
+        # Procesar las variables para cada destinatario
+        variables = {
+            key: value
+            for key, value in recipient_variables.items()
+            if isinstance(key, str) and value not in (None, "")
+        }
+
+        # Crear y agregar el recipient al modelo con sus variables
+        if variables:
+            recipient_payload = {
+                "email": email,
+                # Nombre del destinatario
+                "name": recipient.get("name", ""),
+                "type": "to",  # Tipo de destinatario
+                "model": variables,
+            }
+            # Agregar las variables al modelo global para compatibilidad
+            # (solo con un destinatario: en lotes filtraría datos entre destinatarios)
+            if len(recipients) == 1:
+                model.setdefault("model", {}).update(variables)
+            model["recipients"].append(recipient_payload)
+        else:
+            logger.debug("No se agregó %s porque no tiene variables", email)
+
+    if "attachments" in recipients_model:
+        attachments = []
+        for attachment in recipients_model["attachments"]:
+            if not isinstance(attachment, dict):
+                continue
+            if "content" not in attachment or "filename" not in attachment:
+                continue
+            try:
+                # El contenido ya normalizado (Base64Content) se comparte sin decodificar
+                attachments.append({
+                    "content": ensure_base64(attachment["content"]),
+                    "filename": str(attachment["filename"]).strip()
+                })
+            except Exception as e:
+                logger.warning("Error procesando adjunto %s: %s",
+                               attachment.get("filename"), e)
+                continue
+
+        if attachments:
+            model["attachments"] = attachments
+
+    # Validar que tengamos destinatarios para procesar
+    if not model["recipients"]:
+        raise ValueError(
+            "No hay destinatarios con variables para procesar")
+    return model
+
+
+def template_send_result(model: dict[str, Any], result: dict[str, Any]) -> dict[str, Any]:
+    """Transforma la respuesta de la API al formato por destinatario usado por los envíos masivos."""
+    resultados = []
+    message_id = result.get("message_id") or (result.get(
+        "_location", "").split("/")[-1] if result.get("_location") else "")
+
+    for recipient in model["recipients"]:
+        resultados.append({
+            "email": recipient["email"],
+            "status": "ok",
+            "message_id": message_id,
+            # Incluimos las variables usadas
+            "variables": recipient["model"]
+        })
+
+    return {
+        "ok": True,
+        "resultados": resultados,
+        "total": len(resultados)
+    }
+
+
+# Variables Mustache: {{variable}} o {{objeto.propiedad}}
+_MUSTACHE_RE = re.compile(r'\{\{([^}]+)\}\}')
+_VARIABLE_NAME_RE = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_.]*[a-zA-Z0-9_]$')
+# Variables ya extraídas por hash SHA-256 del contenido (acotado, por proceso)
+_VARIABLES_BY_HASH: "OrderedDict[str, tuple[str, ...]]" = OrderedDict()
+_VARIABLES_BY_HASH_MAX = 256
+_VARIABLES_LOCK = threading.Lock()
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def template_variables(content: str, digest: str | None = None) -> list[str]:
+    """Variables Mustache válidas (ordenadas) de un contenido, memorizadas por su hash."""
+    digest = digest or content_hash(content)
+    with _VARIABLES_LOCK:
+        cached = _VARIABLES_BY_HASH.get(digest)
+        if cached is not None:
+            _VARIABLES_BY_HASH.move_to_end(digest)
+            return list(cached)
+
+    variables = set()
+    for match in _MUSTACHE_RE.finditer(content):
+        var_name = match.group(1).strip()
+        # Validar que sea una variable Mustache válida (permite puntos para acceso a propiedades)
+        if _VARIABLE_NAME_RE.match(var_name):
+            variables.add(var_name)
+        else:
+            logger.warning("Variable Mustache inválida encontrada: %s", var_name)
+    result = tuple(sorted(variables))
+
+    with _VARIABLES_LOCK:
+        _VARIABLES_BY_HASH[digest] = result
+        while len(_VARIABLES_BY_HASH) > _VARIABLES_BY_HASH_MAX:
+            _VARIABLES_BY_HASH.popitem(last=False)
+    return list(result)
+
+
+def extract_template_fields(template_data: dict[str, Any]) -> Dict[str, Any]:
+    """id, nombre, asunto y variables Mustache ({{variable}} o {{objeto.propiedad}}) de una plantilla.
+
+    Incluye ``content_hash`` (SHA-256 del contenido) para detectar cambios.
+    """
+    # Extraer las variables de la plantilla
+    content = template_data.get(
+        "htmlContent", "") or template_data.get("textContent", "")
+    if not content:
+        logger.warning("La plantilla %s no tiene contenido HTML ni texto",
+                       template_data.get("id"))
+        return {
+            "id": template_data.get("id"),
+            "name": template_data.get("name"),
+            "subject": template_data.get("subject"),
+            "variables": [],
+            "content_hash": None,
+        }
+
+    digest = content_hash(content)
+    return {
+        "id": template_data.get("id"),
+        "name": template_data.get("name"),
+        "subject": template_data.get("subject"),
+        "variables": template_variables(content, digest),
+        "content_hash": digest,
+    }
+
+
 class DopplerRelayError(RuntimeError):
     def __init__(self, message: str, status: int | None = None, payload: Any = None):
         super().__init__(message)
@@ -86,13 +351,23 @@ class DopplerRelayError(RuntimeError):
         self.payload = payload
 
 
+class CircuitOpenError(DopplerRelayError):
+    """El circuito de la cuenta/endpoint está abierto: la llamada no salió a la red."""
+
+
 class DopplerRelayClient:
-    def __init__(self, *, api_key: str | None = None, base_url: str | None = None, auth_scheme: str | None = None, timeout: int | None = None):
+    def __init__(self, *, api_key: str | None = None, base_url: str | None = None, auth_scheme: str | None = None, timeout: int | None = None, pool_size: int | None = None):
         cfg = settings.DOPPLER_RELAY
         self.base_url = (base_url or cfg.get(
             "BASE_URL", DEFAULT_BASE_URL)).rstrip("/") + "/"
         self.timeout = timeout or cfg.get("TIMEOUT", 30)
         self.session = requests.Session()
+        if pool_size and pool_size > 1:
+            # Pool de conexiones dimensionado para uso concurrente de la misma sesión;
+            # sin reintentos de urllib3 (los gestiona RetryPolicy)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
 
         # Usar 'token' como esquema de autorización por defecto
         auth_scheme = auth_scheme or cfg.get('AUTH_SCHEME', 'token')
@@ -116,10 +391,6 @@ class DopplerRelayClient:
         Returns:
             Diccionario con la respuesta de la API
         """
-        print(f"\n=== ENVIANDO BULK EMAIL ===")
-        print(f"Template ID: {template_id}")
-        print(f"Recipients Model: {json.dumps(recipients_model, indent=2)}")
-
         # Validación de datos básicos
         if not recipients_model.get("recipients"):
             raise ValueError("El modelo no contiene destinatarios")
@@ -138,36 +409,26 @@ class DopplerRelayClient:
                 payload=getattr(e, 'payload', None)
             )
 
-        # Debug de la configuración (sin mostrar la API key completa)
-        debug_info = {
-            "base_url": self.base_url,
-            "auth_scheme": auth_scheme,
-            "api_key": f"{api_key[:4]}...{api_key[-4:]}" if api_key else None,
-            "timeout": self.timeout,
-        }
-        print("DopplerRelayClient configuración:", debug_info)
-
     def _url(self, path: str) -> str:
         return urljoin(self.base_url, path.lstrip("/"))
 
-    def _raise_for_api(self, resp: requests.Response):
-        # Primero, loguear la respuesta completa para depuración
-        print(f"\nRequest URL: {resp.request.url}")
-        print(f"Request Method: {resp.request.method}")
-        print(f"Request Headers: {dict(resp.request.headers)}")
-        try:
-            print(f"Request Body: {resp.request.body.decode()}")
-        except:
-            print(f"Request Body: {resp.request.body}")
-        print(f"\nResponse Status: {resp.status_code}")
-        print(f"Response Headers: {dict(resp.headers)}")
-        try:
-            print(f"Response Body: {resp.text}")
-        except:
-            print("No se pudo leer el cuerpo de la respuesta")
+    @staticmethod
+    def rate_status(account_id: int | str) -> dict[str, Any] | None:
+        """Ritmo efectivo del limitador de la cuenta (``None`` si está desactivado)."""
+        return rate_limit.current_rate(account_id)
 
+    def _raise_for_api(self, resp: requests.Response, *, trace_level: int | None = None,
+                       body: Any = None):
+        """Lanza ``DopplerRelayError`` con el contexto de una respuesta no exitosa.
+
+        ``body`` es el JSON enviado. El cuerpo solo se deserializa y resume si la
+        llamada está trazada (``trace_level``); si no, se registran su tamaño y
+        la cantidad de destinatarios.
+        """
         if 200 <= resp.status_code < 300:
             return
+        if trace_level is None:
+            trace_level = tracing.sampled_level()
 
         try:
             data = resp.json()
@@ -175,119 +436,147 @@ class DopplerRelayClient:
             # Si no es JSON, guarda el texto plano
             data = resp.text
 
-        # Mostrar el payload enviado y la respuesta para depuración
+        # Contexto del error para depuración; sin credenciales ni base64 de adjuntos
+        request_body = resp.request.body
+        if trace_level:
+            if request_body:
+                try:
+                    request_body = json.loads(request_body)
+                except (TypeError, ValueError):
+                    pass
+            body_info: dict[str, Any] = {"request_body": tracing.summarize_body(request_body)}
+        else:
+            recipients = body.get("recipients") if isinstance(body, dict) else None
+            body_info = {
+                "request_body_size": len(request_body or b""),
+                "request_recipients": len(recipients) if isinstance(recipients, list) else None,
+            }
         error_info = {
             "response": data if isinstance(data, dict) else None,
             "response_text": resp.text if not isinstance(data, dict) else None,
             "request_url": resp.request.url,
             "request_method": resp.request.method,
-            "request_headers": dict(resp.request.headers),
-            "request_body": resp.request.body.decode('utf-8') if resp.request.body else None,
+            "request_headers": tracing.redact_headers(resp.request.headers),
+            **body_info,
             "response_headers": dict(resp.headers),
-            "response_status": resp.status_code
+            "response_status": resp.status_code,
+            # Leído de los headers sin distinguir mayúsculas (dict() pierde esa propiedad)
+            "retry_after": resp.headers.get("Retry-After"),
         }
 
-        # Si es un error de límite excedido, dar un mensaje más amigable
-        if resp.status_code == 402 and isinstance(data, dict) and data.get("errorCode") == 1:
-            reset_date = datetime.fromisoformat(
-                data["resetDate"].replace("Z", "+00:00"))
-            reset_date_local = reset_date.astimezone(
-                timezone.localtime().tzinfo)
-            error_message = (
-                f"Se ha alcanzado el límite de envíos ({data['deliveriesCount']}/{data['limit']} "
-                f"envíos {data['period']}). El límite se reiniciará el "
-                f"{reset_date_local.strftime('%Y-%m-%d %H:%M:%S')} hora local."
-            )
-        else:
-            # Para otros errores, mostrar información detallada
-            error_message = f"HTTP {resp.status_code} en {resp.request.method} {resp.request.url}\n"
-            if isinstance(data, dict):
-                if "title" in data:
-                    error_message += f"\nError: {data['title']}"
-                if "detail" in data:
-                    error_message += f"\nDetalle: {data['detail']}"
-                if "errors" in data:
-                    error_message += f"\nErrors: {data['errors']}"
-
         raise DopplerRelayError(
-            error_message,
+            _api_error_message(resp.status_code, data,
+                               resp.request.method, resp.request.url),
             status=resp.status_code,
             payload=error_info,
         )
 
-    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
-        """Realiza una petición HTTP a la API de Doppler Relay."""
+    def _request(self, method: str, path: str, *, idempotency_key: str | None = None,
+                 retry_budget: RetryBudget | None = None, **kwargs) -> requests.Response:
+        """Realiza una petición HTTP a la API de Doppler Relay.
+
+        Reintenta solo errores transitorios (red, 429, 5xx) según ``RetryPolicy``;
+        ``retry_budget`` limita las esperas acumuladas de un envío masivo.
+        """
         url = self._url(path)
-        max_retries = 3
-        retry_count = 0
+        policy = RetryPolicy.from_settings()
+        attempt = 0
         last_error = None
 
-        while retry_count < max_retries:
+        # Asegurarnos de no duplicar el timeout
+        if 'timeout' not in kwargs:
+            kwargs['timeout'] = self.timeout
+        if method == "POST":
+            # Misma clave en todos los intentos: un reintento no duplica el envío
+            kwargs['headers'] = {
+                **(kwargs.get('headers') or {}),
+                IDEMPOTENCY_HEADER: idempotency_key or uuid.uuid4().hex,
+            }
+        # Muestreo por llamada: con trazas desactivadas no se serializa nada
+        trace_level = tracing.sampled_level()
+        account = rate_limit.account_from_path(path)
+        limiter = rate_limit.get_limiter(account)
+        breaker = circuit_breaker.get_breaker(
+            account, circuit_breaker.endpoint_family(path))
+        started_call = time.monotonic()
+
+        while True:
+            attempt += 1
+            if not breaker.allow():
+                raise CircuitOpenError(
+                    f"Doppler Relay no disponible ({breaker.name}); "
+                    f"reintentar en {breaker.retry_in():.0f}s",
+                    payload={"circuit": breaker.snapshot(), "previous_error": str(last_error) if last_error else None},
+                )
             try:
-                # Log de la petición
-                print(
-                    f"\n=== REQUEST (intento {retry_count + 1}/{max_retries}) ===")
-                print(f"URL: {url}")
-                print(f"Method: {method}")
-                print(f"Headers: {dict(self.session.headers)}")
-                if 'json' in kwargs:
-                    print(
-                        f"JSON Payload: {json.dumps(kwargs['json'], indent=2)}")
-
-                # Asegurarnos de no duplicar el timeout
-                if 'timeout' not in kwargs:
-                    kwargs['timeout'] = self.timeout
-
-                # Hacer la petición
+                if limiter:
+                    limiter.acquire()
+                if trace_level:
+                    tracing.trace_request(
+                        trace_level, method, url,
+                        headers={**self.session.headers, **(kwargs.get('headers') or {})},
+                        body=kwargs.get('json'), attempt=attempt)
+                started = time.monotonic()
                 resp = self.session.request(method, url, **kwargs)
+                if trace_level:
+                    tracing.trace_response(
+                        trace_level, method, url, resp, time.monotonic() - started)
 
-                # Log de la respuesta
-                print(f"\n=== RESPONSE ===")
-                print(f"Status: {resp.status_code}")
-                print(f"Headers: {dict(resp.headers)}")
-                try:
-                    # Primeros 1000 caracteres
-                    print(f"Body: {resp.text[:1000]}...")
-                except:
-                    print("No se pudo leer el cuerpo de la respuesta")
-
+                # Solo 5xx cuenta como degradación; un 4xx implica que el servicio responde
+                if resp.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
                 if resp.status_code >= 400:
-                    self._raise_for_api(resp)
+                    self._raise_for_api(resp, trace_level=trace_level, body=kwargs.get('json'))
                 return resp
 
             except (requests.RequestException, DopplerRelayError) as e:
-                retry_count += 1
+                if isinstance(e, requests.RequestException):
+                    breaker.record_failure()
                 last_error = e
-                print(f"\n=== ERROR (intento {retry_count}/{max_retries}) ===")
-                print(f"Type: {type(e).__name__}")
-                print(f"Message: {str(e)}")
-
-                if hasattr(e, 'response') and hasattr(e.response, 'text'):
-                    print(f"Response Text: {e.response.text}")
-
-                if retry_count < max_retries:
-                    # Calcular tiempo de espera exponencial
-                    wait_time = min(0.8 * (2 ** retry_count), 8)
-                    print(
-                        f"Esperando {wait_time:.2f} segundos antes de reintentar...")
-                    import time
-                    time.sleep(wait_time)
+                status = getattr(e, "status", None)
+                logger.warning(
+                    "Fallo petición a Doppler Relay",
+                    extra={"method": method, "url": url, "attempt": attempt,
+                           "status": status, "error": str(e)},
+                )
+
+                if not policy.is_retryable(e):
+                    break
+                if status == 429:
+                    wait = _parse_retry_after((e.payload or {}).get("retry_after"))
                 else:
-                    print("Se agotaron los reintentos")
+                    wait = policy.backoff(attempt)
+                if not policy.allows(attempt, started_call, wait):
                     break
-
-        # Si llegamos aquí, todos los intentos fallaron
+                if retry_budget is not None and not retry_budget.consume(wait):
+                    logger.warning("Presupuesto de reintentos del envío agotado",
+                                   extra={"method": method, "url": url})
+                    break
+                if status == 429 and limiter:
+                    # Con limitador la espera la impone el bucket compartido
+                    limiter.penalize(wait)
+                else:
+                    time.sleep(wait)
+            except BaseException:
+                # Error local (cache del limitador, trazas...): no es un fallo de Doppler,
+                # pero la sonda half-open debe liberarse
+                breaker.release()
+                raise
+
+        # Si llegamos aquí, el error no es transitorio o se agotaron los reintentos
         if isinstance(last_error, DopplerRelayError):
             raise last_error
-        else:
-            raise DopplerRelayError(
-                f"Error después de {max_retries} intentos: {str(last_error)}",
-                status=getattr(last_error, 'response', {}).status_code,
-                payload={
-                    "original_error": str(last_error),
-                    "error_type": type(last_error).__name__
-                }
-            )
+        response = getattr(last_error, 'response', None)
+        raise DopplerRelayError(
+            f"Error después de {attempt} intentos: {str(last_error)}",
+            status=getattr(response, 'status_code', None),
+            payload={
+                "original_error": str(last_error),
+                "error_type": type(last_error).__name__
+            }
+        )
 
     def get_template_fields(self, account_id: int, template_id: str) -> Dict[str, Any]:
         """
@@ -309,124 +598,34 @@ class DopplerRelayClient:
         if not template_id:
             raise ValueError("template_id es requerido")
 
-        print(f"\n=== OBTENIENDO CAMPOS DE LA PLANTILLA MUSTACHE ===")
-        print(f"Account ID: {account_id}")
-        print(f"Template ID: {template_id}")
-
-        try:
-            response = self._request(
-                "GET",
-                f"/accounts/{account_id}/templates/{template_id}"
-            )
-            template_data = response.json()
-        except Exception as e:
-            print(f"Error al obtener la plantilla: {str(e)}")
-            raise
-
-        # Extraer las variables de la plantilla
-        content = template_data.get(
-            "htmlContent", "") or template_data.get("textContent", "")
-        if not content:
-            print("Advertencia: La plantilla no tiene contenido HTML ni texto")
-            return {
-                "id": template_data.get("id"),
-                "name": template_data.get("name"),
-                "subject": template_data.get("subject"),
-                "variables": []
-            }
-
-        # Buscar variables Mustache en el formato {{variable}} o {{object.property}}
-        import re
-        variables = []
-        matches = re.finditer(r'\{\{([^}]+)\}\}', content)
-
-        for match in matches:
-            var_name = match.group(1).strip()
-            # Validar que sea una variable Mustache válida (permite puntos para acceso a propiedades)
-            if re.match(r'^[a-zA-Z_][a-zA-Z0-9_.]*[a-zA-Z0-9_]$', var_name):
-                if var_name not in variables:
-                    variables.append(var_name)
-            else:
-                print(
-                    f"Advertencia: Variable Mustache inválida encontrada: {var_name}")
-
-        print(f"\nVariables Mustache encontradas ({len(variables)}):")
-        for var in sorted(variables):
-            print(f"- {var}")
-
-        result = {
-            "id": template_data.get("id"),
-            "name": template_data.get("name"),
-            "subject": template_data.get("subject"),
-            "variables": sorted(variables)
-        }
-
-        print(f"\nInformación de la plantilla:")
-        print(f"- ID: {result['id']}")
-        print(f"- Nombre: {result['name']}")
-        print(f"- Asunto: {result['subject']}")
-
-        return result
+        template_data = self._request(
+            "GET",
+            f"/accounts/{account_id}/templates/{template_id}"
+        ).json()
+        return extract_template_fields(template_data)
 
     # --- Mensajes ---
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     def send_message(self, account_id: int, from_email: str, subject: str, html: str | None = None, text: str | None = None,
                      *, from_name: str | None = None, to: Iterable[tuple[str, str | None]] = (),
                      cc: Iterable[tuple[str, str | None]] = (), bcc: Iterable[tuple[str, str | None]] = (),
                      reply_to: str | None = None, headers: dict[str, str] | None = None,
                      tags: list[str] | None = None, metadata: dict[str, Any] | None = None,
-                     attachments: list[tuple[str, bytes, str]] | None = None) -> dict[str, Any]:
+                     attachments: list[tuple[str, bytes, str]] | None = None,
+                     idempotency_key: str | None = None) -> dict[str, Any]:
         if not html and not text:
             raise ValueError("Debes proveer 'html' o 'text'.")
 
-        print(f"\n=== INICIANDO ENVÍO DE MENSAJE ===")
-        print(f"Account ID: {account_id}")
-        print(f"From: {from_email}")
-        print(f"To: {list(to)}")
-        print(f"Subject: {subject}")
-        print(f"HTML: {'Sí' if html else 'No'}")
-        print(f"Text: {'Sí' if text else 'No'}")
-
         # Validar la API key
         if not self.session.headers.get('Authorization'):
             raise ValueError("No se encontró el header de autorización")
 
-        recipients = []
-        for email, name in to:
-            recipients.append(
-                {"type": "to", "email": email, "name": name or ""})
-        for email, name in cc:
-            recipients.append(
-                {"type": "cc", "email": email, "name": name or ""})
-        for email, name in bcc:
-            recipients.append(
-                {"type": "bcc", "email": email, "name": name or ""})
-        payload: dict[str, Any] = {
-            "from_email": from_email,
-            "from_name": from_name,
-            "subject": subject,
-            "recipients": recipients,
-        }
-        if html:
-            payload["html"] = html
-        if text:
-            payload["text"] = text
-        if reply_to:
-            payload["reply_to"] = reply_to
-        if headers:
-            payload["headers"] = headers
-        if tags:
-            payload["tags"] = tags
-        if metadata:
-            payload["metadata"] = metadata
-        if attachments:
-            payload["attachments"] = [{
-                "name": fname,
-                "content": base64.b64encode(content).decode("ascii"),
-                "type": mime or "application/octet-stream"
-            } for (fname, content, mime) in attachments]
+        payload = build_message_payload(
+            from_email, subject, html, text, from_name=from_name, to=to, cc=cc, bcc=bcc,
+            reply_to=reply_to, headers=headers, tags=tags, metadata=metadata,
+            attachments=attachments)
         resp = self._request("POST", f"/accounts/{account_id}/messages",
-                             json=payload, headers={"Content-Type": "application/json"})
+                             json=payload, headers={"Content-Type": "application/json"},
+                             idempotency_key=idempotency_key)
         data = resp.json()
         data["_location"] = resp.headers.get("Location")
         return data
@@ -438,6 +637,12 @@ class DopplerRelayClient:
         path = page_url or f"/accounts/{account_id}/messages"
         return self._request("GET", path).json()
 
+    def iter_messages(self, account_id: int, *, cursor: dict[str, Any] | None = None,
+                      prefetch: bool = True) -> PageIterator:
+        """Mensajes ítem a ítem a través de todas las páginas (ver ``PageIterator``)."""
+        return PageIterator(self._get_json, f"/accounts/{account_id}/messages",
+                            cursor=cursor, prefetch=prefetch)
+
     # --- Plantillas CRUD ---
     def list_templates(self, account_id: int) -> dict[str, Any]:
         return self._request("GET", f"/accounts/{account_id}/templates").json()
@@ -500,7 +705,9 @@ class DopplerRelayClient:
             return ""
         return ""
 
-    def send_template_message(self, account_id: int, template_id: str, recipients_model: dict[str, Any]) -> dict[str, Any]:
+    def send_template_message(self, account_id: int, template_id: str, recipients_model: dict[str, Any],
+                              *, idempotency_key: str | None = None,
+                              retry_budget: RetryBudget | None = None) -> dict[str, Any]:
         """
         Envía un mensaje usando una plantilla de Doppler Relay con variables Mustache.
 
@@ -517,213 +724,33 @@ class DopplerRelayClient:
 
         Ejemplo de variables en el payload:
             { "data": { "nombre": "Juan", "monto": "1000" } }
-        """
-        print(f"\n=== ENVIANDO TEMPLATE {template_id} ===")
-        print("Formato de variables en plantilla: {{variable}}")
-
-        # Validación del modelo de datos
-        if not isinstance(recipients_model, dict):
-            raise ValueError("recipients_model debe ser un diccionario")
-
-        # Mostrar el modelo recibido para debug
-        print(f"\nModelo de datos recibido:")
-        print(json.dumps(recipients_model, indent=2, ensure_ascii=False))
-
-        # Extraer y validar los destinatarios
-        if "recipients" not in recipients_model:
-            if "model" in recipients_model and "recipients" in recipients_model["model"]:
-                recipients_model = recipients_model["model"]
-            else:
-                raise ValueError(
-                    "El modelo debe contener una lista de destinatarios")
-
-        recipients = recipients_model["recipients"]
-        if not recipients:
-            raise ValueError("La lista de destinatarios está vacía")
-
-        # Validación y configuración del remitente
-        model = recipients_model.get("model", {})
-        from_email = str(recipients_model.get(
-            "from_email", model.get("from_email", ""))).strip()
-        from_name = str(recipients_model.get(
-            "from_name", model.get("from_name", ""))).strip()
-        subject = str(recipients_model.get(
-            "subject", model.get("subject", ""))).strip()
-
-        if not from_email:
-            raise ValueError("from_email es requerido")
-
-        # Validación de la plantilla
-        if not template_id:
-            raise ValueError("template_id es requerido")
-
-        # Preparar el modelo para el envío
-        model = {
-            "from_email": from_email,
-            "from_name": from_name,
-            "reply_to": {
-                "email": from_email,
-                "name": from_name
-            },
-            "subject": subject,
-            "templateId": str(template_id),
-            "model": {},  # Variables globales del template
-            "recipients": []
-        }
-
-        print("\n=== INICIANDO PROCESAMIENTO DE VARIABLES ===")
-
-        # Procesar los destinatarios y sus variables
-        for recipient in recipients:
-            email = str(recipient.get("email", "")).strip()
-            if not email:
-                continue
 
-            # Obtener todas las variables disponibles del destinatario
-            print(f"\n📧 Procesando destinatario: {email}")
-
-            # Las variables vienen en el campo 'variables' del recipiente
-            recipient_variables = recipient.get("variables", {})
-            print("Variables disponibles:", recipient_variables)
-
-            # Procesar las variables para cada destinatario
-            variables = {
-                key: value
-                for key, value in recipient_variables.items()
-                if isinstance(key, str) and value not in (None, "")
-            }
-
-            print("Variables procesadas:", variables)
-
-            # Crear y agregar el recipient al modelo con sus variables
-            if variables:
-                print(f"\nConfigurando payload para {email}:")
-                recipient_payload = {
-                    "email": email,
-                    # Nombre del destinatario
-                    "name": recipient.get("name", ""),
-                    "type": "to",  # Tipo de destinatario
-                    "model": variables,
-                }
-                # Agregar las variables al modelo global para compatibilidad
-                model.setdefault("model", {}).update(variables)
-                print("Payload del destinatario:")
-                print(json.dumps(recipient_payload, indent=2, ensure_ascii=False))
-                model["recipients"].append(recipient_payload)
-                print("Destinatario agregado al modelo")
-            else:
-                print(f"No se agrego {email} porque no tiene variables")
-
-        if "attachments" in recipients_model:
-            attachments = []
-            for attachment in recipients_model["attachments"]:
-                if not isinstance(attachment, dict):
-                    continue
-                if "content" not in attachment or "filename" not in attachment:
-                    continue
-                try:
-                    # Si el contenido ya está en base64, verificar que sea válido
-                    if isinstance(attachment["content"], str):
-                        try:
-                            base64.b64decode(attachment["content"])
-                            content = attachment["content"]
-                        except:
-                            # Si no es base64 válido, codificarlo
-                            content = base64.b64encode(
-                                attachment["content"].encode()).decode()
-                    else:
-                        # Si es bytes, codificar a base64
-                        content = base64.b64encode(
-                            attachment["content"]).decode()
-
-                    attachments.append({
-                        "content": content,
-                        "filename": str(attachment["filename"]).strip()
-                    })
-                except Exception as e:
-                    print(f"Error procesando adjunto: {str(e)}")
-                    continue
-
-            if attachments:
-                model["attachments"] = attachments
-
-        # Validar que tengamos destinatarios para procesar
-        if not model["recipients"]:
-            raise ValueError(
-                "No hay destinatarios con variables para procesar")
-
-        # Debug detallado del envío
-        print("\n=== RESUMEN DE ENVÍO ===")
-        print(f"Template ID: {template_id}")
-        print(f"Total Destinatarios: {len(model['recipients'])}")
-        print("\nEstructura del Payload:")
-        print("1. Variables en la plantilla: {{variable}}")
-        print(
-            "2. Variables en el payload: { email: '...', name: '...', variables: { variable: 'valor' } }")
-        print("\nPayload Final:")
-        print(json.dumps(model, indent=2, ensure_ascii=False))
-
-        try:
-            # Hacer la llamada a la API con plantilla
-            print("\n📤 Enviando solicitud a Doppler Relay (Envío con Plantilla)...")
-            response = self._request(
-                "POST",
-                f"/accounts/{str(account_id)}/templates/{str(template_id)}/message",
-                json=model,
-                headers={"Content-Type": "application/json"}
-            )
+        ``idempotency_key`` viaja como header ``Idempotency-Key`` (estable entre
+        reintentos) y ``retry_budget`` acota las esperas de un envío masivo.
+        """
+        model = build_template_message(template_id, recipients_model)
+
+        response = self._request(
+            "POST",
+            f"/accounts/{str(account_id)}/templates/{str(template_id)}/message",
+            json=model,
+            headers={"Content-Type": "application/json"},
+            idempotency_key=idempotency_key,
+            retry_budget=retry_budget,
+        )
 
-            result = response.json()
-            result["_location"] = response.headers.get("Location")
-
-            print("\n✅ Envío exitoso")
-            print("Respuesta de la API:")
-            print(json.dumps(result, indent=2))
-
-            # Transformar la respuesta al formato requerido
-            resultados = []
-            message_id = result.get("message_id") or (result.get(
-                "_location", "").split("/")[-1] if result.get("_location") else "")
-
-            for recipient in model["recipients"]:
-                resultados.append({
-                    "email": recipient["email"],
-                    "status": "ok",
-                    "message_id": message_id,
-                    # Incluimos las variables usadas
-                    "variables": model["model"]
-                })
+        result = response.json()
+        result["_location"] = response.headers.get("Location")
+        logger.debug("Envío con plantilla %s aceptado para %d destinatarios",
+                     template_id, len(model["recipients"]))
 
-            return {
-                "ok": True,
-                "resultados": resultados,
-                "total": len(resultados)
-            }
-
-        except Exception as e:
-            print("\n❌ Error durante el envío:")
-            print(str(e))
-            if hasattr(e, 'payload'):
-                print("\nDetalles del error:")
-                print(json.dumps(e.payload, indent=2))
-            raise
+        return template_send_result(model, result)
 
     # --- Entregas & Eventos ---
 
     def list_deliveries(self, account_id: int, *, from_iso: str | None = None, to_iso: str | None = None, page_url: str | None = None) -> dict[str, Any]:
-        if page_url:
-            url = page_url
-        else:
-            path = f"/accounts/{account_id}/deliveries"
-            params = {}
-            if from_iso:
-                _ = isoparse(from_iso)
-                params["from"] = from_iso
-            if to_iso:
-                _ = isoparse(to_iso)
-                params["to"] = to_iso
-            url = path + ("" if not params else "?" +
-                          "&".join(f"{k}={v}" for k, v in params.items()))
+        url = page_url or _window_path(
+            f"/accounts/{account_id}/deliveries", from_iso, to_iso)
         return self._request("GET", url).json()
 
     def get_delivery(self, account_id: int, delivery_id: str) -> dict[str, Any]:
@@ -740,25 +767,86 @@ class DopplerRelayClient:
         return self._request("GET", f"/accounts/{account_id}/deliveries/aggregation", params=params).json()
 
     def list_events(self, account_id: int, *, from_iso: str | None = None, to_iso: str | None = None, page_url: str | None = None) -> dict[str, Any]:
-        if page_url:
-            url = page_url
-        else:
-            path = f"/accounts/{account_id}/events"
-            params = {}
-            if from_iso:
-                _ = isoparse(from_iso)
-                params["from"] = from_iso
-            if to_iso:
-                _ = isoparse(to_iso)
-                params["to"] = to_iso
-            url = path + ("" if not params else "?" +
-                          "&".join(f"{k}={v}" for k, v in params.items()))
+        url = page_url or _window_path(
+            f"/accounts/{account_id}/events", from_iso, to_iso)
         return self._request("GET", url).json()
 
-    @staticmethod
-    def next_link(data: dict[str, Any]) -> str | None:
-        links = data.get("_links") or data.get("links") or []
-        for item in links:
-            if (item.get("rel") or "").endswith("next") or item.get("rel") == "next":
-                return item.get("href")
-        return None
+    def iter_deliveries(self, account_id: int, *, from_iso: str | None = None, to_iso: str | None = None,
+                        cursor: dict[str, Any] | None = None, prefetch: bool = True) -> PageIterator:
+        """Entregas ítem a ítem, precargando la página siguiente; ``cursor`` retoma un recorrido previo."""
+        return PageIterator(self._get_json, _window_path(
+            f"/accounts/{account_id}/deliveries", from_iso, to_iso), cursor=cursor, prefetch=prefetch)
+
+    def iter_events(self, account_id: int, *, from_iso: str | None = None, to_iso: str | None = None,
+                    cursor: dict[str, Any] | None = None, prefetch: bool = True) -> PageIterator:
+        """Eventos ítem a ítem, precargando la página siguiente; ``cursor`` retoma un recorrido previo."""
+        return PageIterator(self._get_json, _window_path(
+            f"/accounts/{account_id}/events", from_iso, to_iso), cursor=cursor, prefetch=prefetch)
+
+    def _get_json(self, path: str) -> dict[str, Any]:
+        return self._request("GET", path).json()
+
+    next_link = staticmethod(next_link)
+
+
+# --- Registro de clientes por proceso ---
+# Un cliente (sesión HTTP con keep-alive) por configuración, compartido entre
+# requests del admin, hilos de envío y workers del mismo proceso.
+_CLIENTS: Dict[Tuple[Any, ...], DopplerRelayClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def _pool_maxsize(requested: int | None = None) -> int:
+    cfg = getattr(settings, "DOPPLER_RELAY", {}) or {}
+    sizes = [cfg.get("HTTP_POOL_MAXSIZE", DEFAULT_POOL_MAXSIZE), requested or 0]
+    # El pool debe alcanzar para la mayor concurrencia de envío configurada
+    concurrency = cfg.get("BULK_CONCURRENCY", 1)
+    sizes.extend(concurrency.values() if isinstance(concurrency, dict) else [concurrency])
+    result = 1
+    for size in sizes:
+        try:
+            result = max(result, int(size))
+        except (TypeError, ValueError):
+            continue
+    return result
+
+
+def get_client(*, pool_size: int | None = None) -> DopplerRelayClient:
+    """Cliente compartido del proceso para la configuración actual de ``DOPPLER_RELAY``.
+
+    Reutiliza la sesión (y sus conexiones TLS abiertas) entre llamadas; es
+    seguro desde varios hilos. Tras un ``fork`` el proceso hijo crea sus
+    propios clientes.
+    """
+    cfg = getattr(settings, "DOPPLER_RELAY", {}) or {}
+    size = _pool_maxsize(pool_size)
+    key = (cfg.get("API_KEY"), cfg.get("BASE_URL"), cfg.get("AUTH_SCHEME"), cfg.get("TIMEOUT"), size)
+    client = _CLIENTS.get(key)
+    if client is None:
+        with _CLIENTS_LOCK:
+            client = _CLIENTS.get(key)
+            if client is None:
+                client = DopplerRelayClient(pool_size=size)
+                _CLIENTS[key] = client
+    return client
+
+
+def reset_clients() -> None:
+    """Cierra y descarta los clientes compartidos (p. ej. tras cambiar credenciales)."""
+    with _CLIENTS_LOCK:
+        clients = list(_CLIENTS.values())
+        _CLIENTS.clear()
+    for client in clients:
+        client.session.close()
+
+
+def _forget_clients_after_fork() -> None:
+    # Las conexiones heredadas pertenecen al padre: el hijo no debe reutilizarlas
+    # ni cerrarlas, solo olvidarlas. El lock también puede haberse copiado tomado.
+    global _CLIENTS_LOCK
+    _CLIENTS.clear()
+    _CLIENTS_LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_clients_after_fork)
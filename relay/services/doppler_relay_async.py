@@ -0,0 +1,265 @@
+"""Cliente asyncio de Doppler Relay (httpx).
+
+Espejo de :class:`relay.services.doppler_relay.DopplerRelayClient` para vistas
+ASGI y workers que necesitan miles de envíos/consultas en vuelo desde un solo
+proceso sin un hilo por petición. Comparte la construcción de payloads y el
+formato de errores con el cliente síncrono.
+
+Uso desde una vista async::
+
+    client = get_async_client()
+    data = await client.get_template(account_id, template_id)
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import uuid
+import weakref
+from typing import Any, AsyncIterator, Iterable
+from urllib.parse import urljoin
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import circuit_breaker, rate_limit
+from .doppler_relay import (
+    DEFAULT_BASE_URL,
+    USER_AGENT,
+    CircuitOpenError,
+    DopplerRelayClient,
+    DopplerRelayError,
+    _api_error_message,
+    _parse_retry_after,
+    _window_path,
+    build_message_payload,
+    build_template_message,
+    template_send_result,
+)
+from .retry import IDEMPOTENCY_HEADER, RetryBudget, RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONNECTIONS = 100
+DEFAULT_MAX_KEEPALIVE = 20
+KEEPALIVE_EXPIRY = 30.0
+
+
+def _raise_for_response(resp: httpx.Response) -> None:
+    if resp.status_code < 400:
+        return
+    try:
+        data = resp.json()
+    except Exception:
+        data = resp.text
+    raise DopplerRelayError(
+        _api_error_message(resp.status_code, data, resp.request.method, resp.request.url),
+        status=resp.status_code,
+        payload={
+            "response": data if isinstance(data, dict) else None,
+            "response_text": resp.text if not isinstance(data, dict) else None,
+            "request_url": str(resp.request.url),
+            "request_method": resp.request.method,
+            "response_headers": dict(resp.headers),
+            "response_status": resp.status_code,
+            # httpx guarda los nombres en minúsculas: se lee del objeto sin distinguir mayúsculas
+            "retry_after": resp.headers.get("Retry-After"),
+        },
+    )
+
+
+class AsyncDopplerRelayClient:
+    def __init__(self, *, api_key: str | None = None, base_url: str | None = None, auth_scheme: str | None = None,
+                 timeout: int | None = None, max_connections: int | None = None, max_keepalive: int | None = None):
+        cfg = settings.DOPPLER_RELAY
+        self.base_url = (base_url or cfg.get(
+            "BASE_URL", DEFAULT_BASE_URL)).rstrip("/") + "/"
+        self.timeout = timeout or cfg.get("TIMEOUT", 30)
+        auth_scheme = auth_scheme or cfg.get('AUTH_SCHEME', 'token')
+        api_key = api_key or cfg.get('API_KEY', '')
+
+        limits = httpx.Limits(
+            max_connections=max_connections or cfg.get("ASYNC_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS),
+            max_keepalive_connections=max_keepalive or cfg.get("ASYNC_MAX_KEEPALIVE", DEFAULT_MAX_KEEPALIVE),
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+        self.http = httpx.AsyncClient(
+            headers={
+                "Authorization": f"{auth_scheme} {api_key}",
+                "User-Agent": USER_AGENT,
+                "Accept": "application/json",
+            },
+            timeout=self.timeout,
+            limits=limits,
+        )
+
+    async def __aenter__(self) -> "AsyncDopplerRelayClient":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+    @property
+    def is_closed(self) -> bool:
+        return self.http.is_closed
+
+    def _url(self, path: str) -> str:
+        return urljoin(self.base_url, path.lstrip("/"))
+
+    async def _request(self, method: str, path: str, *, idempotency_key: str | None = None,
+                       retry_budget: RetryBudget | None = None, **kwargs) -> httpx.Response:
+        """Realiza una petición HTTP a la API de Doppler Relay (misma política que el cliente síncrono)."""
+        url = self._url(path)
+        policy = RetryPolicy.from_settings()
+        attempt = 0
+        last_error: Exception | None = None
+        if method == "POST":
+            kwargs["headers"] = {
+                **(kwargs.get("headers") or {}),
+                IDEMPOTENCY_HEADER: idempotency_key or uuid.uuid4().hex,
+            }
+        account = rate_limit.account_from_path(path)
+        limiter = rate_limit.get_limiter(account)
+        breaker = circuit_breaker.get_breaker(
+            account, circuit_breaker.endpoint_family(path))
+        started_call = time.monotonic()
+
+        while True:
+            attempt += 1
+            if not breaker.allow():
+                raise CircuitOpenError(
+                    f"Doppler Relay no disponible ({breaker.name}); "
+                    f"reintentar en {breaker.retry_in():.0f}s",
+                    payload={"circuit": breaker.snapshot(), "previous_error": str(last_error) if last_error else None},
+                )
+            try:
+                if limiter:
+                    # El bucket vive en el cache de Django (I/O síncrono)
+                    wait = await sync_to_async(limiter.reserve, thread_sensitive=False)()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                resp = await self.http.request(method, url, **kwargs)
+                if resp.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                _raise_for_response(resp)
+                return resp
+            except (httpx.HTTPError, DopplerRelayError) as e:
+                if isinstance(e, httpx.HTTPError):
+                    breaker.record_failure()
+                last_error = e
+                status = getattr(e, "status", None)
+                logger.warning(
+                    "Fallo petición async a Doppler Relay",
+                    extra={"method": method, "url": url, "attempt": attempt, "status": status, "error": str(e)},
+                )
+                if not policy.is_retryable(e):
+                    break
+                if status == 429:
+                    wait = _parse_retry_after((e.payload or {}).get("retry_after"))
+                else:
+                    wait = policy.backoff(attempt)
+                if not policy.allows(attempt, started_call, wait):
+                    break
+                if retry_budget is not None and not retry_budget.consume(wait):
+                    break
+                if status == 429 and limiter:
+                    await sync_to_async(limiter.penalize, thread_sensitive=False)(wait)
+                else:
+                    await asyncio.sleep(wait)
+            except BaseException:
+                # Error local o cancelación de la tarea: liberar la sonda half-open
+                breaker.release()
+                raise
+
+        if isinstance(last_error, DopplerRelayError):
+            raise last_error
+        raise DopplerRelayError(
+            f"Error después de {attempt} intentos: {str(last_error)}",
+            payload={
+                "original_error": str(last_error),
+                "error_type": type(last_error).__name__,
+            },
+        )
+
+    # --- Mensajes ---
+    async def send_message(self, account_id: int, from_email: str, subject: str, html: str | None = None, text: str | None = None,
+                           *, from_name: str | None = None, to: Iterable[tuple[str, str | None]] = (),
+                           cc: Iterable[tuple[str, str | None]] = (), bcc: Iterable[tuple[str, str | None]] = (),
+                           reply_to: str | None = None, headers: dict[str, str] | None = None,
+                           tags: list[str] | None = None, metadata: dict[str, Any] | None = None,
+                           attachments: list[tuple[str, bytes, str]] | None = None,
+                           idempotency_key: str | None = None) -> dict[str, Any]:
+        payload = build_message_payload(
+            from_email, subject, html, text, from_name=from_name, to=to, cc=cc, bcc=bcc,
+            reply_to=reply_to, headers=headers, tags=tags, metadata=metadata,
+            attachments=attachments)
+        resp = await self._request("POST", f"/accounts/{account_id}/messages", json=payload,
+                                   idempotency_key=idempotency_key)
+        data = resp.json()
+        data["_location"] = resp.headers.get("Location")
+        return data
+
+    async def send_template_message(self, account_id: int, template_id: str, recipients_model: dict[str, Any],
+                                    *, idempotency_key: str | None = None,
+                                    retry_budget: RetryBudget | None = None) -> dict[str, Any]:
+        """Equivalente async de ``DopplerRelayClient.send_template_message``."""
+        model = build_template_message(template_id, recipients_model)
+        resp = await self._request(
+            "POST",
+            f"/accounts/{str(account_id)}/templates/{str(template_id)}/message",
+            json=model,
+            idempotency_key=idempotency_key,
+            retry_budget=retry_budget,
+        )
+        result = resp.json()
+        result["_location"] = resp.headers.get("Location")
+        return template_send_result(model, result)
+
+    # --- Plantillas ---
+    async def list_templates(self, account_id: int) -> dict[str, Any]:
+        return (await self._request("GET", f"/accounts/{account_id}/templates")).json()
+
+    async def get_template(self, account_id: int, template_id: str) -> dict[str, Any]:
+        return (await self._request("GET", f"/accounts/{account_id}/templates/{template_id}")).json()
+
+    # --- Entregas & Eventos ---
+    async def list_deliveries(self, account_id: int, *, from_iso: str | None = None, to_iso: str | None = None, page_url: str | None = None) -> dict[str, Any]:
+        url = page_url or _window_path(
+            f"/accounts/{account_id}/deliveries", from_iso, to_iso)
+        return (await self._request("GET", url)).json()
+
+    async def list_events(self, account_id: int, *, from_iso: str | None = None, to_iso: str | None = None, page_url: str | None = None) -> dict[str, Any]:
+        url = page_url or _window_path(
+            f"/accounts/{account_id}/events", from_iso, to_iso)
+        return (await self._request("GET", url)).json()
+
+    async def paginate(self, first_page: dict[str, Any]) -> AsyncIterator[dict[str, Any]]:
+        """Recorre las páginas siguiendo ``next_link`` a partir de una página ya obtenida."""
+        page: dict[str, Any] | None = first_page
+        while page is not None:
+            yield page
+            href = self.next_link(page)
+            page = (await self._request("GET", href)).json() if href else None
+
+    next_link = staticmethod(DopplerRelayClient.next_link)
+
+
+# Un cliente por event loop: las conexiones de httpx no se comparten entre loops
+_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncDopplerRelayClient]" = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> AsyncDopplerRelayClient:
+    """Cliente compartido (keep-alive) para el event loop en ejecución."""
+    loop = asyncio.get_running_loop()
+    client = _CLIENTS.get(loop)
+    if client is None or client.is_closed:
+        client = AsyncDopplerRelayClient()
+        _CLIENTS[loop] = client
+    return client
@@ -0,0 +1,394 @@
+"""Servidor HTTP local que imita la API de Doppler Relay (pruebas de carga y benchmarks).
+
+Cubre los endpoints que usa el proyecto:
+
+- ``POST /accounts/{id}/templates/{tid}/message`` y ``POST /accounts/{id}/messages``
+  (respetan ``Idempotency-Key``: repetir la clave no duplica el envío);
+- ``GET /accounts/{id}/messages[/{mid}]``;
+- CRUD de ``/accounts/{id}/templates``;
+- ``GET /accounts/{id}/deliveries``, ``/events`` (paginados con ``_links`` ``next``)
+  y ``/deliveries/aggregation``;
+- ``/reports/reportrequest``: crear, consultar estado y descargar el CSV
+  (formato summary, el mismo que carga ``reports.services.loader``).
+
+La latencia, la tasa de errores 5xx, las respuestas 429/402 y la demora de
+procesamiento de reportes se configuran con :class:`FakeRelayConfig`. Todo el
+estado vive en memoria y los valores aleatorios salen de ``seed``, así una misma
+corrida es reproducible. Uso::
+
+    python manage.py fake_relay --port 8765 --latency 0.05 --rate-limit-rate 0.02
+    DOPPLER_RELAY_BASE_URL=http://127.0.0.1:8765/ python manage.py run_jobs
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import logging
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+from urllib.parse import parse_qs, urlencode, urlparse
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_HEADERS = ["Subject", "Sender", "SenderName", "Email", "Status", "Date", "Opens", "Clicks"]
+# Estados del CSV por tipo de reporte (``deliveries``/``sent`` incluyen todo)
+REPORT_STATUSES = {"bounces": {"bounced"}, "spam": {"spam"}, "unsubscribed": {"unsubscribed"},
+                   "opens": {"opened"}, "clicks": {"clicked"}}
+
+
+@dataclass
+class FakeRelayConfig:
+    latency: float = 0.0            # segundos fijos por petición
+    jitter: float = 0.0             # segundos aleatorios adicionales (0..jitter)
+    error_rate: float = 0.0         # fracción de respuestas 503
+    rate_limit_rate: float = 0.0    # fracción de respuestas 429
+    retry_after: float = 1.0        # header Retry-After de los 429
+    quota: int = 0                  # destinatarios aceptados antes de responder 402 (0 = sin límite)
+    bounce_rate: float = 0.0        # fracción de entregas que rebotan
+    report_delay: float = 0.0       # segundos hasta que un reporte queda procesado
+    report_rows: int = 0            # filas sintéticas extra por reporte (ingesta de volumen)
+    page_size: int = 100
+    seed: int = 0
+    templates: int = 1              # plantillas precargadas ("Hola {{nombre}}")
+
+
+@dataclass
+class FakeRelayState:
+    config: FakeRelayConfig
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    templates: dict[str, dict[str, Any]] = field(default_factory=dict)
+    messages: dict[str, dict[str, Any]] = field(default_factory=dict)
+    deliveries: list[dict[str, Any]] = field(default_factory=list)
+    events: list[dict[str, Any]] = field(default_factory=list)
+    reports: dict[str, dict[str, Any]] = field(default_factory=dict)
+    idempotent: dict[str, tuple[int, dict[str, Any], dict[str, str]]] = field(default_factory=dict)
+    accepted: int = 0
+    requests: int = 0
+    _next_id: int = 1000
+
+    def __post_init__(self) -> None:
+        self.random = random.Random(self.config.seed)
+        for n in range(1, self.config.templates + 1):
+            self.templates[str(n)] = {
+                "id": str(n), "name": f"Plantilla {n}", "subject": "Hola {{nombre}}",
+                "from_email": "demo@example.com", "from_name": "Demo",
+                "htmlContent": "<p>Hola {{nombre}}</p>",
+            }
+
+    def new_id(self) -> str:
+        self._next_id += 1
+        return str(self._next_id)
+
+
+Response = tuple[int, Any, dict[str, str]]
+
+
+def _now() -> datetime:
+    return datetime.now(dt_timezone.utc)
+
+
+def _page(state: FakeRelayState, items: list[dict[str, Any]], path: str, query: dict[str, str]) -> Response:
+    size = state.config.page_size
+    page = max(0, int(query.get("page") or 0))
+    body: dict[str, Any] = {"items": items[page * size:(page + 1) * size], "_links": []}
+    if (page + 1) * size < len(items):
+        body["_links"].append({"rel": "next", "href": f"{path}?{urlencode({**query, 'page': page + 1})}"})
+    return 200, body, {}
+
+
+def _in_window(items: list[dict[str, Any]], query: dict[str, str], key: str = "date") -> list[dict[str, Any]]:
+    # Fechas ISO en UTC: se comparan como texto
+    start = _to_utc_iso(query["from"]) if query.get("from") else None
+    end = _to_utc_iso(query["to"]) if query.get("to") else None
+    return [i for i in items if (not start or i[key] >= start) and (not end or i[key] <= end)]
+
+
+def _record_send(state: FakeRelayState, account: str, model: dict[str, Any], template_id: str | None) -> Response:
+    recipients = [r for r in model.get("recipients") or [] if r.get("email")]
+    if not recipients:
+        return 400, {"title": "Validation error", "detail": "recipients es requerido"}, {}
+    if template_id is not None and template_id not in state.templates:
+        return 404, {"title": "Not found", "detail": f"Plantilla {template_id} inexistente"}, {}
+    with state.lock:
+        if state.config.quota and state.accepted + len(recipients) > state.config.quota:
+            return 402, {"title": "Payment required", "detail": "Cuota de envíos agotada"}, {}
+        state.accepted += len(recipients)
+        message_id = state.new_id()
+        now = _now().isoformat()
+        subject = model.get("subject") or (state.templates.get(template_id or "", {}).get("subject") or "")
+        state.messages[message_id] = {"id": message_id, "template_id": template_id, "subject": subject,
+                                      "from_email": model.get("from_email"), "from_name": model.get("from_name"),
+                                      "recipients": [r["email"] for r in recipients], "date": now}
+        for r in recipients:
+            bounced = state.random.random() < state.config.bounce_rate
+            delivery = {"id": state.new_id(), "message_id": message_id, "email": r["email"],
+                        "status": "bounced" if bounced else "delivered", "subject": subject,
+                        "sender": model.get("from_email") or "", "sender_name": model.get("from_name") or "",
+                        "date": now}
+            state.deliveries.append(delivery)
+            state.events.append({"id": state.new_id(), "type": "hard_bounce" if bounced else "delivered",
+                                 "email": r["email"], "message_id": message_id, "date": now})
+    location = f"/accounts/{account}/messages/{message_id}"
+    return 201, {"createdResourceId": message_id, "_links": [{"rel": "/docs/rels/get-message", "href": location}]}, \
+        {"Location": location}
+
+
+def _report_csv(state: FakeRelayState, report: dict[str, Any]) -> bytes:
+    statuses = REPORT_STATUSES.get(report["resource"])
+    with state.lock:
+        rows = [d for d in state.deliveries if report["start"] <= d["date"] <= report["end"]
+                and (statuses is None or d["status"] in statuses)]
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(SUMMARY_HEADERS)
+    for d in rows:
+        # Mismo formato de fecha que el CSV de Doppler (UTC con "Z")
+        event_at = datetime.fromisoformat(d["date"]).strftime("%Y-%m-%dT%H:%M:%SZ")
+        writer.writerow([d["subject"], d["sender"], d["sender_name"], d["email"], d["status"].capitalize(),
+                         event_at, 0, 0])
+    rnd = random.Random(f"{state.config.seed}-{report['id']}")
+    status = next(iter(statuses)).capitalize() if statuses else "Delivered"
+    for n in range(state.config.report_rows):
+        writer.writerow(["Carga", "demo@example.com", "Demo", f"user{n}@example.com", status,
+                         datetime.fromisoformat(report["start"]).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                         rnd.randint(0, 3), rnd.randint(0, 1)])
+    return out.getvalue().encode("utf-8")
+
+
+# --- Rutas ---
+
+def _send_template(state, m, query, body):
+    return _record_send(state, m["account"], body, m["template"])
+
+
+def _send_message(state, m, query, body):
+    return _record_send(state, m["account"], body, None)
+
+
+def _list_messages(state, m, query, body):
+    with state.lock:
+        items = list(state.messages.values())
+    return _page(state, items, m.group(0), query)
+
+
+def _get_message(state, m, query, body):
+    message = state.messages.get(m["id"])
+    return (200, message, {}) if message else (404, {"title": "Not found"}, {})
+
+
+def _list_templates(state, m, query, body):
+    with state.lock:
+        items = list(state.templates.values())
+    return 200, {"items": items, "itemsCount": len(items)}, {}
+
+
+def _create_template(state, m, query, body):
+    with state.lock:
+        template_id = state.new_id()
+        state.templates[template_id] = {
+            "id": template_id, "name": body.get("name"), "subject": body.get("subject"),
+            "from_email": body.get("from_email"), "from_name": body.get("from_name"),
+            "htmlContent": body.get("body") or ""}
+    location = f"/accounts/{m['account']}/templates/{template_id}"
+    return 201, {"createdResourceId": template_id}, {"Location": location}
+
+
+def _get_template(state, m, query, body):
+    template = state.templates.get(m["template"])
+    return (200, template, {}) if template else (404, {"title": "Not found"}, {})
+
+
+def _update_template(state, m, query, body):
+    with state.lock:
+        template = state.templates.get(m["template"])
+        if template is None:
+            return 404, {"title": "Not found"}, {}
+        for key in ("name", "subject", "from_email", "from_name"):
+            if key in body:
+                template[key] = body[key]
+        if "body" in body:
+            template["htmlContent"] = body["body"]
+    return 200, {"message": "Plantilla actualizada"}, {}
+
+
+def _delete_template(state, m, query, body):
+    with state.lock:
+        found = state.templates.pop(m["template"], None)
+    return (204, None, {}) if found else (404, {"title": "Not found"}, {})
+
+
+def _list_deliveries(state, m, query, body):
+    with state.lock:
+        items = _in_window(state.deliveries, query)
+    return _page(state, items, m.group(0), query)
+
+
+def _aggregation(state, m, query, body):
+    counts: dict[str, int] = {}
+    with state.lock:
+        for d in _in_window(state.deliveries, query):
+            counts[d["status"]] = counts.get(d["status"], 0) + 1
+    return 200, {"total": sum(counts.values()), **counts}, {}
+
+
+def _list_events(state, m, query, body):
+    with state.lock:
+        items = _in_window(state.events, query)
+    return _page(state, items, m.group(0), query)
+
+
+def _create_report(state, m, query, body):
+    resource = str(body.get("resource") or "").lower()
+    if not resource or not body.get("start_date") or not body.get("end_date"):
+        return 400, {"title": "Validation error", "detail": "resource, start_date y end_date son requeridos"}, {}
+    with state.lock:
+        report_id = state.new_id()
+        state.reports[report_id] = {
+            "id": report_id, "resource": resource, "created": time.monotonic(),
+            "start": _to_utc_iso(body["start_date"]), "end": _to_utc_iso(body["end_date"])}
+    location = f"/reports/reportrequest?reportRequestId={report_id}"
+    return 201, {"createdResourceId": report_id}, {"Location": location}
+
+
+def _get_report(state, m, query, body):
+    report = state.reports.get(query.get("reportRequestId") or "")
+    if report is None:
+        return 404, {"title": "Not found"}, {}
+    if time.monotonic() - report["created"] < state.config.report_delay:
+        return 200, {"reportRequestId": report["id"], "processed": False}, {}
+    if query.get("format") == "csv":
+        return 200, _report_csv(state, report), {"Content-Type": "text/csv; charset=utf-8"}
+    return 200, {"reportRequestId": report["id"], "processed": True}, {}
+
+
+def _to_utc_iso(value: str) -> str:
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return str(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    return parsed.astimezone(dt_timezone.utc).isoformat()
+
+
+_ACCOUNT = r"/accounts/(?P<account>[^/]+)"
+ROUTES: list[tuple[str, re.Pattern, Callable[..., Response]]] = [
+    ("POST", re.compile(_ACCOUNT + r"/templates/(?P<template>[^/]+)/message$"), _send_template),
+    ("POST", re.compile(_ACCOUNT + r"/messages$"), _send_message),
+    ("GET", re.compile(_ACCOUNT + r"/messages$"), _list_messages),
+    ("GET", re.compile(_ACCOUNT + r"/messages/(?P<id>[^/]+)$"), _get_message),
+    ("GET", re.compile(_ACCOUNT + r"/templates$"), _list_templates),
+    ("POST", re.compile(_ACCOUNT + r"/templates$"), _create_template),
+    ("GET", re.compile(_ACCOUNT + r"/templates/(?P<template>[^/]+)$"), _get_template),
+    ("PUT", re.compile(_ACCOUNT + r"/templates/(?P<template>[^/]+)$"), _update_template),
+    ("DELETE", re.compile(_ACCOUNT + r"/templates/(?P<template>[^/]+)$"), _delete_template),
+    ("GET", re.compile(_ACCOUNT + r"/deliveries/aggregation$"), _aggregation),
+    ("GET", re.compile(_ACCOUNT + r"/deliveries$"), _list_deliveries),
+    ("GET", re.compile(_ACCOUNT + r"/events$"), _list_events),
+    ("POST", re.compile(r"/reports/reportrequest$"), _create_report),
+    ("GET", re.compile(r"/reports/reportrequest$"), _get_report),
+]
+
+
+class FakeRelayHandler(BaseHTTPRequestHandler):
+    server: "FakeRelayServer"
+    protocol_version = "HTTP/1.1"  # keep-alive, como la API real
+
+    def _handle(self, method: str) -> None:
+        state = self.server.state
+        cfg = state.config
+        parsed = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        with state.lock:
+            state.requests += 1
+            roll = state.random.random()
+            wait = cfg.latency + (state.random.uniform(0, cfg.jitter) if cfg.jitter else 0.0)
+        if wait:
+            time.sleep(wait)
+
+        if roll < cfg.error_rate:
+            return self._reply(503, {"title": "Service unavailable"}, {})
+        if roll < cfg.error_rate + cfg.rate_limit_rate:
+            return self._reply(429, {"title": "Too many requests"}, {"Retry-After": f"{cfg.retry_after:g}"})
+
+        key = self.headers.get("Idempotency-Key") if method == "POST" else None
+        if key:
+            with state.lock:
+                cached = state.idempotent.get(key)
+            if cached is not None:
+                return self._reply(*cached)
+
+        for route_method, pattern, handler in ROUTES:
+            match = pattern.match(parsed.path)
+            if route_method == method and match:
+                try:
+                    body = json.loads(raw) if raw else {}
+                except ValueError:
+                    return self._reply(400, {"title": "JSON inválido"}, {})
+                response = handler(state, match, query, body)
+                if key and response[0] < 300:
+                    with state.lock:
+                        state.idempotent[key] = response
+                return self._reply(*response)
+        self._reply(404, {"title": "Not found", "detail": f"{method} {parsed.path}"}, {})
+
+    def _reply(self, status: int, body: Any, headers: dict[str, str]) -> None:
+        if isinstance(body, bytes):
+            payload = body
+        elif body is None:
+            payload = b""
+        else:
+            payload = json.dumps(body).encode("utf-8")
+            headers = {"Content-Type": "application/json", **headers}
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self) -> None:
+        self._handle("GET")
+
+    def do_POST(self) -> None:
+        self._handle("POST")
+
+    def do_PUT(self) -> None:
+        self._handle("PUT")
+
+    def do_DELETE(self) -> None:
+        self._handle("DELETE")
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("fake_relay %s - %s", self.address_string(), format % args)
+
+
+class FakeRelayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], config: FakeRelayConfig | None = None):
+        super().__init__(address, FakeRelayHandler)
+        self.state = FakeRelayState(config or FakeRelayConfig())
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+
+def start_in_thread(config: FakeRelayConfig | None = None, *, host: str = "127.0.0.1",
+                    port: int = 0) -> FakeRelayServer:
+    """Levanta el servidor en un hilo (``port=0`` elige uno libre); detener con ``shutdown()``."""
+    server = FakeRelayServer((host, port), config)
+    threading.Thread(target=server.serve_forever, name="fake-relay", daemon=True).start()
+    return server
+
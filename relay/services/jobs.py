@@ -0,0 +1,216 @@
+"""Cola de trabajos persistente en base de datos (PostgreSQL o SQLite).
+
+Las acciones del admin encolan un :class:`~relay.models.Job` en lugar de lanzar
+un hilo dentro del worker web; ``manage.py run_jobs`` los ejecuta con un pool
+acotado. Un trabajo se toma con ``SELECT ... FOR UPDATE SKIP LOCKED``, renueva
+``locked_at`` mientras corre y, si el worker muere, vuelve a tomarse cuando el
+lease vence. Los errores se reintentan con backoff exponencial hasta
+``max_attempts``; después el trabajo queda ``dead`` para revisión manual.
+
+Tipos de trabajo (``HANDLERS``):
+
+- ``bulk_send``: ``{"bulk_id": n, "resume": bool}`` → ``process_bulk_id``. El
+  envío se toma con ``claim_bulk`` (si el scheduler ya lo tomó o terminó, el
+  trabajo no hace nada) y su ``heartbeat_at`` se renueva mientras corre. Un
+  envío que termina en ``error`` hace fallar el trabajo; los reintentos
+  reanudan desde el checkpoint del envío.
+- ``bulk_preflight``: ``{"bulk_id": n}`` → ``run_preflight`` (pre-validación
+  del archivo de destinatarios).
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import socket
+import threading
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from relay.models import BulkSend, Job
+from relay.services.bulk_processing import process_bulk_id
+from relay.services.bulk_scheduler import Heartbeat, claim_bulk
+from relay.services.preflight import run_preflight
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_RETRY_DELAY = 30
+
+
+def _config() -> dict[str, Any]:
+    cfg = getattr(settings, "DOPPLER_RELAY", {}) or {}
+    return cfg.get("JOBS", {}) or {}
+
+
+def _lease_seconds() -> int:
+    return int(_config().get("LEASE_SECONDS", DEFAULT_LEASE_SECONDS))
+
+
+def _run_bulk_send(job: Job) -> None:
+    payload = job.payload or {}
+    bulk_id = int(payload["bulk_id"])
+    # Un reintento continúa desde el último checkpoint en vez de reenviar todo
+    resume = bool(payload.get("resume")) or job.attempts > 1
+    lease = _lease_seconds()
+    if not claim_bulk(bulk_id, resume=resume, lease_seconds=lease, source="Queue"):
+        logger.info("Job %s: BulkSend %s ya fue tomado o no está en un estado procesable", job.pk, bulk_id)
+        return
+    try:
+        # Renueva también el lease del envío para que el daemon no lo retome en paralelo
+        with Heartbeat(BulkSend, bulk_id, max(1.0, lease / 3)):
+            process_bulk_id(bulk_id, resume=resume)
+    except Exception as exc:
+        bulk = BulkSend.objects.get(pk=bulk_id)
+        bulk.status = "error"
+        bulk.log = ((bulk.log or "") + f"\n[Queue] Error: {exc}").strip()
+        bulk.save(update_fields=["status", "log"])
+        raise
+    bulk = BulkSend.objects.get(pk=bulk_id)
+    if bulk.status == "error" and (bulk.preflight or {}).get("status") != "failed":
+        # process_bulk_id guarda el error en el envío; el trabajo debe fallar para reintentar
+        try:
+            reason = json.loads(bulk.result or "{}")
+        except ValueError:
+            reason = {}
+        raise RuntimeError(f"BulkSend {bulk_id} terminó en error: "
+                           f"{reason.get('error_message') or reason.get('error') or 'ver log del envío'}")
+
+
+def _run_bulk_preflight(job: Job) -> None:
+    run_preflight(int((job.payload or {})["bulk_id"]))
+
+
+HANDLERS: dict[str, Callable[[Job], None]] = {
+    "bulk_send": _run_bulk_send,
+    "bulk_preflight": _run_bulk_preflight,
+}
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(kind: str, payload: dict[str, Any] | None = None, *, max_attempts: int | None = None,
+            run_after: datetime | None = None) -> Job:
+    if kind not in HANDLERS:
+        raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+    return Job.objects.create(
+        kind=kind,
+        payload=payload or {},
+        max_attempts=max_attempts or int(_config().get("MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)),
+        run_after=run_after or timezone.now(),
+    )
+
+
+def active_job(kind: str, **payload: Any) -> Job | None:
+    """Trabajo en cola o en ejecución con ese payload (para no encolar duplicados)."""
+    qs = Job.objects.filter(kind=kind, status__in=[Job.QUEUED, Job.RUNNING])
+    for key, value in payload.items():
+        qs = qs.filter(**{f"payload__{key}": value})
+    return qs.first()
+
+
+def enqueue_bulk_send(bulk: BulkSend, *, resume: bool = False, source: str = "admin") -> Job | None:
+    """Encola el procesamiento de un BulkSend; ``None`` si ya tiene un trabajo activo."""
+    if active_job("bulk_send", bulk_id=bulk.pk) is not None:
+        return None
+    job = enqueue("bulk_send", {"bulk_id": bulk.pk, "resume": resume})
+    action = "Reanudación" if resume else "Envío"
+    bulk.log = ((bulk.log or "") + f"\n[Queue] {action} encolado desde {source} (job {job.pk})").strip()
+    bulk.save(update_fields=["log"])
+    return job
+
+
+def claim(lease_seconds: int | None = None, *, now: datetime | None = None) -> Job | None:
+    """Toma el próximo trabajo listo (o uno cuyo lease venció); ``None`` si no hay."""
+    now = now or timezone.now()
+    lease = lease_seconds or _lease_seconds()
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.QUEUED, run_after__lte=now)
+            .order_by("run_after", "id")
+            .first()
+        )
+        if job is None:
+            job = (
+                Job.objects.select_for_update(skip_locked=True)
+                .filter(status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=lease))
+                .order_by("locked_at")
+                .first()
+            )
+        if job is None:
+            return None
+        job.status = Job.RUNNING
+        job.attempts += 1
+        job.locked_at = now
+        job.locked_by = worker_name()
+        job.save(update_fields=["status", "attempts", "locked_at", "locked_by", "updated_at"])
+        return job
+
+
+def run_job(job: Job, *, lease_seconds: int | None = None) -> None:
+    """Ejecuta un trabajo ya tomado y registra el resultado (reintento o dead-letter)."""
+    lease = lease_seconds or _lease_seconds()
+    try:
+        with Heartbeat(Job, job.pk, max(1.0, lease / 3), field="locked_at"):
+            HANDLERS[job.kind](job)
+    except Exception as exc:
+        job.last_error = f"{exc}\n{traceback.format_exc()}"
+        job.locked_at = job.locked_by = None
+        if job.attempts >= job.max_attempts:
+            job.status = Job.DEAD
+            logger.error("Job %s (%s) sin más reintentos: %s", job.pk, job.kind, exc)
+        else:
+            delay = int(_config().get("RETRY_DELAY", DEFAULT_RETRY_DELAY)) * 2 ** (job.attempts - 1)
+            job.status = Job.QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+            logger.warning("Job %s (%s) falló (intento %d/%d), reintento en %ds: %s",
+                           job.pk, job.kind, job.attempts, job.max_attempts, delay, exc)
+    else:
+        job.status = Job.DONE
+        job.locked_at = job.locked_by = None
+    job.save(update_fields=["status", "last_error", "locked_at", "locked_by", "run_after", "updated_at"])
+
+
+def _run_in_worker(job: Job, lease_seconds: int | None) -> None:
+    close_old_connections()
+    try:
+        run_job(job, lease_seconds=lease_seconds)
+    finally:
+        connection.close()
+
+
+def run_worker(*, workers: int, poll_seconds: float = 5.0, lease_seconds: int | None = None,
+               stop: threading.Event | None = None, once: bool = False) -> int:
+    """Ejecuta trabajos con hasta ``workers`` hilos hasta ``stop`` (o hasta vaciar la cola con ``once``).
+
+    Devuelve la cantidad de trabajos tomados.
+    """
+    stop = stop or threading.Event()
+    running: set[Future] = set()
+    taken = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job-worker") as pool:
+        while not stop.is_set():
+            running = {f for f in running if not f.done()}
+            job = None
+            if len(running) < workers:
+                close_old_connections()
+                job = claim(lease_seconds)
+            if job is not None:
+                taken += 1
+                logger.info("Job %s (%s) tomado, intento %d", job.pk, job.kind, job.attempts)
+                running.add(pool.submit(_run_in_worker, job, lease_seconds))
+                continue
+            if once and not running:
+                break
+            stop.wait(1.0 if running else poll_seconds)
+    return taken
@@ -0,0 +1,118 @@
+"""Iteración perezosa de listados paginados de Doppler Relay.
+
+:class:`PageIterator` entrega los ítems de una página a la vez y, mientras se
+consume la actual, descarga la siguiente en un hilo (una sola página en vuelo),
+de modo que la latencia de red se solapa con el procesamiento y la memoria
+queda acotada a dos páginas.
+
+``cursor`` es un dict serializable (``{"page": url, "offset": n}``) que permite
+retomar exactamente desde el siguiente ítem no entregado::
+
+    it = client.iter_events(account_id, from_iso=desde)
+    for event in it:
+        procesar(event)
+        guardar(it.cursor)
+    ...
+    it = client.iter_events(account_id, cursor=cursor_guardado)
+"""
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterator
+
+ITEM_KEYS = ("items", "data", "results")
+
+
+def next_link(data: dict[str, Any]) -> str | None:
+    links = data.get("_links") or data.get("links") or []
+    for item in links:
+        if (item.get("rel") or "").endswith("next") or item.get("rel") == "next":
+            return item.get("href")
+    return None
+
+
+def page_items(page: dict[str, Any]) -> list[Any]:
+    for key in ITEM_KEYS:
+        value = page.get(key)
+        if isinstance(value, list):
+            return value
+    return []
+
+
+class PageIterator(Iterator[Any]):
+    def __init__(self, fetch: Callable[[str], dict[str, Any]], first_url: str, *,
+                 cursor: dict[str, Any] | None = None, prefetch: bool = True):
+        self._fetch = fetch
+        self._url = (cursor or {}).get("page") or first_url
+        self._offset = int((cursor or {}).get("offset") or 0)
+        self._items: list[Any] | None = None
+        self._next_url: str | None = None
+        self._pending: Future | None = None
+        # El hilo de prefetch se crea con la primera página siguiente y se libera en close()
+        self._prefetch = prefetch
+        self._executor: ThreadPoolExecutor | None = None
+        self._done = False
+        self.pages = 0
+
+    @property
+    def cursor(self) -> dict[str, Any] | None:
+        """Posición para retomar (``None`` si el listado se recorrió completo)."""
+        if self._done and not self._url:
+            return None
+        return {"page": self._url, "offset": self._offset}
+
+    def __iter__(self) -> "PageIterator":
+        return self
+
+    def __next__(self) -> Any:
+        while not self._done:
+            if self._items is None:
+                try:
+                    page = self._take_page()
+                except BaseException:
+                    # El cursor sigue apuntando a la página que falló
+                    self.close()
+                    raise
+                self._items = page_items(page)
+                self._next_url = next_link(page)
+                self.pages += 1
+                if self._next_url and self._prefetch:
+                    if self._executor is None:
+                        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="relay-page")
+                    self._pending = self._executor.submit(self._fetch, self._next_url)
+            if self._offset < len(self._items):
+                item = self._items[self._offset]
+                self._offset += 1
+                return item
+            if not self._next_url:
+                self._url = None
+                self.close()
+                break
+            self._url, self._offset, self._items = self._next_url, 0, None
+        raise StopIteration
+
+    def _take_page(self) -> dict[str, Any]:
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            return pending.result()
+        return self._fetch(self._url)
+
+    def close(self) -> None:
+        self._done = True
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def __del__(self) -> None:
+        # Iteración abandonada sin close(): liberar el hilo de prefetch
+        if getattr(self, "_executor", None) is not None:
+            self.close()
+
+    def __enter__(self) -> "PageIterator":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
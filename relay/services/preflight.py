@@ -0,0 +1,124 @@
+"""Pre-validación (preflight) del archivo de destinatarios de un BulkSend.
+
+Se encola como trabajo ``bulk_preflight`` al guardar un ``BulkSend`` con un
+archivo nuevo y recorre el CSV una sola vez en streaming:
+
+- la cobertura de columnas contra las variables de la plantilla se revisa una
+  vez por archivo (encabezados), no por fila;
+- por fila solo se valida el email (regex precompilada) y que tengan valor las
+  columnas mapeadas o, sin mapeo, las de las variables requeridas.
+
+El resultado queda en ``bulk.preflight`` (contadores) y las filas inválidas en
+``bulk.preflight_file`` (CSV ``linea,email,motivo``). Si faltan columnas o no
+hay columna de email el estado es ``failed`` y ``process_bulk_id`` no envía.
+"""
+from __future__ import annotations
+
+import csv
+import logging
+import tempfile
+from typing import Any
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from relay.models import BulkSend, Job
+from relay.services.bulk_processing import _email_column, _variables_mapping, read_csv_rows
+from relay.services.template_cache import get_template_metadata
+from relay.views import validate_email
+
+logger = logging.getLogger(__name__)
+
+OK = "ok"
+WARNINGS = "warnings"
+FAILED = "failed"
+
+
+def enqueue_preflight(bulk_id: int) -> Job | None:
+    """Encola la pre-validación de un envío; ``None`` si ya hay una activa."""
+    from relay.services.jobs import active_job, enqueue
+
+    if active_job("bulk_preflight", bulk_id=bulk_id) is not None:
+        return None
+    return enqueue("bulk_preflight", {"bulk_id": bulk_id})
+
+
+def _required_vars(template_id: str) -> set[str]:
+    try:
+        account_id = settings.DOPPLER_RELAY.get("ACCOUNT_ID", 0)
+        return set(get_template_metadata(account_id, template_id).get("variables", []) or [])
+    except Exception:
+        return set()
+
+
+def check_rows(stream, *, variables_mapping: dict[str, str], required_vars: set[str], invalid_writer) -> dict[str, Any]:
+    """Recorre el CSV una vez y devuelve los contadores del preflight.
+
+    ``invalid_writer`` es un ``csv.writer`` que recibe ``(linea, email, motivo)``
+    por cada fila inválida.
+    """
+    headers, rows = read_csv_rows(stream)
+    email_col = _email_column(headers)
+
+    # Cobertura de columnas: una vez por archivo
+    if variables_mapping:
+        mapped_columns = {col.lower() for col in variables_mapping.values()}
+        missing_columns = sorted(mapped_columns - set(headers))
+        per_row_vars = sorted(mapped_columns & set(headers))
+    else:
+        missing_columns = sorted(v for v in required_vars if v.lower() not in headers)
+        per_row_vars = sorted(v.lower() for v in required_vars if v.lower() in headers)
+
+    stats = {"total": 0, "valid": 0, "invalid_email": 0, "missing_values": 0, "skipped": 0,
+             "missing_columns": missing_columns}
+    for line, row in enumerate(rows, start=2):
+        email = row.get(email_col) or ""
+        if not email:
+            stats["skipped"] += 1
+            continue
+        stats["total"] += 1
+        if not validate_email(email):
+            stats["invalid_email"] += 1
+            invalid_writer.writerow([line, email, "email inválido"])
+            continue
+        empty = [v for v in per_row_vars if not row.get(v)]
+        if empty:
+            stats["missing_values"] += 1
+            invalid_writer.writerow([line, email, f"faltan variables: {', '.join(empty)}"])
+            continue
+        stats["valid"] += 1
+    return stats
+
+
+def run_preflight(bulk_id: int) -> dict[str, Any]:
+    bulk = BulkSend.objects.get(pk=bulk_id)
+    result: dict[str, Any]
+    with tempfile.TemporaryFile("w+", encoding="utf-8", newline="") as tmp:
+        writer = csv.writer(tmp)
+        writer.writerow(["linea", "email", "motivo"])
+        try:
+            with bulk.recipients_file.open("rb") as stream:
+                result = check_rows(stream, variables_mapping=_variables_mapping(bulk),
+                                    required_vars=_required_vars(bulk.template_id), invalid_writer=writer)
+        except Exception as exc:
+            result = {"status": FAILED, "error": str(exc)}
+        else:
+            if result["missing_columns"] or not result["valid"]:
+                result["status"] = FAILED
+            elif result["invalid_email"] or result["missing_values"]:
+                result["status"] = WARNINGS
+            else:
+                result["status"] = OK
+            if result["invalid_email"] or result["missing_values"]:
+                tmp.seek(0)
+                if bulk.preflight_file:
+                    bulk.preflight_file.delete(save=False)
+                bulk.preflight_file.save(f"bulk_{bulk.pk}_invalid.csv", File(tmp), save=False)
+    result["checked_at"] = timezone.now().isoformat()
+    bulk.preflight = result
+    bulk.log = ((bulk.log or "") + f"\n[Preflight] {result['status']}: {result.get('valid', 0)} válidos"
+                f" de {result.get('total', 0)}").strip()
+    bulk.save(update_fields=["preflight", "preflight_file", "log"])
+    logger.info("Preflight BulkSend %s: %s", bulk.pk, result["status"])
+    return result
@@ -0,0 +1,159 @@
+"""Token bucket por cuenta de Doppler Relay compartido vía cache de Django.
+
+El estado del bucket vive en el cache configurado (``RATE_LIMIT['CACHE_ALIAS']``),
+de modo que el scheduler, los hilos del admin y los workers web comparten el
+mismo ritmo cuando el backend es compartido (DatabaseCache, Redis, Memcached).
+Con el ``LocMemCache`` por defecto el límite aplica por proceso.
+
+Cada llamada reserva un token; si el bucket está en deuda se devuelve la espera
+necesaria y el llamador duerme (``time.sleep`` o ``asyncio.sleep``). Un 429 bloquea
+la cuenta hasta ``Retry-After`` y reduce el ritmo a la mitad; el ritmo se recupera
+linealmente hasta el configurado en ``RECOVERY_SECONDS``.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = "relay:ratelimit"
+LOCK_TIMEOUT = 5
+LOCK_WAIT = 0.005
+DEFAULT_RECOVERY_SECONDS = 60.0
+MIN_RATE_FRACTION = 0.05
+
+_ACCOUNT_RE = re.compile(r"/accounts/([^/?#]+)")
+
+
+def account_from_path(path: str) -> str:
+    """Cuenta a la que apunta un path/URL de la API (``global`` si no tiene)."""
+    match = _ACCOUNT_RE.search(path or "")
+    return match.group(1) if match else "global"
+
+
+def _cfg() -> dict[str, Any]:
+    return (getattr(settings, "DOPPLER_RELAY", {}) or {}).get("RATE_LIMIT") or {}
+
+
+def configured_rate(account_id: Any) -> float:
+    """Peticiones/segundo configuradas para la cuenta (0 = sin límite)."""
+    rate = _cfg().get("RATE", 0)
+    if isinstance(rate, dict):
+        rate = rate.get(str(account_id), rate.get("default", 0))
+    try:
+        return max(float(rate or 0), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class TokenBucket:
+    def __init__(self, account_id: Any, rate: float, *, burst: int | None = None,
+                 cache_alias: str | None = None, recovery_seconds: float | None = None):
+        cfg = _cfg()
+        self.account_id = str(account_id)
+        self.max_rate = float(rate)
+        self.burst = max(int(burst or cfg.get("BURST") or 0) or int(self.max_rate) or 1, 1)
+        self.recovery_seconds = float(
+            recovery_seconds or cfg.get("RECOVERY_SECONDS", DEFAULT_RECOVERY_SECONDS))
+        self.cache = caches[cache_alias or cfg.get("CACHE_ALIAS", "default")]
+        self.key = f"{CACHE_PREFIX}:{self.account_id}"
+        self.lock_key = f"{self.key}:lock"
+
+    # --- estado compartido ---
+    @contextmanager
+    def _locked(self):
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        acquired = True
+        while not self.cache.add(self.lock_key, token, LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                # Lock huérfano (proceso muerto): seguimos sin él
+                acquired = False
+                break
+            time.sleep(LOCK_WAIT)
+        try:
+            yield
+        finally:
+            # Solo se libera el lock propio: si no se tomó o ya expiró y lo tiene otro, no se toca
+            if acquired and self.cache.get(self.lock_key) == token:
+                self.cache.delete(self.lock_key)
+
+    def _load(self, now: float) -> dict[str, float]:
+        state = self.cache.get(self.key)
+        if not isinstance(state, dict):
+            return {"tokens": float(self.burst), "ts": now, "rate": self.max_rate, "blocked_until": 0.0}
+        elapsed = max(now - state["ts"], 0.0)
+        rate = min(self.max_rate, state["rate"] + self.max_rate * elapsed / self.recovery_seconds)
+        tokens = min(float(self.burst), state["tokens"] + elapsed * state["rate"])
+        return {"tokens": tokens, "ts": now, "rate": rate, "blocked_until": state.get("blocked_until", 0.0)}
+
+    def _store(self, state: dict[str, float]) -> None:
+        # Sin actividad el estado expira: para entonces el bucket ya estaría lleno
+        ttl = max(self.recovery_seconds * 2, state["blocked_until"] - state["ts"] + 60, 60)
+        self.cache.set(self.key, state, int(ttl))
+
+    # --- API ---
+    def reserve(self, tokens: float = 1.0) -> float:
+        """Reserva ``tokens`` y devuelve los segundos a esperar antes de usarlos."""
+        with self._locked():
+            now = time.time()
+            state = self._load(now)
+            state["tokens"] -= tokens
+            wait = max(state["blocked_until"] - now, 0.0)
+            if state["tokens"] < 0:
+                wait = max(wait, -state["tokens"] / state["rate"])
+            self._store(state)
+        return wait
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def penalize(self, retry_after: float) -> None:
+        """Respuesta 429: bloquea hasta ``Retry-After`` y reduce el ritmo a la mitad."""
+        with self._locked():
+            now = time.time()
+            state = self._load(now)
+            state["blocked_until"] = max(state["blocked_until"], now + retry_after)
+            state["rate"] = max(state["rate"] / 2, self.max_rate * MIN_RATE_FRACTION)
+            state["tokens"] = min(state["tokens"], 0.0)
+            self._store(state)
+        logger.warning(
+            "Doppler Relay respondió 429; ritmo reducido",
+            extra={"account": self.account_id, "retry_after": retry_after, "rate": state["rate"]},
+        )
+
+    def status(self) -> dict[str, float]:
+        now = time.time()
+        state = self._load(now)
+        return {
+            "account": self.account_id,
+            "rate": round(state["rate"], 3),
+            "max_rate": self.max_rate,
+            "tokens": round(state["tokens"], 3),
+            "blocked_for": round(max(state["blocked_until"] - now, 0.0), 3),
+        }
+
+
+def get_limiter(account_id: Any) -> TokenBucket | None:
+    """Bucket de la cuenta, o ``None`` si el límite está desactivado (``RATE`` = 0)."""
+    rate = configured_rate(account_id)
+    if not rate:
+        return None
+    return TokenBucket(account_id, rate)
+
+
+def current_rate(account_id: Any) -> dict[str, float] | None:
+    """Ritmo efectivo actual de la cuenta (útil para monitoreo)."""
+    limiter = get_limiter(account_id)
+    return limiter.status() if limiter else None
@@ -7,6 +7,7 @@ from reports.services.doppler_reports import (  # noqa: F401
     create_report_request,
     wait_until_processed,
     download_report_csv,
+    download_report_to_file,
     build_report_filename,
 )
 
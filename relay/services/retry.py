@@ -0,0 +1,113 @@
+"""Política única de reintentos de los clientes Doppler Relay.
+
+- Solo se reintentan errores transitorios: red/timeout, 429 y 5xx. Un 4xx
+  (validación, cuota, autenticación) falla en el primer intento.
+- Cada llamada tiene un plazo total (``CALL_DEADLINE``): no se programa una
+  espera que lo exceda.
+- Un envío masivo comparte un :class:`RetryBudget` (``BULK_BUDGET_SECONDS``)
+  entre todos sus lotes; agotado, los lotes fallan sin más esperas.
+- Los POST llevan ``Idempotency-Key`` estable entre reintentos, para que un
+  reintento tras un timeout no duplique el envío.
+"""
+from __future__ import annotations
+
+import hashlib
+import random
+import threading
+import time
+from typing import Any, Iterable
+
+import httpx
+import requests
+from django.conf import settings
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+TRANSIENT_STATUSES = frozenset({429, 500, 502, 503, 504})
+NETWORK_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    httpx.TransportError,
+)
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 0.8
+DEFAULT_MAX_DELAY = 8.0
+DEFAULT_CALL_DEADLINE = 60.0
+DEFAULT_BULK_BUDGET_SECONDS = 300.0
+
+
+def _cfg() -> dict[str, Any]:
+    return (getattr(settings, "DOPPLER_RELAY", {}) or {}).get("RETRY") or {}
+
+
+class RetryPolicy:
+    def __init__(self, *, max_attempts: int = DEFAULT_MAX_ATTEMPTS, base_delay: float = DEFAULT_BASE_DELAY,
+                 max_delay: float = DEFAULT_MAX_DELAY, call_deadline: float = DEFAULT_CALL_DEADLINE):
+        self.max_attempts = max(int(max_attempts), 1)
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.call_deadline = float(call_deadline)
+
+    @classmethod
+    def from_settings(cls) -> "RetryPolicy":
+        cfg = _cfg()
+        return cls(
+            max_attempts=cfg.get("MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS),
+            base_delay=cfg.get("BASE_DELAY", DEFAULT_BASE_DELAY),
+            max_delay=cfg.get("MAX_DELAY", DEFAULT_MAX_DELAY),
+            call_deadline=cfg.get("CALL_DEADLINE", DEFAULT_CALL_DEADLINE),
+        )
+
+    @staticmethod
+    def is_retryable(exc: BaseException) -> bool:
+        if isinstance(exc, NETWORK_ERRORS):
+            return True
+        return getattr(exc, "status", None) in TRANSIENT_STATUSES
+
+    def backoff(self, attempt: int) -> float:
+        """Espera exponencial con jitter para el intento ``attempt`` (1-based) fallido."""
+        ceiling = min(self.base_delay * (2 ** attempt), self.max_delay)
+        return random.uniform(ceiling / 2, ceiling)
+
+    def allows(self, attempt: int, started: float, wait: float) -> bool:
+        """Hay margen para otro intento tras esperar ``wait`` segundos."""
+        if attempt >= self.max_attempts:
+            return False
+        return time.monotonic() - started + wait <= self.call_deadline
+
+
+class RetryBudget:
+    """Segundos de espera por reintentos compartidos por todas las llamadas de un envío masivo."""
+
+    def __init__(self, seconds: float):
+        self.remaining = float(seconds)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_bulk(cls) -> "RetryBudget":
+        return cls(_cfg().get("BULK_BUDGET_SECONDS", DEFAULT_BULK_BUDGET_SECONDS))
+
+    @property
+    def exhausted(self) -> bool:
+        return self.remaining <= 0
+
+    def consume(self, wait: float) -> bool:
+        with self._lock:
+            if wait > self.remaining:
+                self.remaining = 0.0
+                return False
+            self.remaining -= wait
+            return True
+
+
+def idempotency_key(*parts: Any, emails: Iterable[str] = ()) -> str:
+    """Clave determinística para un lote: mismos datos, misma clave (también al reanudar)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    for email in emails:
+        digest.update(str(email).strip().lower().encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()[:40]
@@ -0,0 +1,149 @@
+"""Índice de supresión: direcciones a las que no se vuelve a enviar.
+
+Se alimenta de forma incremental desde
+
+- la carga de reportes (``reports.services.loader.load_report_to_db``): filas
+  del CSV summary con estado rebotado/spam/desuscrito y reportes
+  ``bounces``/``spam``/``unsubscribed`` completos;
+- ``relay.Event`` (``sync_from_events``), usando como marca de agua el último
+  ``Event.id`` recorrido (``SyncWatermark`` ``suppression_events``), haya o no
+  generado supresiones.
+
+``process_bulk_id`` carga el índice una vez por envío en un dict en memoria
+(``load_index``) y marca esos destinatarios como ``suppressed`` sin llamar a la
+API.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Any, Iterable
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from relay.models import Event, SuppressedRecipient, SyncWatermark
+
+logger = logging.getLogger(__name__)
+
+BOUNCE = "bounce"
+SPAM = "spam"
+UNSUBSCRIBED = "unsubscribed"
+
+# Estados del CSV summary (mismos criterios que el reporte del admin)
+STATUS_REASONS = {
+    "bounced": BOUNCE, "bounce": BOUNCE, "rejected": BOUNCE,
+    "spam": SPAM, "complaint": SPAM,
+    "unsubscribed": UNSUBSCRIBED, "unsubscribe": UNSUBSCRIBED,
+}
+# Tipos de reporte cuyas filas son todas supresiones
+REPORT_TYPE_REASONS = {"bounces": BOUNCE, "spam": SPAM, "unsubscribed": UNSUBSCRIBED}
+# Tipos de Event (normalizados sin "_"/"-"); los rebotes blandos no suprimen
+EVENT_REASONS = {
+    "bounce": BOUNCE, "bounced": BOUNCE, "hardbounce": BOUNCE, "hardbounced": BOUNCE,
+    "spam": SPAM, "complaint": SPAM,
+    "unsubscribe": UNSUBSCRIBED, "unsubscribed": UNSUBSCRIBED,
+}
+WRITE_BATCH = 1000
+EVENTS_WATERMARK = "suppression_events"
+
+
+def enabled() -> bool:
+    cfg = getattr(settings, "DOPPLER_RELAY", {}) or {}
+    return bool(cfg.get("SUPPRESSION_ENABLED", True))
+
+
+def normalize_email(value: Any) -> str:
+    return str(value or "").strip().lower()
+
+
+def suppress(entries: Iterable[tuple[str, str]], *, source: str, event_id: int | None = None) -> int:
+    """Agrega/actualiza supresiones ``(email, motivo)``; devuelve cuántas se escribieron."""
+    now = timezone.now()
+    unique: dict[str, str] = {}
+    for email, reason in entries:
+        email = normalize_email(email)
+        if "@" in email:
+            unique[email] = reason
+    rows = [SuppressedRecipient(email=email, reason=reason, source=source, event_id=event_id, last_seen=now)
+            for email, reason in unique.items()]
+    # event_id registra el último evento que tocó la supresión (solo lo actualizan
+    # eventos); la marca de agua de sync_from_events vive en SyncWatermark y este
+    # campo solo se usa una vez para iniciarla
+    update_fields = ["reason", "last_seen"] + (["event_id"] if event_id is not None else [])
+    for i in range(0, len(rows), WRITE_BATCH):
+        SuppressedRecipient.objects.bulk_create(
+            rows[i:i + WRITE_BATCH], update_conflicts=True, unique_fields=["email"],
+            update_fields=update_fields)
+    return len(rows)
+
+
+def record_report_rows(report_type: str, rows: Iterable[dict[str, Any]], *, is_summary: bool) -> int:
+    """Supresiones a partir de las filas de un reporte recién cargado."""
+    entries = []
+    type_reason = REPORT_TYPE_REASONS.get((report_type or "").strip().lower())
+    for row in rows:
+        norm = {str(k or "").strip().lstrip("\ufeff").lower(): v for k, v in row.items()}
+        email = norm.get("email") or next((v for k, v in norm.items() if "email" in k and v), "")
+        if is_summary:
+            reason = STATUS_REASONS.get(normalize_email(norm.get("status")))
+        else:
+            reason = type_reason
+        if email and reason:
+            entries.append((email, reason))
+    written = suppress(entries, source="report")
+    if written:
+        logger.info("Supresiones desde reporte %s: %d", report_type, written)
+    return written
+
+
+def sync_from_events() -> int:
+    """Procesa los ``Event`` nuevos desde la última sincronización."""
+    mark = SyncWatermark.objects.filter(name=EVENTS_WATERMARK).first()
+    if mark is None:
+        # Sin marca propia aún: continuar desde el último evento que generó una supresión
+        mark = SyncWatermark(name=EVENTS_WATERMARK,
+                             last_id=SuppressedRecipient.objects.aggregate(m=Max("event_id"))["m"] or 0)
+    watermark = mark.last_id
+    written = 0
+    last_id = watermark
+    qs = Event.objects.filter(id__gt=watermark).order_by("id").values_list("id", "kind", "email")
+    batch: list[tuple[str, str]] = []
+    for event_id, kind, email in qs.iterator(chunk_size=WRITE_BATCH):
+        last_id = event_id
+        reason = EVENT_REASONS.get((kind or "").lower().replace("_", "").replace("-", ""))
+        if reason:
+            batch.append((email, reason))
+        if len(batch) >= WRITE_BATCH:
+            written += suppress(batch, source="event", event_id=last_id)
+            batch = []
+    if batch:
+        written += suppress(batch, source="event", event_id=last_id)
+    if last_id != watermark:
+        mark.last_id = last_id
+        mark.save()
+    return written
+
+
+def backfill_from_deliveries() -> int:
+    """Recorre ``reports_deliveries`` completo (carga inicial del índice)."""
+    statuses = list(STATUS_REASONS)
+    placeholders = ", ".join(["%s"] * len(statuses))
+    try:
+        with connection.cursor() as cur:
+            cur.execute(
+                'SELECT DISTINCT LOWER("email"), LOWER("status") FROM reports_deliveries '
+                f'WHERE LOWER("status") IN ({placeholders})', statuses)
+            rows = cur.fetchall()
+    except Exception as exc:
+        logger.warning("No se pudo leer reports_deliveries: %s", exc)
+        return 0
+    return suppress(((email, STATUS_REASONS[status]) for email, status in rows), source="report")
+
+
+def load_index() -> dict[str, str]:
+    """``{email: motivo}`` completo en memoria; se carga una vez por envío."""
+    if not enabled():
+        return {}
+    return dict(SuppressedRecipient.objects.values_list("email", "reason").iterator(chunk_size=10000))
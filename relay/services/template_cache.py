@@ -0,0 +1,55 @@
+"""Cache de metadatos de plantillas (nombre, asunto, variables Mustache).
+
+Las entradas se guardan en el cache de Django por cuenta e id de plantilla con
+TTL ``DOPPLER_RELAY['TEMPLATE_CACHE_TTL']``; ``templates_admin`` las invalida al
+editar o eliminar una plantilla. La extracción de variables además se memoriza
+por hash del contenido (``extract_template_fields``), así que recargar una
+plantilla sin cambios no vuelve a recorrer su HTML.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .doppler_relay import DopplerRelayClient, extract_template_fields, get_client
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = "relay:template"
+DEFAULT_TTL = 600
+
+
+def _ttl() -> int:
+    cfg = getattr(settings, "DOPPLER_RELAY", {}) or {}
+    return int(cfg.get("TEMPLATE_CACHE_TTL", DEFAULT_TTL))
+
+
+def _cache_key(account_id: Any, template_id: Any) -> str:
+    return f"{CACHE_PREFIX}:{account_id}:{template_id}"
+
+
+def get_template_metadata(account_id: Any, template_id: Any, *, client: DopplerRelayClient | None = None,
+                          refresh: bool = False) -> dict[str, Any]:
+    """``{id, name, subject, variables, content_hash}`` de la plantilla, desde cache si está vigente.
+
+    Propaga los errores de la API (``DopplerRelayError``) sin cachearlos.
+    """
+    key = _cache_key(account_id, template_id)
+    if not refresh:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    client = client or get_client()
+    metadata = extract_template_fields(client.get_template(account_id, str(template_id)))
+    cache.set(key, metadata, _ttl())
+    logger.debug("Metadatos de plantilla %s cacheados", template_id,
+                 extra={"account": account_id, "variables": len(metadata["variables"])})
+    return metadata
+
+
+def invalidate_template(account_id: Any, template_id: Any) -> None:
+    cache.delete(_cache_key(account_id, template_id))
@@ -0,0 +1,119 @@
+"""Trazas HTTP del cliente Doppler Relay sobre ``logging`` (logger ``relay.http``).
+
+Configuración en ``settings.DOPPLER_RELAY['TRACE']``:
+
+- ``LEVEL``: ``off`` (por defecto, no se serializa nada), ``basic`` (método,
+  URL, status y latencia), ``headers`` (+ headers con credenciales redactadas)
+  o ``body`` (+ cuerpos JSON/respuesta truncados).
+- ``SAMPLE_RATE``: fracción de llamadas trazadas (``0.0``-``1.0``).
+- ``MAX_BODY_CHARS``: tope de caracteres por cuerpo registrado.
+
+El contenido base64 de adjuntos nunca se registra: se reemplaza por su tamaño.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import random
+from typing import Any, Mapping
+
+from django.conf import settings
+
+logger = logging.getLogger("relay.http")
+
+LEVEL_OFF = 0
+LEVEL_BASIC = 1
+LEVEL_HEADERS = 2
+LEVEL_BODY = 3
+LEVELS = {
+    "off": LEVEL_OFF,
+    "basic": LEVEL_BASIC,
+    "headers": LEVEL_HEADERS,
+    "body": LEVEL_BODY,
+}
+DEFAULT_MAX_BODY_CHARS = 2000
+# Claves cuyo valor se considera binario/base64 y nunca se registra
+BINARY_KEYS = {"content"}
+SENSITIVE_HEADERS = {"authorization", "cookie", "set-cookie", "x-api-key"}
+
+
+def _trace_cfg() -> Mapping[str, Any]:
+    cfg = getattr(settings, "DOPPLER_RELAY", {}) or {}
+    return cfg.get("TRACE") or {}
+
+
+def sampled_level() -> int:
+    """Nivel de traza para la llamada actual (0 si está desactivado o no fue muestreada).
+
+    Es la única comprobación en el camino caliente: con ``LEVEL=off`` no se
+    construye ni serializa nada.
+    """
+    level = LEVELS.get(str(_trace_cfg().get("LEVEL", "off")).lower(), LEVEL_OFF)
+    if not level or not logger.isEnabledFor(logging.DEBUG):
+        return LEVEL_OFF
+    rate = float(_trace_cfg().get("SAMPLE_RATE", 1.0))
+    if rate < 1.0 and random.random() >= rate:
+        return LEVEL_OFF
+    return level
+
+
+def redact_headers(headers: Mapping[str, Any]) -> dict[str, Any]:
+    redacted = {}
+    for key, value in dict(headers).items():
+        if key.lower() in SENSITIVE_HEADERS:
+            scheme = str(value).split(" ", 1)[0] if " " in str(value) else ""
+            redacted[key] = f"{scheme} ***".strip()
+        else:
+            redacted[key] = value
+    return redacted
+
+
+def _strip_binary(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {
+            k: (f"<{len(v)} chars base64>" if k in BINARY_KEYS and isinstance(v, (str, bytes)) else _strip_binary(v))
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [_strip_binary(v) for v in value]
+    return value
+
+
+def summarize_body(body: Any, max_chars: int | None = None) -> str | None:
+    """Representación compacta y truncada de un cuerpo (sin base64 de adjuntos)."""
+    if body is None:
+        return None
+    limit = max_chars or int(_trace_cfg().get("MAX_BODY_CHARS", DEFAULT_MAX_BODY_CHARS))
+    if isinstance(body, (dict, list)):
+        text = json.dumps(_strip_binary(body), ensure_ascii=False, default=str)
+    elif isinstance(body, bytes):
+        text = body[: limit * 4].decode("utf-8", errors="replace")
+    else:
+        text = str(body)
+    if len(text) > limit:
+        return f"{text[:limit]}... (+{len(text) - limit} chars)"
+    return text
+
+
+def trace_request(level: int, method: str, url: str, *, headers: Mapping[str, Any] | None = None,
+                  body: Any = None, attempt: int = 1) -> None:
+    extra: dict[str, Any] = {"method": method, "url": url, "attempt": attempt}
+    if level >= LEVEL_HEADERS and headers is not None:
+        extra["headers"] = redact_headers(headers)
+    if level >= LEVEL_BODY:
+        extra["body"] = summarize_body(body)
+    logger.debug("relay request %s %s", method, url, extra=extra)
+
+
+def trace_response(level: int, method: str, url: str, resp: Any, elapsed: float) -> None:
+    extra: dict[str, Any] = {
+        "method": method,
+        "url": url,
+        "status": resp.status_code,
+        "latency_ms": round(elapsed * 1000, 2),
+    }
+    if level >= LEVEL_HEADERS:
+        extra["headers"] = redact_headers(resp.headers)
+    if level >= LEVEL_BODY:
+        extra["body"] = summarize_body(resp.text)
+    logger.debug("relay response %s %s -> %s", method, url, resp.status_code, extra=extra)
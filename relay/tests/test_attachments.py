@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import base64
+import io
+
+from django.test import SimpleTestCase
+
+from relay.services import attachments
+from relay.services.attachments import Base64Content, encode_stream, ensure_base64
+from relay.services.doppler_relay import build_template_message
+
+
+class AttachmentEncodingTests(SimpleTestCase):
+    def setUp(self):
+        attachments.clear_cache()
+
+    def test_same_content_is_encoded_once_and_shared(self):
+        digest, first = encode_stream(io.BytesIO(b"%PDF-1.4 contenido"))
+        _, second = encode_stream(io.BytesIO(b"%PDF-1.4 contenido"))
+        self.assertIs(first, second)
+        self.assertEqual(base64.b64decode(first), b"%PDF-1.4 contenido")
+        self.assertEqual(len(digest), 64)
+
+    def test_payloads_reuse_the_encoded_string(self):
+        content = ensure_base64(b"adjunto")
+        model = {"from_email": "a@b.com", "attachments": [{"filename": "a.pdf", "content": content}],
+                 "recipients": [{"email": "x@y.com", "variables": {"n": "1"}}]}
+        payload = build_template_message("tpl", model)
+        self.assertIs(payload["attachments"][0]["content"], content)
+
+    def test_plain_text_is_encoded(self):
+        self.assertIsInstance(ensure_base64("no es base64!"), Base64Content)
+        self.assertEqual(base64.b64decode(ensure_base64("no es base64!")), b"no es base64!")
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from relay.models import EmailMessage
+from relay.services.buffered_writer import BufferedWriter
+
+
+def _message(n: int) -> EmailMessage:
+    return EmailMessage(subject="s", from_email="a@b.com", to_emails=f"u{n}@b.com", relay_message_id=str(n))
+
+
+class BufferedWriterTests(TestCase):
+    def test_flushes_by_size_and_on_exit(self):
+        with patch.object(EmailMessage.objects, "bulk_create", wraps=EmailMessage.objects.bulk_create) as bulk:
+            with BufferedWriter(EmailMessage, batch_size=2, flush_seconds=3600) as writer:
+                for n in range(5):
+                    writer.add(_message(n))
+                self.assertEqual(EmailMessage.objects.count(), 4)
+        self.assertEqual(bulk.call_count, 3)
+        self.assertEqual(EmailMessage.objects.count(), 5)
+
+    def test_flushes_by_time(self):
+        writer = BufferedWriter(EmailMessage, batch_size=100, flush_seconds=0)
+        writer.add(_message(1))
+        self.assertEqual(writer.written, 1)
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import threading
+import time
+from unittest.mock import MagicMock
+
+from django.test import SimpleTestCase
+
+from relay.services.bulk_dispatch import bulk_concurrency, dispatch_chunk, dispatch_chunks
+from relay.services.doppler_relay import DopplerRelayError
+
+
+def _payload(email: str) -> dict:
+    return {"email": email, "name": "", "variables": {"nombre": email}, "type": "to"}
+
+
+def _ok_response(recipients_model: dict) -> dict:
+    return {
+        "ok": True,
+        "resultados": [
+            {"email": r["email"], "status": "ok", "message_id": "msg-1"}
+            for r in recipients_model["recipients"]
+        ],
+    }
+
+
+class DispatchChunkTests(SimpleTestCase):
+    base_model = {"from_email": "a@b.com", "from_name": "A", "subject": "S", "template_id": "tpl"}
+
+    def test_single_call_maps_results_per_recipient(self):
+        client = MagicMock()
+        client.send_template_message.side_effect = lambda **kw: _ok_response(kw["recipients_model"])
+        payloads = [_payload("x@y.com"), _payload("z@y.com")]
+
+        outcomes = dispatch_chunk(client, "1", "tpl", self.base_model, payloads)
+
+        self.assertEqual(client.send_template_message.call_count, 1)
+        self.assertEqual([o["email"] for o in outcomes], ["x@y.com", "z@y.com"])
+        self.assertTrue(all(o["status"] == "ok" and o["message_id"] == "msg-1" for o in outcomes))
+
+    def test_validation_error_splits_chunk_until_isolated(self):
+        def fake_send(**kw):
+            emails = [r["email"] for r in kw["recipients_model"]["recipients"]]
+            if "bad@y.com" in emails:
+                raise DopplerRelayError("invalid", status=400)
+            return _ok_response(kw["recipients_model"])
+
+        client = MagicMock()
+        client.send_template_message.side_effect = fake_send
+        payloads = [_payload(e) for e in ("a@y.com", "b@y.com", "bad@y.com", "c@y.com")]
+
+        outcomes = dispatch_chunk(client, "1", "tpl", self.base_model, payloads)
+
+        self.assertEqual([o["status"] for o in outcomes], ["ok", "ok", "error", "ok"])
+
+    def test_api_error_fails_whole_chunk_without_splitting(self):
+        client = MagicMock()
+        client.send_template_message.side_effect = DopplerRelayError("quota", status=402)
+        payloads = [_payload(e) for e in ("a@y.com", "b@y.com", "c@y.com")]
+
+        outcomes = dispatch_chunk(client, "1", "tpl", self.base_model, payloads)
+
+        self.assertEqual(client.send_template_message.call_count, 1)
+        self.assertTrue(all(o["status"] == "error" for o in outcomes))
+
+
+class DispatchChunksTests(SimpleTestCase):
+    def test_concurrent_results_keep_input_order(self):
+        threads = set()
+
+        def fake_send(**kw):
+            recipients = kw["recipients_model"]["recipients"]
+            threads.add(threading.get_ident())
+            # El primer lote tarda más para forzar finalización desordenada
+            time.sleep(0.02 if recipients[0]["email"].startswith("0") else 0.001)
+            return _ok_response(kw["recipients_model"])
+
+        client = MagicMock()
+        client.send_template_message.side_effect = fake_send
+        chunks = ([_payload(f"{i}{j}@y.com") for j in range(2)] for i in range(6))
+
+        results = list(dispatch_chunks(client, "1", "tpl", {}, chunks, concurrency=3))
+
+        self.assertEqual([r[0]["email"] for r in results], [f"{i}0@y.com" for i in range(6)])
+        self.assertGreater(len(threads), 1)
+
+    def test_concurrency_per_account_setting(self):
+        with self.settings(DOPPLER_RELAY={"BULK_CONCURRENCY": {"42": 8, "default": 2}}):
+            self.assertEqual(bulk_concurrency("42"), 8)
+            self.assertEqual(bulk_concurrency("7"), 2)
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import io
+
+from django.test import SimpleTestCase
+
+from relay.services.bulk_processing import _email_column, iter_recipients, read_csv_rows
+
+
+class RecipientPipelineTests(SimpleTestCase):
+    def test_rows_are_streamed_and_invalid_rows_marked(self):
+        stream = io.BytesIO("﻿Email;Nombre\na@b.com;Ana\nc@b.com;\n;Sin correo\n".encode("utf-8"))
+        headers, rows = read_csv_rows(stream)
+        self.assertEqual(headers, ["email", "nombre"])
+
+        recipients = iter_recipients(rows, email_col=_email_column(headers),
+                                     variables_mapping={}, required_vars={"nombre"})
+        first = next(recipients)
+        self.assertEqual(first["variables"], {"nombre": "Ana"})
+        self.assertNotIn("error", first)
+
+        rest = list(recipients)
+        self.assertEqual([r["email"] for r in rest], ["c@b.com"])
+        self.assertIn("nombre", rest[0]["error"])
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from relay.models import BulkSend, BulkSendRecipient, EmailMessage
+from relay.services import bulk_processing
+from relay.services.bulk_processing import can_resume, process_bulk_id
+from relay.services.doppler_relay import DopplerRelayClient
+
+CSV = b"email;nombre\n" + b"".join(f"u{n}@b.com;N{n}\n".encode() for n in range(5))
+
+
+class _Created:
+    status_code = 201
+    headers = {"Location": "/accounts/1/messages/abc"}
+
+    def json(self):
+        return {}
+
+
+class BulkResumeTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media))
+        self.enterContext(patch("relay.services.bulk_processing.get_template_metadata",
+                                return_value={"variables": []}))
+        self.bulk = BulkSend.objects.create(
+            template_id="tpl", template_name="tpl", subject="Hola",
+            variables={"__sender_user_config_id": None},
+            recipients_file=SimpleUploadedFile("r.csv", CSV))
+
+    def test_saves_checkpoints_while_sending(self):
+        offsets = []
+        original_save = BulkSend.save
+
+        def save(bulk, *args, **kwargs):
+            if kwargs.get("update_fields") == ["checkpoint"]:
+                offsets.append(bulk.checkpoint["offset"])
+            return original_save(bulk, *args, **kwargs)
+
+        with self.settings(DOPPLER_RELAY={"ACCOUNT_ID": 1, "DEFAULT_FROM_EMAIL": "s@b.com",
+                                          "BULK_CHECKPOINT_EVERY": 2}), \
+                patch.object(DopplerRelayClient, "_request", return_value=_Created()), \
+                patch.object(BulkSend, "save", save):
+            process_bulk_id(self.bulk.id)
+        self.assertEqual(offsets, [2, 4, 5])
+        self.bulk.refresh_from_db()
+        self.assertEqual(self.bulk.status, "done")
+        self.assertEqual(list(self.bulk.recipients.order_by("position").values_list("email", "status", "message_id")),
+                         [(f"u{n}@b.com", "ok", "abc") for n in range(5)])
+
+    def test_resume_skips_processed_recipients(self):
+        self.bulk.status = "processing"
+        self.bulk.checkpoint = {"offset": 3, "ok": 3, "error": 0, "errors": []}
+        self.bulk.save()
+        # Fila escrita tras el último checkpoint antes de la caída: se regenera
+        BulkSendRecipient.objects.create(bulk=self.bulk, position=3, email="u3@b.com", status="error")
+        self.assertTrue(can_resume(self.bulk))
+
+        with self.settings(DOPPLER_RELAY={"ACCOUNT_ID": 1, "DEFAULT_FROM_EMAIL": "s@b.com"}), \
+                patch.object(DopplerRelayClient, "_request", return_value=_Created()) as request:
+            process_bulk_id(self.bulk.id, resume=True)
+        self.assertEqual(request.call_count, 2)
+        self.bulk.refresh_from_db()
+        self.assertEqual((self.bulk.status, self.bulk.checkpoint["offset"], self.bulk.checkpoint["ok"]),
+                         ("done", 5, 5))
+        self.assertEqual(list(self.bulk.recipients.order_by("position").values_list("position", "status")), [(3, "ok"), (4, "ok")])
+
+    def test_resume_after_a_crash_does_not_duplicate_messages(self):
+        # Cae al registrar el 4.º destinatario: el checkpoint quedó en 2 pero el 3.º
+        # y el 4.º ya tenían su EmailMessage
+        original_row = bulk_processing.recipient_row
+
+        def recipient_row(bulk, position, outcome):
+            if position == 3:
+                raise RuntimeError("caída")
+            return original_row(bulk, position, outcome)
+
+        with self.settings(DOPPLER_RELAY={"ACCOUNT_ID": 1, "DEFAULT_FROM_EMAIL": "s@b.com",
+                                          "BULK_CHECKPOINT_EVERY": 2, "BULK_BATCH_SIZE": 1}), \
+                patch.object(DopplerRelayClient, "_request", return_value=_Created()), \
+                patch.object(bulk_processing, "recipient_row", side_effect=recipient_row):
+            process_bulk_id(self.bulk.id)
+        self.bulk.refresh_from_db()
+        self.assertEqual((self.bulk.status, self.bulk.checkpoint["offset"]), ("error", 2))
+        self.assertEqual(EmailMessage.objects.count(), 4)
+
+        with self.settings(DOPPLER_RELAY={"ACCOUNT_ID": 1, "DEFAULT_FROM_EMAIL": "s@b.com",
+                                          "BULK_BATCH_SIZE": 1}), \
+                patch.object(DopplerRelayClient, "_request", return_value=_Created()):
+            process_bulk_id(self.bulk.id, resume=True)
+        self.bulk.refresh_from_db()
+        self.assertEqual(self.bulk.status, "done")
+        self.assertEqual(EmailMessage.objects.count(), 5)
+        self.assertEqual(sorted(self.bulk.messages.values_list("bulk_position", flat=True)), [0, 1, 2, 3, 4])
+
+    def test_a_bulk_still_making_progress_is_not_resumable(self):
+        self.bulk.status = "processing"
+        self.bulk.checkpoint = {"offset": 3, "updated_at": timezone.now().isoformat()}
+        self.assertFalse(can_resume(self.bulk))
+        self.bulk.checkpoint["updated_at"] = (timezone.now() - timedelta(minutes=5)).isoformat()
+        self.assertTrue(can_resume(self.bulk))
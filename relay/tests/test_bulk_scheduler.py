@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import threading
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils import timezone
+
+from relay.models import BulkSend
+from relay.services import bulk_scheduler
+from relay.services.bulk_scheduler import claim_due_bulk, claim_stale_bulk, run_daemon
+
+
+def _bulk(**kwargs) -> BulkSend:
+    return BulkSend.objects.create(template_id="tpl", template_name="tpl", recipients_file="r.csv", **kwargs)
+
+
+class BulkSchedulerTests(TestCase):
+    def test_claim_marks_processing_so_it_is_taken_once(self):
+        due = _bulk(scheduled_at=timezone.now() - timedelta(seconds=5))
+        _bulk(scheduled_at=timezone.now() + timedelta(hours=1))
+
+        self.assertEqual(claim_due_bulk(), due.id)
+        self.assertIsNone(claim_due_bulk())
+        due.refresh_from_db()
+        self.assertEqual(due.status, "processing")
+        self.assertIsNotNone(due.heartbeat_at)
+
+    def test_expired_lease_is_reclaimed(self):
+        stale = _bulk(status="processing", heartbeat_at=timezone.now() - timedelta(minutes=5),
+                      processing_started_at=timezone.now() - timedelta(minutes=10))
+        _bulk(status="processing", heartbeat_at=timezone.now())
+        self.assertEqual(claim_stale_bulk(60), stale.id)
+        self.assertIsNone(claim_stale_bulk(60))
+
+    def test_bulk_without_heartbeat_falls_back_to_start_time(self):
+        # Tomado por el comando sin daemon antes de que registrara heartbeat
+        stale = _bulk(status="processing", processing_started_at=timezone.now() - timedelta(minutes=5))
+        _bulk(status="processing", processing_started_at=timezone.now())
+        self.assertEqual(claim_stale_bulk(60), stale.id)
+        self.assertIsNone(claim_stale_bulk(60))
+
+    def test_sleeps_until_next_scheduled_bulk(self):
+        _bulk(scheduled_at=timezone.now() + timedelta(seconds=20))
+        self.assertAlmostEqual(bulk_scheduler._sleep_seconds(60, busy=False), 20, delta=1)
+
+    def test_daemon_starts_due_bulks_in_parallel(self):
+        first = _bulk(scheduled_at=timezone.now())
+        second = _bulk(scheduled_at=timezone.now())
+        stop = threading.Event()
+        started = []
+
+        def fake_run(bulk_id, *, resume, lease_seconds):
+            started.append(bulk_id)
+            if len(started) == 2:
+                stop.set()
+
+        with patch.object(bulk_scheduler, "run_claimed", side_effect=fake_run):
+            run_daemon(workers=2, stop=stop, max_sleep=0.1)
+        self.assertCountEqual(started, [first.id, second.id])
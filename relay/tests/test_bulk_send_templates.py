@@ -33,7 +33,7 @@ class BulkSendTemplateFormTests(TestCase):
         return request
 
     @patch('relay.admin.BulkSendForm._schedule_refresh', lambda *args, **kwargs: None)
-    @patch('relay.admin.DopplerRelayClient.list_templates')
+    @patch('relay.services.doppler_relay.DopplerRelayClient.list_templates')
     def test_cache_hit_uses_cached_templates(self, mock_list_templates):
         mock_list_templates.return_value = [{'id': 'tpl-1', 'name': 'Alpha'}]
 
@@ -49,7 +49,7 @@ class BulkSendTemplateFormTests(TestCase):
         )
 
     @patch('relay.admin.BulkSendForm._schedule_refresh', lambda *args, **kwargs: None)
-    @patch('relay.admin.DopplerRelayClient.list_templates')
+    @patch('relay.services.doppler_relay.DopplerRelayClient.list_templates')
     def test_fallback_to_manual_field_when_api_fails(self, mock_list_templates):
         mock_list_templates.side_effect = DopplerRelayError('boom')
         request = self._build_request()
@@ -60,7 +60,7 @@ class BulkSendTemplateFormTests(TestCase):
         self.assertNotIsInstance(form.fields['template_id'], forms.ChoiceField)
 
     @patch('relay.admin.BulkSendForm._schedule_refresh', lambda *args, **kwargs: None)
-    @patch('relay.admin.DopplerRelayClient.list_templates')
+    @patch('relay.services.doppler_relay.DopplerRelayClient.list_templates')
     def test_clean_template_id_accepts_manual_value(self, mock_list_templates):
         mock_list_templates.return_value = [{'id': 'tpl-1', 'name': 'Alpha'}]
         form = BulkSendForm()
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from unittest.mock import patch
+
+import requests
+from django.test import SimpleTestCase, override_settings
+
+from relay.services import circuit_breaker
+from relay.services.circuit_breaker import CircuitBreaker, endpoint_family
+from relay.services.doppler_relay import CircuitOpenError, DopplerRelayClient
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_threshold_and_probes_when_half_open(self):
+        breaker = CircuitBreaker("1:messages", failure_threshold=2, reset_timeout=10)
+        with patch("relay.services.circuit_breaker.time.monotonic", return_value=100.0):
+            breaker.record_failure()
+            breaker.record_failure()
+            self.assertEqual(breaker.state, circuit_breaker.OPEN)
+            self.assertFalse(breaker.allow())
+
+        with patch("relay.services.circuit_breaker.time.monotonic", return_value=111.0):
+            self.assertTrue(breaker.allow())
+            # Solo una sonda concurrente en half-open
+            self.assertFalse(breaker.allow())
+            breaker.record_success()
+
+        self.assertEqual(breaker.state, circuit_breaker.CLOSED)
+        self.assertEqual(breaker.metrics["rejected"], 2)
+        self.assertEqual(breaker.metrics["opened"], 1)
+
+    def test_unreported_probe_is_released_or_expires(self):
+        breaker = CircuitBreaker("1:messages", failure_threshold=1, reset_timeout=10)
+        with patch("relay.services.circuit_breaker.time.monotonic", return_value=100.0):
+            breaker.record_failure()
+        with patch("relay.services.circuit_breaker.time.monotonic", return_value=111.0):
+            self.assertTrue(breaker.allow())
+            breaker.release()
+            self.assertTrue(breaker.allow())
+            self.assertFalse(breaker.allow())
+        # La sonda nunca informó su resultado: vence tras RESET_TIMEOUT
+        with patch("relay.services.circuit_breaker.time.monotonic", return_value=121.0):
+            self.assertTrue(breaker.allow())
+
+    def test_endpoint_family(self):
+        self.assertEqual(endpoint_family("/accounts/1/templates/x/message"), "messages")
+        self.assertEqual(endpoint_family("/accounts/1/templates/x"), "templates")
+        self.assertEqual(endpoint_family("/accounts/1/templates/x/messages-log"), "templates")
+        self.assertEqual(endpoint_family("https://api/reports/reportrequest?x=1"), "reportrequest")
+        self.assertEqual(endpoint_family("/accounts/1/deliveries?from=x"), "deliveries")
+
+
+@override_settings(DOPPLER_RELAY={
+    "API_KEY": "k", "BASE_URL": "https://relay.test/",
+    "CIRCUIT_BREAKER": {"FAILURE_THRESHOLD": 2, "RESET_TIMEOUT": 30},
+})
+class ClientCircuitTests(SimpleTestCase):
+    def setUp(self):
+        circuit_breaker.reset()
+        self.addCleanup(circuit_breaker.reset)
+
+    @patch("relay.services.doppler_relay.time.sleep")
+    def test_client_fails_fast_once_circuit_opens(self, _sleep):
+        client = DopplerRelayClient()
+        with patch.object(client.session, "request", side_effect=requests.ConnectionError("down")) as request:
+            with self.assertRaises(CircuitOpenError):
+                client.send_template_message(5, "tpl", {
+                    "from_email": "a@b.com",
+                    "recipients": [{"email": "x@y.com", "variables": {"n": "1"}}],
+                })
+            # El tercer intento no sale a la red
+            self.assertEqual(request.call_count, 2)
+
+            with self.assertRaises(CircuitOpenError):
+                client.send_message(5, "a@b.com", "Hola", text="x", to=[("x@y.com", None)])
+            self.assertEqual(request.call_count, 2)
+
+        # Los envíos con plantilla abren "messages"; el CRUD de plantillas sigue disponible
+        self.assertEqual(circuit_breaker.get_breaker("5", "messages").state, circuit_breaker.OPEN)
+        self.assertEqual(circuit_breaker.get_breaker("5", "templates").state, circuit_breaker.CLOSED)
+
+    def test_local_error_releases_the_half_open_probe(self):
+        client = DopplerRelayClient()
+        breaker = circuit_breaker.get_breaker("5", "events")
+        breaker.state, breaker._opened_at = circuit_breaker.OPEN, 0.0
+        with patch("relay.services.doppler_relay.rate_limit.get_limiter") as get_limiter:
+            get_limiter.return_value.acquire.side_effect = RuntimeError("cache caído")
+            with self.assertRaises(RuntimeError):
+                client.list_events(5)
+        self.assertEqual(breaker.state, circuit_breaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
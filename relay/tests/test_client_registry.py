@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from django.test import SimpleTestCase, override_settings
+
+from relay.services import doppler_relay
+from relay.services.doppler_relay import get_client, reset_clients
+
+BASE = {"API_KEY": "k", "BASE_URL": "https://relay.test/", "BULK_CONCURRENCY": {"1": 16, "default": 2}}
+
+
+@override_settings(DOPPLER_RELAY=BASE)
+class ClientRegistryTests(SimpleTestCase):
+    def setUp(self):
+        reset_clients()
+        self.addCleanup(reset_clients)
+
+    def test_reuses_client_and_sizes_pool_for_bulk_concurrency(self):
+        client = get_client()
+        self.assertIs(client, get_client())
+        adapter = client.session.get_adapter("https://relay.test/")
+        self.assertEqual(adapter._pool_maxsize, 16)
+
+    def test_new_client_when_credentials_change(self):
+        client = get_client()
+        with self.settings(DOPPLER_RELAY={**BASE, "API_KEY": "other"}):
+            self.assertIsNot(client, get_client())
+
+    def test_child_process_forgets_inherited_clients(self):
+        client = get_client()
+        doppler_relay._forget_clients_after_fork()
+        self.assertIsNot(client, get_client())
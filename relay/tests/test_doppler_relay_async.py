@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from unittest.mock import AsyncMock, patch
+
+import httpx
+from django.test import SimpleTestCase, override_settings
+
+from relay.services.doppler_relay import DopplerRelayError
+from relay.services.doppler_relay_async import AsyncDopplerRelayClient
+
+
+@override_settings(DOPPLER_RELAY={"API_KEY": "k", "BASE_URL": "https://relay.test/", "AUTH_SCHEME": "token"})
+class AsyncDopplerRelayClientTests(SimpleTestCase):
+    def _client(self, handler) -> AsyncDopplerRelayClient:
+        client = AsyncDopplerRelayClient()
+        client.http = httpx.AsyncClient(transport=httpx.MockTransport(handler), headers=client.http.headers)
+        return client
+
+    async def test_paginate_follows_next_link(self):
+        pages = {
+            "/accounts/1/events": {"items": [1, 2], "_links": [{"rel": "next", "href": "/accounts/1/events?page=2"}]},
+            "/accounts/1/events?page=2": {"items": [3], "_links": []},
+        }
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            key = request.url.raw_path.decode()
+            return httpx.Response(200, json=pages[key])
+
+        async with self._client(handler) as client:
+            first = await client.list_events(1)
+            items = [item async for page in client.paginate(first) for item in page["items"]]
+
+        self.assertEqual(items, [1, 2, 3])
+
+    async def test_send_template_message_maps_recipients(self):
+        def handler(request: httpx.Request) -> httpx.Response:
+            self.assertEqual(request.headers["Authorization"], "token k")
+            return httpx.Response(201, json={}, headers={"Location": "/accounts/1/messages/m-1"})
+
+        async with self._client(handler) as client:
+            result = await client.send_template_message(1, "tpl", {
+                "from_email": "a@b.com",
+                "recipients": [{"email": "x@y.com", "variables": {"n": "1"}}],
+            })
+
+        self.assertEqual(result["resultados"][0]["message_id"], "m-1")
+
+    @patch("relay.services.doppler_relay_async.asyncio.sleep", new_callable=AsyncMock)
+    async def test_client_error_raises_doppler_error(self, _sleep):
+        async with self._client(lambda request: httpx.Response(404, json={"title": "Not found"})) as client:
+            with self.assertRaises(DopplerRelayError) as ctx:
+                await client.get_template(1, "x")
+
+        self.assertEqual(ctx.exception.status, 404)
+
+    @patch("relay.services.doppler_relay_async.asyncio.sleep", new_callable=AsyncMock)
+    async def test_429_waits_for_retry_after(self, sleep):
+        responses = iter([httpx.Response(429, json={"title": "Too many requests"}, headers={"Retry-After": "3"}),
+                          httpx.Response(200, json={"items": []})])
+        async with self._client(lambda request: next(responses)) as client:
+            await client.list_templates(1)
+
+        sleep.assert_awaited_once_with(3.0)
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from datetime import date
+
+from django.test import SimpleTestCase
+
+from relay.services.doppler_relay import DopplerRelayClient, DopplerRelayError
+from relay.services.fake_relay import FakeRelayConfig, start_in_thread
+from reports.services import doppler_reports
+
+
+class FakeRelayTests(SimpleTestCase):
+    def _server(self, **config):
+        server = start_in_thread(FakeRelayConfig(**config))
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_send_paginate_and_report_flow(self):
+        server = self._server(page_size=2, report_rows=3)
+        relay = {"ACCOUNT_ID": 1, "API_KEY": "k", "BASE_URL": server.base_url, "DEFAULT_FROM_EMAIL": "s@b.com"}
+        with self.settings(DOPPLER_RELAY=relay, DOPPLER_RELAY_BASE_URL=None):
+            client = DopplerRelayClient()
+            model = {"subject": "Hola", "from_email": "s@b.com",
+                     "recipients": [{"email": f"u{n}@b.com", "variables": {"nombre": "A"}} for n in range(3)]}
+            sent = client.send_template_message(1, "1", model, idempotency_key="k1")
+            self.assertEqual([r["message_id"] for r in sent["resultados"]], ["1001"] * 3)
+            # Misma Idempotency-Key: no se registra un segundo envío
+            client.send_template_message(1, "1", model, idempotency_key="k1")
+            self.assertEqual(server.state.accepted, 3)
+
+            it = client.iter_deliveries(1, prefetch=False)
+            self.assertEqual([d["email"] for d in it], ["u0@b.com", "u1@b.com", "u2@b.com"])
+            self.assertEqual(it.pages, 2)
+
+            report_id = doppler_reports.create_report_request(date.today(), date.today(), "deliveries")
+            self.assertTrue(doppler_reports.wait_until_processed(report_id, timeout=5)["processed"])
+            lines = doppler_reports.download_report_csv(report_id).decode().splitlines()
+        self.assertEqual(lines[0], "Subject,Sender,SenderName,Email,Status,Date,Opens,Clicks")
+        self.assertEqual(len(lines), 1 + 3 + 3)
+
+    def test_quota_answers_402(self):
+        server = self._server(quota=1)
+        relay = {"ACCOUNT_ID": 1, "API_KEY": "k", "BASE_URL": server.base_url, "DEFAULT_FROM_EMAIL": "s@b.com"}
+        with self.settings(DOPPLER_RELAY=relay):
+            model = {"from_email": "s@b.com",
+                     "recipients": [{"email": "a@b.com", "variables": {"x": "1"}},
+                                    {"email": "c@b.com", "variables": {"x": "1"}}]}
+            with self.assertRaises(DopplerRelayError) as ctx:
+                DopplerRelayClient().send_template_message(1, "1", model)
+        self.assertEqual(ctx.exception.status, 402)
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from relay.models import BulkSend, Job
+from relay.services import jobs
+from relay.services.jobs import claim, enqueue_bulk_send, run_job, run_worker
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.bulk = BulkSend.objects.create(template_id="tpl", template_name="tpl", recipients_file="r.csv")
+
+    def test_enqueue_is_deduplicated_per_bulk(self):
+        job = enqueue_bulk_send(self.bulk)
+        self.assertEqual(job.payload, {"bulk_id": self.bulk.pk, "resume": False})
+        self.assertIsNone(enqueue_bulk_send(self.bulk))
+
+    def test_failures_are_retried_with_resume_then_dead_lettered(self):
+        job = jobs.enqueue("bulk_send", {"bulk_id": self.bulk.pk}, max_attempts=2)
+        with patch.object(jobs, "process_bulk_id", side_effect=RuntimeError("db caída")) as process:
+            run_job(claim())
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+            self.assertGreater(job.run_after, timezone.now())
+
+            self.assertIsNone(claim())
+            run_job(claim(now=job.run_after + timedelta(seconds=1)))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DEAD)
+        self.assertIn("db caída", job.last_error)
+        self.assertEqual([c.kwargs["resume"] for c in process.call_args_list], [False, True])
+
+    def test_a_bulk_that_ends_in_error_fails_the_job(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        relay = {**settings.DOPPLER_RELAY, "DEFAULT_FROM_EMAIL": ""}
+        with override_settings(MEDIA_ROOT=media, DOPPLER_RELAY=relay), \
+                patch("relay.services.bulk_processing.get_template_metadata", return_value={}):
+            bulk = BulkSend.objects.create(template_id="tpl", template_name="tpl", subject="Hola",
+                                           recipients_file=SimpleUploadedFile("r.csv", b"email\na@b.com\n"))
+            job = jobs.enqueue("bulk_send", {"bulk_id": bulk.pk}, max_attempts=2)
+            run_job(claim())
+            job.refresh_from_db()
+            bulk.refresh_from_db()
+            self.assertEqual((job.status, bulk.status), (Job.QUEUED, "error"))
+            self.assertIn("remitente", job.last_error)
+
+            # El reintento reanuda el envío en error y, al volver a fallar, queda dead
+            run_job(claim(now=job.run_after + timedelta(seconds=1)))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DEAD)
+
+    def test_bulk_already_taken_by_the_scheduler_is_a_no_op(self):
+        job = jobs.enqueue("bulk_send", {"bulk_id": self.bulk.pk})
+        BulkSend.objects.filter(pk=self.bulk.pk).update(status="done")
+        with patch.object(jobs, "process_bulk_id") as process:
+            run_job(claim())
+        process.assert_not_called()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+
+    def test_expired_lease_is_reclaimed(self):
+        job = jobs.enqueue("bulk_send", {"bulk_id": self.bulk.pk})
+        Job.objects.filter(pk=job.pk).update(status=Job.RUNNING, attempts=1,
+                                             locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(claim(lease_seconds=60).pk, job.pk)
+
+    def test_worker_once_drains_ready_jobs(self):
+        jobs.enqueue("bulk_send", {"bulk_id": self.bulk.pk})
+        # El hilo del pool no ve la transacción del test: se omite la toma del envío
+        with patch.object(jobs, "_run_in_worker", side_effect=lambda job, lease: run_job(job)), \
+                patch.object(jobs, "claim_bulk", return_value=True), \
+                patch.object(jobs, "process_bulk_id") as process:
+            self.assertEqual(run_worker(workers=2, once=True), 1)
+        process.assert_called_once_with(self.bulk.pk, resume=False)
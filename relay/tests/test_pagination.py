@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from relay.services.doppler_relay import DopplerRelayClient
+from relay.services.pagination import PageIterator
+
+PAGES = {
+    "/accounts/1/events": {"items": [1, 2], "_links": [{"rel": "next", "href": "/accounts/1/events?page=2"}]},
+    "/accounts/1/events?page=2": {"items": [3, 4], "_links": [{"rel": "next", "href": "/accounts/1/events?page=3"}]},
+    "/accounts/1/events?page=3": {"items": [5], "_links": []},
+}
+
+
+class PageIteratorTests(SimpleTestCase):
+    def test_streams_all_pages_with_prefetch(self):
+        fetched = []
+
+        def fetch(url):
+            fetched.append(url)
+            return PAGES[url]
+
+        it = PageIterator(fetch, "/accounts/1/events")
+        self.assertEqual(next(it), 1)
+        # La segunda página ya se solicitó mientras se consume la primera
+        it._pending.result()
+        self.assertEqual(len(fetched), 2)
+
+        self.assertEqual(list(it), [2, 3, 4, 5])
+        self.assertEqual(it.pages, 3)
+        self.assertIsNone(it.cursor)
+
+    def test_resumes_from_saved_cursor(self):
+        it = PageIterator(PAGES.__getitem__, "/accounts/1/events", prefetch=False)
+        consumed = [next(it) for _ in range(3)]
+        cursor = it.cursor
+        it.close()
+
+        resumed = PageIterator(PAGES.__getitem__, "/accounts/1/events", cursor=cursor, prefetch=False)
+        self.assertEqual(consumed + list(resumed), [1, 2, 3, 4, 5])
+
+    def test_fetch_error_shuts_down_the_prefetch_thread(self):
+        def fetch(url):
+            if url.endswith("page=2"):
+                raise RuntimeError("timeout")
+            return PAGES[url]
+
+        it = PageIterator(fetch, "/accounts/1/events")
+        self.assertEqual([next(it), next(it)], [1, 2])
+        self.assertIsNotNone(it._executor)
+        with self.assertRaises(RuntimeError):
+            next(it)
+        self.assertIsNone(it._executor)
+        self.assertEqual(it.cursor, {"page": "/accounts/1/events?page=2", "offset": 0})
+
+    def test_client_iter_events_uses_window_path(self):
+        client = DopplerRelayClient(api_key="k", base_url="https://relay.test/")
+        with patch.object(client, "_get_json", side_effect=lambda url: {"items": [url], "_links": []}):
+            items = list(client.iter_events(1, from_iso="2024-01-01T00:00:00Z", prefetch=False))
+        self.assertEqual(items, ["/accounts/1/events?from=2024-01-01T00:00:00Z"])
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from relay.models import BulkSend, Job
+from relay.services.bulk_processing import process_bulk_id
+from relay.services.preflight import run_preflight
+
+CSV = b"email;nombre;ciudad\nok@b.com;Ana;Quito\nmalo@;Luis;Lima\n;Sin;Email\nsin@b.com;;Cali\n"
+
+
+class PreflightTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media))
+        self.enterContext(patch("relay.services.preflight.get_template_metadata",
+                                return_value={"variables": ["nombre"]}))
+
+    def _bulk(self, variables=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return BulkSend.objects.create(
+                template_id="tpl", template_name="tpl", subject="Hola", variables=variables or {},
+                recipients_file=SimpleUploadedFile("r.csv", CSV))
+
+    def test_saving_a_file_enqueues_preflight_and_stores_counts(self):
+        bulk = self._bulk()
+        self.assertEqual(bulk.preflight, {"status": "queued"})
+        self.assertTrue(Job.objects.filter(kind="bulk_preflight", payload__bulk_id=bulk.pk).exists())
+
+        result = run_preflight(bulk.pk)
+        self.assertEqual(result["status"], "warnings")
+        self.assertEqual((result["total"], result["valid"], result["invalid_email"],
+                          result["missing_values"], result["skipped"]), (3, 1, 1, 1, 1))
+        bulk.refresh_from_db()
+        with bulk.preflight_file.open("r") as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[1:], ["3,malo@,email inválido", "5,sin@b.com,faltan variables: nombre"])
+
+    def test_mapped_columns_are_checked_per_row(self):
+        bulk = self._bulk(variables={"nombre_tpl": "Nombre"})
+        result = run_preflight(bulk.pk)
+        self.assertEqual((result["status"], result["valid"], result["missing_values"]), ("warnings", 1, 1))
+        bulk.refresh_from_db()
+        with bulk.preflight_file.open("r") as f:
+            self.assertIn("5,sin@b.com,faltan variables: nombre", f.read().splitlines())
+
+    def test_missing_mapped_column_blocks_the_send(self):
+        bulk = self._bulk(variables={"nombre": "nombres_completos"})
+        result = run_preflight(bulk.pk)
+        self.assertEqual((result["status"], result["missing_columns"]), ("failed", ["nombres_completos"]))
+
+        with patch("relay.services.bulk_processing.iter_bulk_template_send") as send:
+            process_bulk_id(bulk.pk)
+        send.assert_not_called()
+        bulk.refresh_from_db()
+        self.assertEqual(bulk.status, "error")
+        self.assertIn("nombres_completos", bulk.log)
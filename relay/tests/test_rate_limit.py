@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from unittest.mock import MagicMock, patch
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from relay.services import rate_limit
+from relay.services.doppler_relay import DopplerRelayClient
+
+RATE_SETTINGS = {
+    "API_KEY": "k",
+    "BASE_URL": "https://relay.test/",
+    "RATE_LIMIT": {"RATE": {"7": 10, "default": 0}, "BURST": 2},
+}
+
+
+@override_settings(DOPPLER_RELAY=RATE_SETTINGS)
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_reserve_returns_wait_once_burst_is_spent(self):
+        bucket = rate_limit.get_limiter("7")
+        with patch("relay.services.rate_limit.time.time", return_value=1000.0):
+            waits = [bucket.reserve() for _ in range(3)]
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertAlmostEqual(waits[2], 0.1)
+
+    def test_does_not_release_a_lock_it_did_not_acquire(self):
+        bucket = rate_limit.get_limiter("7")
+        cache.add(bucket.lock_key, "otro", 60)
+        with patch.object(rate_limit, "LOCK_TIMEOUT", 0.02):
+            bucket.reserve()
+        self.assertEqual(cache.get(bucket.lock_key), "otro")
+
+    def test_disabled_for_accounts_without_rate(self):
+        self.assertIsNone(rate_limit.get_limiter("8"))
+        self.assertEqual(rate_limit.account_from_path("/accounts/7/templates?x=1"), "7")
+
+    def test_penalize_blocks_and_halves_rate(self):
+        bucket = rate_limit.get_limiter("7")
+        with patch("relay.services.rate_limit.time.time", return_value=1000.0):
+            bucket.penalize(3.0)
+            status = bucket.status()
+            wait = bucket.reserve()
+        self.assertEqual(status["rate"], 5.0)
+        self.assertEqual(status["blocked_for"], 3.0)
+        self.assertGreaterEqual(wait, 3.0)
+
+    @patch("relay.services.rate_limit.time.sleep")
+    def test_client_honours_retry_after_on_429(self, sleep):
+        throttled = MagicMock(status_code=429, headers={"Retry-After": "2"}, text="{}")
+        throttled.json.return_value = {"title": "Too many requests"}
+        throttled.request.headers = {}
+        throttled.request.body = None
+        ok = MagicMock(status_code=200)
+
+        client = DopplerRelayClient()
+        with patch.object(client.session, "request", side_effect=[throttled, ok]):
+            client.list_templates(7)
+
+        # Una sola espera: la del bucket hasta Retry-After (sin backoff exponencial)
+        sleep.assert_called_once()
+        self.assertGreaterEqual(sleep.call_args.args[0], 1.9)
+        # El ritmo empieza a recuperarse apenas pasa el bloqueo
+        self.assertAlmostEqual(client.rate_status(7)["rate"], 5.0, places=1)
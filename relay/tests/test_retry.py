@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+from unittest.mock import MagicMock, patch
+
+import requests
+from django.test import SimpleTestCase, override_settings
+
+from relay.services import circuit_breaker
+from relay.services.doppler_relay import DopplerRelayClient, DopplerRelayError
+from relay.services.retry import IDEMPOTENCY_HEADER, RetryBudget, idempotency_key
+
+
+def _response(status: int, body: dict | None = None) -> MagicMock:
+    resp = MagicMock(status_code=status, headers={}, text="{}")
+    resp.json.return_value = body or {}
+    resp.request.headers = {}
+    resp.request.body = None
+    return resp
+
+
+@override_settings(DOPPLER_RELAY={"API_KEY": "k", "BASE_URL": "https://relay.test/"})
+@patch("relay.services.doppler_relay.time.sleep")
+class RetryPolicyTests(SimpleTestCase):
+    def setUp(self):
+        circuit_breaker.reset()
+        self.addCleanup(circuit_breaker.reset)
+
+    def test_client_error_is_not_retried(self, sleep):
+        client = DopplerRelayClient()
+        with patch.object(client.session, "request", return_value=_response(400, {"title": "bad"})) as request:
+            with self.assertRaises(DopplerRelayError):
+                client.send_message(1, "a@b.com", "s", text="hola", to=[("x@y.com", None)])
+        self.assertEqual(request.call_count, 1)
+        sleep.assert_not_called()
+
+    def test_retried_post_keeps_idempotency_key(self, sleep):
+        client = DopplerRelayClient()
+        side_effect = [requests.ConnectionError("reset"), _response(503), _response(201)]
+        with patch.object(client.session, "request", side_effect=side_effect) as request:
+            client.send_message(1, "a@b.com", "s", text="hola", to=[("x@y.com", None)])
+
+        keys = {call.kwargs["headers"][IDEMPOTENCY_HEADER] for call in request.call_args_list}
+        self.assertEqual(request.call_count, 3)
+        self.assertEqual(len(keys), 1)
+
+    def test_exhausted_bulk_budget_stops_retries(self, sleep):
+        client = DopplerRelayClient()
+        budget = RetryBudget(0)
+        with patch.object(client.session, "request", side_effect=requests.Timeout("slow")) as request:
+            with self.assertRaises(DopplerRelayError):
+                client.send_template_message(1, "tpl", {
+                    "from_email": "a@b.com",
+                    "recipients": [{"email": "x@y.com", "variables": {"n": "1"}}],
+                }, retry_budget=budget)
+        self.assertEqual(request.call_count, 1)
+
+    def test_idempotency_key_is_deterministic(self, sleep):
+        first = idempotency_key("bulk-1", "tpl", emails=["A@b.com", "c@d.com"])
+        self.assertEqual(first, idempotency_key("bulk-1", "tpl", emails=["a@b.com", "c@d.com"]))
+        self.assertNotEqual(first, idempotency_key("bulk-2", "tpl", emails=["a@b.com", "c@d.com"]))
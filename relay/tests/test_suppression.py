@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils import timezone
+
+from relay.models import Event, SuppressedRecipient, SyncWatermark
+from relay.services import suppression
+from relay.services.doppler_relay import DopplerRelayClient
+from relay.views import iter_bulk_template_send
+
+
+class _Created:
+    status_code = 201
+    headers = {"Location": "/accounts/1/messages/abc"}
+
+    def json(self):
+        return {}
+
+
+class SuppressionTests(TestCase):
+    def test_report_rows_and_events_feed_the_index(self):
+        rows = [{"Email": "Rebote@b.com", "Status": "Bounced"}, {"Email": "ok@b.com", "Status": "Delivered"}]
+        self.assertEqual(suppression.record_report_rows("deliveries", rows, is_summary=True), 1)
+
+        Event.objects.create(kind="open", email="x@b.com", ts=timezone.now())
+        Event.objects.create(kind="hard_bounce", email="y@b.com", ts=timezone.now())
+        self.assertEqual(suppression.sync_from_events(), 1)
+        # La marca de agua evita reprocesar eventos ya vistos
+        self.assertEqual(suppression.sync_from_events(), 0)
+        # y avanza también con eventos que no suprimen
+        last = Event.objects.create(kind="open", email="z@b.com", ts=timezone.now())
+        self.assertEqual(suppression.sync_from_events(), 0)
+        self.assertEqual(SyncWatermark.objects.get(name=suppression.EVENTS_WATERMARK).last_id, last.id)
+
+        self.assertEqual(suppression.load_index(), {"rebote@b.com": "bounce", "y@b.com": "bounce"})
+
+    def test_suppressed_recipients_are_skipped_without_api_calls(self):
+        SuppressedRecipient.objects.create(email="spam@b.com", reason="spam")
+        recipients = [{"email": "a@b.com", "variables": {"x": "1"}}, {"email": "SPAM@b.com", "variables": {"x": "2"}}]
+        with self.settings(DOPPLER_RELAY={"ACCOUNT_ID": 1, "DEFAULT_FROM_EMAIL": "s@b.com"}), \
+                patch.object(DopplerRelayClient, "_request", return_value=_Created()) as request:
+            outcomes = list(iter_bulk_template_send("tpl", recipients, suppressed=suppression.load_index()))
+        self.assertEqual(request.call_count, 1)
+        self.assertEqual([(o["email"], o["status"]) for o in outcomes], [("a@b.com", "ok"), ("SPAM@b.com", "suppressed")])
+
+    def test_a_run_of_suppressed_rows_is_drained_without_waiting_for_a_batch(self):
+        read = []
+
+        def recipients():
+            for n in range(1000):
+                read.append(n)
+                yield {"email": f"u{n}@b.com", "variables": {}}
+
+        checkpoints = []
+        suppressed = {f"u{n}@b.com": "bounce" for n in range(1000)}
+        with self.settings(DOPPLER_RELAY={"ACCOUNT_ID": 1, "DEFAULT_FROM_EMAIL": "s@b.com"}), \
+                patch.object(DopplerRelayClient, "_request") as request:
+            outcomes = iter_bulk_template_send("tpl", recipients(), batch_size=10, concurrency=1, suppressed=suppressed,
+                                               checkpoint_every=10, on_checkpoint=lambda: checkpoints.append(len(read)))
+            self.assertEqual(next(outcomes)["status"], "suppressed")
+            # Solo se leyó un lote de filas, no el archivo completo
+            self.assertEqual(len(read), 10)
+            self.assertEqual(len(list(outcomes)), 999)
+        request.assert_not_called()
+        self.assertEqual(len(checkpoints), 100)
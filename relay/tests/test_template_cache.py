@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from unittest.mock import MagicMock, patch
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from relay.services import doppler_relay
+from relay.services.template_cache import get_template_metadata, invalidate_template
+
+TEMPLATE = {"id": "tpl", "name": "Bienvenida", "subject": "Hola",
+            "htmlContent": "<p>{{nombre}} {{ cliente.id }} {{nombre}} {{ x y }}</p>"}
+
+
+class TemplateCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_second_lookup_makes_no_api_call_until_invalidated(self):
+        client = MagicMock()
+        client.get_template.return_value = TEMPLATE
+
+        first = get_template_metadata(1, "tpl", client=client)
+        second = get_template_metadata(1, "tpl", client=client)
+        self.assertEqual(client.get_template.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(first["variables"], ["cliente.id", "nombre"])
+
+        invalidate_template(1, "tpl")
+        get_template_metadata(1, "tpl", client=client)
+        self.assertEqual(client.get_template.call_count, 2)
+
+    def test_variables_memoized_by_content_hash(self):
+        content = "<p>{{ unico_hash_test }}</p>"
+        self.assertEqual(doppler_relay.template_variables(content), ["unico_hash_test"])
+        with patch.object(doppler_relay, "_MUSTACHE_RE") as regex:
+            self.assertEqual(doppler_relay.template_variables(content), ["unico_hash_test"])
+        regex.finditer.assert_not_called()
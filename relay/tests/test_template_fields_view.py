@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from django.test import AsyncRequestFactory, SimpleTestCase
+
+from relay import views
+
+
+class TemplateFieldsViewTests(SimpleTestCase):
+    def _request(self, method="get", *, staff=True):
+        request = getattr(AsyncRequestFactory(), method)("/relay/templates/tpl/fields/")
+        request.user = SimpleNamespace(is_active=True, is_staff=staff)
+        return request
+
+    async def test_returns_template_variables(self):
+        client = SimpleNamespace(get_template=AsyncMock(return_value={
+            "id": "tpl", "name": "Bienvenida", "subject": "Hola", "htmlContent": "<p>{{nombre}}</p>"}))
+        with patch.object(views, "get_async_client", return_value=client):
+            response = await views.template_fields(self._request(), "tpl")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("nombre", json.loads(response.content)["template"]["variables"])
+
+    async def test_rejects_other_methods_and_non_staff(self):
+        response = await views.template_fields(self._request("post"), "tpl")
+        self.assertEqual(response.status_code, 405)
+        response = await views.template_fields(self._request(staff=False), "tpl")
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase, override_settings
+
+from relay.services import circuit_breaker, tracing
+from relay.services.doppler_relay import DopplerRelayClient, DopplerRelayError
+
+
+class TracingTests(SimpleTestCase):
+    @override_settings(DOPPLER_RELAY={"API_KEY": "k", "BASE_URL": "https://relay.test/",
+                                      "TRACE": {"LEVEL": "off"}})
+    def test_off_level_skips_serialization(self):
+        circuit_breaker.reset()
+        self.addCleanup(circuit_breaker.reset)
+        resp = MagicMock(status_code=400, headers={}, text="{}")
+        resp.json.return_value = {"title": "bad"}
+        resp.request.headers = {}
+        resp.request.body = b'{"recipients": [{}, {}]}'
+        client = DopplerRelayClient()
+        with patch.object(client.session, "request", return_value=resp), \
+                patch.object(tracing, "summarize_body") as summarize, \
+                patch.object(tracing, "trace_request") as trace_request, \
+                patch.object(tracing, "trace_response") as trace_response:
+            with self.assertRaises(DopplerRelayError) as ctx:
+                client.send_message(1, "a@b.com", "s", text="hola", to=[("x@y.com", None), ("z@y.com", None)])
+        summarize.assert_not_called()
+        trace_request.assert_not_called()
+        trace_response.assert_not_called()
+        self.assertNotIn("request_body", ctx.exception.payload)
+        self.assertEqual((ctx.exception.payload["request_body_size"], ctx.exception.payload["request_recipients"]),
+                         (len(resp.request.body), 2))
+
+    @override_settings(DOPPLER_RELAY={"TRACE": {"LEVEL": "body", "SAMPLE_RATE": 0.0}})
+    def test_sample_rate_zero_disables_trace(self):
+        with patch.object(tracing.logger, "isEnabledFor", return_value=True):
+            self.assertEqual(tracing.sampled_level(), tracing.LEVEL_OFF)
+
+    def test_redacts_authorization_and_attachment_content(self):
+        headers = tracing.redact_headers({"Authorization": "Bearer secret", "Accept": "application/json"})
+        self.assertEqual(headers["Authorization"], "Bearer ***")
+        self.assertEqual(headers["Accept"], "application/json")
+
+        body = tracing.summarize_body({"attachments": [{"filename": "a.pdf", "content": "QUJD" * 1000}]}, 200)
+        self.assertNotIn("QUJD", body)
+        self.assertIn("4000 chars base64", body)
+
+    def test_summarize_body_truncates(self):
+        self.assertTrue(tracing.summarize_body("x" * 50, 10).startswith("x" * 10 + "... (+40"))
@@ -7,4 +7,6 @@ urlpatterns = [
          name="get_user_email_config"),
     path("user/email-config/update/", views.update_user_email_config,
          name="update_user_email_config"),
+    path("templates/<str:template_id>/fields/", views.template_fields,
+         name="relay_template_fields"),
 ]
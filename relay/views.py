@@ -1,13 +1,28 @@
 from __future__ import annotations
+from asgiref.sync import sync_to_async
 from django.views.decorators.http import require_POST
-from django.http import JsonResponse, HttpRequest
+from django.http import HttpResponseNotAllowed, JsonResponse, HttpRequest
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 import json
+import logging
 import csv
 import io
+import re
+from collections import deque
 from .models import EmailMessage
-from .services.doppler_relay import DopplerRelayClient, DopplerRelayError
+from .services.attachments import ensure_base64
+from .services.buffered_writer import BufferedWriter
+from .services.doppler_relay import DopplerRelayError, extract_template_fields, get_client
+from .services.doppler_relay_async import get_async_client
+from .services.bulk_dispatch import (
+    build_recipient_payload,
+    bulk_batch_size,
+    bulk_concurrency,
+    dispatch_chunks,
+)
+
+logger = logging.getLogger(__name__)
 
 
 def process_csv_for_template(csv_content: str, email_column: str = "email") -> list:
@@ -37,33 +52,58 @@ def process_csv_for_template(csv_content: str, email_column: str = "email") -> l
     return recipients
 
 
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+
 def validate_email(email: str) -> bool:
     """Valida que el email tenga un formato válido."""
-    import re
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(pattern, email))
+    return bool(EMAIL_RE.match(email))
 
 
-def process_bulk_template_send(template_id, recipients, subject=None, adj_list=None, from_email=None, from_name=None, user=None):
+def iter_bulk_template_send(template_id, recipients, subject=None, adj_list=None, from_email=None, from_name=None, user=None, batch_size=None, concurrency=None, idempotency_prefix=None, checkpoint_every=None, on_checkpoint=None, suppressed=None, bulk=None, start_position=0):
     """
-    Procesa el envío masivo de correos usando una plantilla.
+    Envío masivo con plantilla en streaming: produce un resultado por destinatario.
+
+    ``recipients`` puede ser cualquier iterable (p. ej. un generador que lee el
+    CSV); se consume a medida que se despachan los lotes y los resultados se
+    entregan en el orden de entrada sin acumularse.
 
     Args:
         template_id: ID de la plantilla a utilizar
-        recipients: Lista de destinatarios con sus variables
+        recipients: Iterable de destinatarios con sus variables
         subject: Asunto del correo (opcional)
         adj_list: Lista de adjuntos (opcional)
         from_email: Email del remitente (opcional)
         from_name: Nombre del remitente (opcional)
         user: Usuario que realiza el envío (opcional)
-
-    Returns:
-        Lista con los resultados del envío
+        batch_size: Destinatarios por llamada a la API (opcional,
+            por defecto DOPPLER_RELAY['BULK_BATCH_SIZE'])
+        concurrency: Lotes enviados en paralelo (opcional,
+            por defecto DOPPLER_RELAY['BULK_CONCURRENCY'])
+        idempotency_prefix: Prefijo para derivar la Idempotency-Key de cada lote
+            (opcional; p. ej. "bulk-<id>" para que reprocesar no duplique envíos)
+        checkpoint_every: Resultados entre checkpoints (opcional)
+        on_checkpoint: Callable sin argumentos que se invoca al cerrar un lote
+            cuando ya se entregaron al menos ``checkpoint_every`` resultados desde
+            el anterior. En ese punto todos los resultados entregados tienen sus
+            EmailMessage persistidos y el corte coincide con un límite de lote, así
+            que reanudar desde ahí rearma los mismos lotes (mismas Idempotency-Key).
+        suppressed: Mapping ``{email en minúsculas: motivo}`` de destinatarios que
+            no deben recibir el correo (opcional); salen con status ``suppressed``
+            sin llamar a la API.
+        bulk: BulkSend al que pertenece el envío (opcional); cada EmailMessage
+            guarda el envío y la posición de su destinatario en el archivo
+        start_position: Posición en el archivo del primer destinatario de
+            ``recipients`` (p. ej. el offset del checkpoint al reanudar)
+
+    Yields:
+        Resultado de cada destinatario ({email, status, message_id|error, variables})
     """
     from .models import UserEmailConfig
-    client = DopplerRelayClient()
-    resultados = []
     ACCOUNT_ID = str(settings.DOPPLER_RELAY["ACCOUNT_ID"])
+    concurrency = bulk_concurrency(ACCOUNT_ID, concurrency)
+    # Cliente compartido del proceso; su pool cubre todos los hilos de envío
+    client = get_client(pool_size=concurrency)
 
     # Configuración del remitente
     FROM_EMAIL = None
@@ -108,128 +148,146 @@ def process_bulk_template_send(template_id, recipients, subject=None, adj_list=N
     if not template_id:
         raise ValueError("El ID de la plantilla es requerido")
 
-    print(f"Usando remitente: {FROM_EMAIL} ({FROM_NAME})")
+    logger.debug("Usando remitente: %s (%s)", FROM_EMAIL, FROM_NAME)
 
     # Validar y procesar adjuntos si existen
     attachments = None
     if adj_list:
         try:
-            import base64
+            # Se normalizan una vez por envío; todos los payloads comparten la misma cadena
             attachments = []
             for attachment in adj_list:
-                # Si el contenido ya está en base64, lo usamos así
-                if isinstance(attachment["content"], str):
-                    content = attachment["content"]
-                    try:
-                        # Verificar si es base64 válido
-                        base64.b64decode(content)
-                    except:
-                        # Si no es base64, lo convertimos
-                        content = base64.b64encode(
-                            attachment["content"].encode()).decode()
-                else:
-                    # Si es bytes, lo convertimos a base64
-                    content = base64.b64encode(attachment["content"]).decode()
-
                 attachments.append({
-                    "content": content,
+                    "content": ensure_base64(attachment["content"]),
                     "filename": str(attachment.get("filename") or attachment.get("name", "")).strip()
                 })
         except Exception as e:
             raise ValueError(f"Error procesando adjuntos: {str(e)}")
 
-            # Procesamos cada destinatario individualmente
-    for recipient in recipients:
-        try:
-            # Validar email del destinatario
-            email = str(recipient["email"]).strip()
-            if not email or not validate_email(email):
-                raise ValueError(f"Email inválido: {email}")
-
-            # Convertir todas las variables a string y limpiar
-            variables = {}
-            if "substitution_data" in recipient:
-                variables = recipient["substitution_data"]
-            elif "variables" in recipient:
-                variables = {
-                    str(k).strip(): str(v).strip()
-                    for k, v in recipient.get("variables", {}).items()
-                    if v is not None  # Ignorar valores None
-                }            # Modelo para un solo destinatario con estructura requerida por la API
-            single_model = {
-                "from_email": FROM_EMAIL,
-                "from_name": FROM_NAME,
-                "subject": SUBJECT,
-                "template_id": str(template_id),
-                "recipients": [{
-                    "email": email,
-                    "name": recipient.get("name", ""),
-                    "variables": variables,
-                    "type": "to"
-                }]
-            }
-
-            if attachments:
-                single_model["attachments"] = attachments
-
-            if attachments:
-                # Debug pre-envío
-                print(
-                    f"Adjuntos a enviar: {json.dumps(attachments, indent=2)}")
-            print(f"\nIntentando enviar a {email}")
-            print(f"Variables: {json.dumps(variables, indent=2)}")
-            print(f"Modelo: {json.dumps(single_model, indent=2)}")
-
-            # Envío individual
-            sent = client.send_template_message(
-                account_id=ACCOUNT_ID,
-                template_id=str(template_id),
-                recipients_model=single_model
-            )
-
-            print(f"Respuesta del servidor: {json.dumps(sent, indent=2)}")
-
-            # Guardar en modelos locales
-            email_obj = EmailMessage.objects.create(
-                relay_message_id=str(sent.get("id", "")),
-                subject=SUBJECT,
-                from_email=FROM_EMAIL,
-                to_emails=email,
-                html=None,
-                text=None,
-            )
-
-            resultados.append({
-                "email": email,
-                "status": "ok",
-                "message_id": email_obj.relay_message_id,
-                "variables": variables
-            })
-
-        except DopplerRelayError as e:
-            error_info = {
-                "email": recipient["email"],
-                "status": "error",
-                "error": str(e),
-                "details": e.payload if hasattr(e, "payload") else None,
-                "variables": recipient.get("variables", {})
-            }
-            resultados.append(error_info)
-            print(f'Error Doppler para {recipient["email"]}: {str(e)}')
-            if hasattr(e, "payload"):
-                print(f"Payload de error: {e.payload}")
+    base_model = {
+        "from_email": FROM_EMAIL,
+        "from_name": FROM_NAME,
+        "subject": SUBJECT,
+        "template_id": str(template_id),
+    }
+    if attachments:
+        base_model["attachments"] = attachments
+        logger.debug("Adjuntos a enviar: %d", len(attachments))
+
+    batch_size = bulk_batch_size(batch_size)
+    # Un slot por destinatario, en orden de entrada: los errores de validación se
+    # completan al leerlos y los del lote al volver de la API; se entregan en
+    # cuanto el slot de la izquierda está completo (memoria acotada a lo en vuelo)
+    slots: deque = deque()
+
+    def _payload_chunks():
+        batch = []
+        batch_slots = []
+        # Filas resueltas sin API desde el inicio del lote en curso. Tras `batch_size`
+        # se entrega el lote (o uno vacío) para que el consumidor drene esos slots y
+        # pueda hacer checkpoint; contar desde el inicio del lote mantiene los mismos
+        # cortes (e Idempotency-Key) al reanudar desde un checkpoint
+        skipped = 0
+        for position, recipient in enumerate(recipients, start_position):
+            slot = [None, position]
+            slots.append(slot)
+            reason = suppressed.get(str(recipient.get("email") or "").strip().lower()) if suppressed else None
+            if reason:
+                slot[0] = {
+                    "email": recipient.get("email"),
+                    "status": "suppressed",
+                    "reason": reason,
+                    "variables": recipient.get("variables", {})
+                }
+            else:
+                try:
+                    payload = build_recipient_payload(
+                        recipient, is_valid_email=validate_email)
+                except Exception as e:
+                    slot[0] = {
+                        "email": recipient.get("email"),
+                        "status": "error",
+                        "error": str(e),
+                        "error_code": "invalid",
+                        "variables": recipient.get("variables", {})
+                    }
+                    logger.info("Error general para %s: %s", recipient.get("email"), e)
+            if slot[0] is not None:
+                skipped += 1
+                if skipped >= batch_size:
+                    pending_chunks.append(batch_slots)
+                    yield batch
+                    batch, batch_slots, skipped = [], [], 0
+                continue
+            if not batch:
+                skipped = 0
+            batch.append(payload)
+            batch_slots.append(slot)
+            # Agrupamos destinatarios en lotes de hasta `batch_size` por llamada
+            if len(batch) >= batch_size:
+                pending_chunks.append(batch_slots)
+                logger.debug("Intentando enviar lote de %d destinatario(s)", len(batch))
+                yield batch
+                batch, batch_slots, skipped = [], [], 0
+        if batch:
+            pending_chunks.append(batch_slots)
+            logger.debug("Intentando enviar lote de %d destinatario(s)", len(batch))
+            yield batch
+
+    since_checkpoint = 0
+
+    def _ready():
+        nonlocal since_checkpoint
+        while slots and slots[0][0] is not None:
+            since_checkpoint += 1
+            yield slots.popleft()[0]
+
+    # Slots de cada lote despachado, en el mismo orden de envío
+    pending_chunks: deque = deque()
+    # Los EmailMessage se insertan por lotes; el buffer se vuelca también al
+    # terminar o si el consumidor cierra el generador antes de tiempo
+    with BufferedWriter(EmailMessage) as writer:
+        for outcomes in dispatch_chunks(client, ACCOUNT_ID, str(template_id), base_model,
+                                        _payload_chunks(), concurrency=concurrency,
+                                        key_prefix=idempotency_prefix):
+            for slot, outcome in zip(pending_chunks.popleft(), outcomes):
+                if outcome["status"] == "ok":
+                    # Guardar en modelos locales
+                    writer.add(EmailMessage(
+                        relay_message_id=outcome["message_id"],
+                        subject=SUBJECT,
+                        from_email=FROM_EMAIL,
+                        to_emails=outcome["email"],
+                        html=None,
+                        text=None,
+                        bulk=bulk,
+                        bulk_position=slot[1] if bulk is not None else None,
+                    ))
+                else:
+                    logger.info("Error para %s: %s", outcome["email"], outcome["error"])
+                slot[0] = outcome
+            writer.maybe_flush()
+            yield from _ready()
+            if on_checkpoint is not None and since_checkpoint >= (checkpoint_every or 1):
+                writer.flush()
+                on_checkpoint()
+                since_checkpoint = 0
+        yield from _ready()
+
+
+def process_bulk_template_send(template_id, recipients, subject=None, adj_list=None, from_email=None, from_name=None, user=None, batch_size=None, concurrency=None, idempotency_prefix=None):
+    """
+    Procesa el envío masivo de correos usando una plantilla.
 
-        except Exception as e:
-            error_info = {
-                "email": recipient["email"],
-                "status": "error",
-                "error": str(e),
-                "variables": recipient.get("variables", {})
-            }
-            resultados.append(error_info)
-            print(f'Error general para {recipient["email"]}: {str(e)}')
+    Mismos argumentos que :func:`iter_bulk_template_send`.
 
-    return resultados
+    Returns:
+        Lista con los resultados del envío
+    """
+    return list(iter_bulk_template_send(
+        template_id, recipients, subject=subject, adj_list=adj_list, from_email=from_email,
+        from_name=from_name, user=user, batch_size=batch_size, concurrency=concurrency,
+        idempotency_prefix=idempotency_prefix))
 
 
 @require_POST
@@ -376,6 +434,36 @@ def send_bulk_email(request: HttpRequest):
             }, status=500)
 
 
+async def template_fields(request: HttpRequest, template_id: str):
+    """
+    Endpoint async (ASGI) con las variables Mustache de una plantilla.
+    Usa el cliente asyncio compartido, sin ocupar un hilo por petición.
+    """
+    # Sin @require_GET: en Django 4.2 el decorador no soporta vistas async
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    is_staff = await sync_to_async(
+        lambda: request.user.is_active and request.user.is_staff)()
+    if not is_staff:
+        return JsonResponse({
+            "ok": False,
+            "error": "Usuario no autorizado"
+        }, status=403)
+
+    try:
+        data = await get_async_client().get_template(
+            settings.DOPPLER_RELAY["ACCOUNT_ID"], template_id)
+        return JsonResponse({
+            "ok": True,
+            "template": extract_template_fields(data)
+        })
+    except DopplerRelayError as e:
+        return JsonResponse({
+            "ok": False,
+            "error": str(e)
+        }, status=502)
+
+
 @csrf_exempt
 def get_user_email_config(request: HttpRequest):
     """
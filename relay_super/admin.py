@@ -8,7 +8,7 @@ from django.urls import reverse
 
 from relay.models import BulkSend, UserEmailConfig
 from relay_super.models import BulkSendUserConfigProxy
-from relay.services.bulk_processing import process_bulk_id
+from relay.services.jobs import enqueue_bulk_send
 from relay.admin import BulkSendForm as BaseBulkSendForm
 
 
@@ -135,16 +135,14 @@ class BulkSendUserConfigAdmin(admin.ModelAdmin):
     def procesar_envio_masivo(self, request, queryset):
         if not (request.user.is_active and request.user.is_staff and request.user.has_perm("relay_super.change_bulksenduserconfigproxy")):
             raise PermissionDenied("No tiene permiso para procesar envíos masivos.")
-        # Ejecutar en background para no bloquear la request del admin
-        from django.utils import timezone
-        import threading
+        # Encolar para el worker (manage.py run_jobs) en lugar de ocupar el worker web
         for bulk in queryset:
             if bulk.status != "pending":
                 messages.warning(request, f"BulkSend {bulk.id} ya procesado.")
                 continue
-            bulk.processing_started_at = timezone.now()
-            bulk.log = ((bulk.log or "") + "\n[BG] Envío iniciado desde admin (por remitente)").strip()
-            bulk.save(update_fields=["processing_started_at", "log"]) 
-            threading.Thread(target=process_bulk_id, args=(bulk.id,), daemon=True).start()
-            messages.info(request, f"BulkSend {bulk.id} en proceso (background). Revise el estado en la lista.")
+            job = enqueue_bulk_send(bulk, source="admin (por remitente)")
+            if job is None:
+                messages.warning(request, f"BulkSend {bulk.id} ya está en cola.")
+                continue
+            messages.info(request, f"BulkSend {bulk.id} encolado (job {job.pk}). Revise el estado en la lista.")
         return
@@ -32,7 +32,7 @@ class GeneratedReportAdmin(admin.ModelAdmin):
     )
     list_filter = ("state", "report_type", "loaded_to_db")
     search_fields = ("report_request_id", "file_path")
-    readonly_fields = ("state", "report_request_id", "file_path", "error_details", "created_at", "updated_at", "loaded_to_db", "loaded_at")
+    readonly_fields = ("state", "report_request_id", "window_start", "window_end", "next_poll_at", "poll_attempts", "file_path", "file_size", "file_sha256", "error_details", "created_at", "updated_at", "loaded_to_db", "loaded_at")
     fields = ("report_type", "start_date", "end_date",) + readonly_fields
 
     def get_queryset(self, request):
@@ -139,8 +139,9 @@ class GeneratedReportAdmin(admin.ModelAdmin):
             return redirect("admin:reports_generatedreport_changelist")
         try:
             from .services.processor import process_pending_reports
-            process_pending_reports()
-            messages.success(request, "Procesamiento de reportes pendiente/processing ejecutado")
+            remaining = process_pending_reports()
+            messages.success(
+                request, f"Procesamiento de reportes pendiente/processing ejecutado (en proceso: {remaining})")
         except Exception as exc:
             messages.error(request, f"Error procesando reportes: {exc}")
         return redirect("admin:reports_generatedreport_changelist")
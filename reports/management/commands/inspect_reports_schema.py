@@ -47,7 +47,7 @@ class Command(BaseCommand):
                     report_type=t, start_date=start, end_date=end, state=GeneratedReport.STATE_PENDING
                 )
             # Procesar hasta READY y descargar CSV
-            process_pending_reports()
+            process_pending_reports(wait=True)
 
         # Inferir esquemas para los últimos READY por tipo
         for t in types:
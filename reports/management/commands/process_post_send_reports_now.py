@@ -1,17 +1,9 @@
 from __future__ import annotations
 
-from datetime import timedelta, timezone as dt_timezone
-
 from django.core.management.base import BaseCommand
-from django.utils import timezone
 
 from relay.models import BulkSend
-from reports.models import GeneratedReport
-from reports.services.processor import process_pending_reports
-from reports.services.loader import load_report_to_db
-
-
-REPORT_TYPES = ["deliveries"]
+from reports.services.post_send import run_post_send
 
 
 class Command(BaseCommand):
@@ -21,117 +13,22 @@ class Command(BaseCommand):
         "para cubrir desfases por zona horaria."
     )
 
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true",
+                            help="Refrescar pidiendo el día completo en lugar del delta desde la marca de agua")
+
     def handle(self, *args, **options):
         # Tomar todos los bulks en done que aún no tengan post_reports_loaded_at
-        qs = BulkSend.objects.filter(status="done", post_reports_loaded_at__isnull=True)
-
-        created_total = 0
-        processed_ok = 0
-
-        for bulk in qs.iterator():
-            self.stdout.write(self.style.NOTICE(f"Bulk {bulk.id}: preparando días local/UTC"))
-            # Determinar días objetivo: día local del envío y día UTC (para cubrir TZ)
-            local_day = bulk.created_at.date()
-            try:
-                utc_day = bulk.created_at.astimezone(dt_timezone.utc).date()
-            except Exception:
-                utc_day = local_day
-            days_to_request = {local_day, utc_day}
-            self.stdout.write(f"  días: local={local_day} utc={utc_day}")
+        qs = BulkSend.objects.filter(
+            status="done", post_reports_loaded_at__isnull=True).only("pk", "created_at")
 
-            # Crear GeneratedReport por tipo si no existe para cada día
-            for day in days_to_request:
-                for t in REPORT_TYPES:
-                    if not GeneratedReport.objects.filter(report_type=t, start_date=day, end_date=day).exists():
-                        GeneratedReport.objects.create(
-                            report_type=t,
-                            start_date=day,
-                            end_date=day,
-                            state=GeneratedReport.STATE_PENDING,
-                            requested_by=None,
-                        )
-                        created_total += 1
-                        self.stdout.write(f"  creado GeneratedReport {t} {day}")
-
-            # Si todos los GR del día están READY y ya cargados, crear uno nuevo para refrescar CSV
-            for day in list(days_to_request):
-                qs_day = GeneratedReport.objects.filter(report_type__in=REPORT_TYPES, start_date=day, end_date=day)
-                if qs_day.exists() and qs_day.filter(state=GeneratedReport.STATE_READY, loaded_to_db=True).count() == qs_day.count():
-                    for t in REPORT_TYPES:
-                        GeneratedReport.objects.create(
-                            report_type=t,
-                            start_date=day,
-                            end_date=day,
-                            state=GeneratedReport.STATE_PENDING,
-                            requested_by=None,
-                        )
-                        created_total += 1
-                        self.stdout.write(self.style.NOTICE(f"  refresco: nuevo GR {t} {day} (todos los previos cargados)"))
-
-            # Resetear reportes en ERROR para reintento automático
-            err_qs = GeneratedReport.objects.filter(
-                report_type__in=REPORT_TYPES,
-                start_date__in=list(days_to_request),
-                end_date__in=list(days_to_request),
-                state=GeneratedReport.STATE_ERROR,
-            )
-            if err_qs.exists():
-                self.stdout.write(self.style.WARNING(f"  reiniciando {err_qs.count()} reportes en ERROR -> PENDING"))
-            for rep in err_qs.iterator():
-                rep.state = GeneratedReport.STATE_PENDING
-                rep.report_request_id = ""
-                rep.file_path = ""
-                rep.error_details = ""
-                rep.save(update_fields=["state", "report_request_id", "file_path", "error_details", "updated_at"])
-
-            # Procesar pendientes y cargar a BD
-            process_pending_reports()
-            ready = GeneratedReport.objects.filter(
-                start_date__in=list(days_to_request),
-                end_date__in=list(days_to_request),
-                state=GeneratedReport.STATE_READY,
-            )
-            total_gr = GeneratedReport.objects.filter(
-                report_type__in=REPORT_TYPES,
-                start_date__in=list(days_to_request),
-                end_date__in=list(days_to_request),
-            ).count()
-            self.stdout.write(f"  encontrados GR={total_gr}, READY={ready.count()}")
-            # Cargar a BD solo los que aún no fueron cargados a alias default
-            total_inserted = 0
-            for rep in ready.iterator():
-                if not rep.loaded_to_db:
-                    try:
-                        # Log de tamaño del CSV antes de cargar
-                        from pathlib import Path
-                        size = 0
-                        try:
-                            if rep.file_path:
-                                p = Path(rep.file_path)
-                                if p.exists():
-                                    size = p.stat().st_size
-                        except Exception:
-                            size = -1
-                        self.stdout.write(f"    READY rep={rep.pk} csv_bytes={size}")
-                        inserted = load_report_to_db(rep.pk, target_alias="default")
-                        total_inserted += inserted
-                        self.stdout.write(self.style.SUCCESS(f"    loaded rep={rep.pk} rows={inserted}"))
-                    except Exception:
-                        # lo dejamos para un siguiente intento
-                        self.stdout.write(self.style.WARNING(f"    error cargando rep={rep.pk}, se reintentará"))
-                        pass
-
-            # Marcar trazabilidad en BulkSend para habilitar el botón de reporte
-            if total_inserted > 0:
-                bulk.post_reports_status = "done"
-                bulk.post_reports_loaded_at = timezone.now()
-                bulk.save(update_fields=["post_reports_status", "post_reports_loaded_at"])
-                processed_ok += 1
-                self.stdout.write(self.style.SUCCESS(f"  bulk {bulk.id}: insertadas {total_inserted} filas (marcado listo)"))
-            else:
-                self.stdout.write(self.style.WARNING(f"  bulk {bulk.id}: 0 filas insertadas (se reintentará en próxima pasada)"))
+        # Procesar pendientes esperando a que Doppler los genere; cada (día, tipo) una sola vez
+        result = run_post_send(qs.iterator(), full=options["full"], wait=True,
+                               log=lambda msg: self.stdout.write(f"  {msg}"))
 
+        if result["days"] and not result["bulks"]:
+            self.stdout.write(self.style.WARNING("  0 filas insertadas (se reintentará en próxima pasada)"))
         self.stdout.write(self.style.SUCCESS(
-            f"Post-send reports NOW: created={created_total}, bulks processed={processed_ok}"
+            f"Post-send reports NOW: days={result['days']}, created={result['created']}, "
+            f"inserted={result['inserted']}, bulks processed={result['bulks']}"
         ))
-
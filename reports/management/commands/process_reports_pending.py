@@ -6,7 +6,12 @@ from reports.services.processor import process_pending_reports
 class Command(BaseCommand):
     help = "Procesa los reportes en estado PENDING/PROCESSING (no bloquea requests web)"
 
+    def add_arguments(self, parser):
+        parser.add_argument("--wait", action="store_true",
+                            help="Repetir hasta que no queden reportes en PROCESSING")
+
     def handle(self, *args, **options):
-        process_pending_reports()
-        self.stdout.write(self.style.SUCCESS("Reportes pendientes procesados"))
+        remaining = process_pending_reports(wait=options["wait"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Reportes pendientes procesados (en proceso: {remaining})"))
 
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("reports", "0004_generatedreport_last_loaded_alias"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="generatedreport",
+            name="file_size",
+            field=models.BigIntegerField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name="generatedreport",
+            name="file_sha256",
+            field=models.CharField(max_length=64, blank=True, default=""),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("reports", "0005_generatedreport_file_checksum"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="generatedreport",
+            name="polling_since",
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name="generatedreport",
+            name="next_poll_at",
+            field=models.DateTimeField(null=True, blank=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name="generatedreport",
+            name="poll_attempts",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0006_generatedreport_polling'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report_type', models.CharField(choices=[('deliveries', 'deliveries'), ('bounces', 'bounces'), ('opens', 'opens'), ('clicks', 'clicks'), ('spam', 'spam'), ('unsubscribed', 'unsubscribed'), ('sent', 'sent')], max_length=32, unique=True)),
+                ('loaded_until', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Marca de agua de reportes',
+                'verbose_name_plural': 'Marcas de agua de reportes',
+            },
+        ),
+        migrations.AddField(
+            model_name='generatedreport',
+            name='window_end',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='generatedreport',
+            name='window_start',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
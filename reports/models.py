@@ -39,10 +39,20 @@ class GeneratedReport(models.Model):
     report_type = models.CharField(max_length=32, choices=REPORT_TYPES)
     start_date = models.DateField()
     end_date = models.DateField()
+    # Ventana exacta de un reporte incremental (delta desde la marca de agua);
+    # vacía en los reportes de días completos
+    window_start = models.DateTimeField(null=True, blank=True)
+    window_end = models.DateTimeField(null=True, blank=True)
     state = models.CharField(max_length=16, choices=STATES, default=STATE_PENDING)
     report_request_id = models.CharField(max_length=128, blank=True, default="")
     file_path = models.CharField(max_length=512, blank=True, default="")
+    file_size = models.BigIntegerField(null=True, blank=True)
+    file_sha256 = models.CharField(max_length=64, blank=True, default="")
     error_details = models.TextField(blank=True, default="")
+    # Polling no bloqueante: cada tick del procesador consulta solo los vencidos
+    polling_since = models.DateTimeField(null=True, blank=True)
+    next_poll_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    poll_attempts = models.PositiveIntegerField(default=0)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -70,3 +80,18 @@ class GeneratedReport(models.Model):
 
     def __str__(self) -> str:
         return f"{self.report_type} {self.start_date}..{self.end_date} [{self.state}]"
+
+
+class ReportWatermark(models.Model):
+    """Marca de agua por tipo de reporte: último evento ya cargado a la BD."""
+
+    report_type = models.CharField(max_length=32, unique=True, choices=GeneratedReport.REPORT_TYPES)
+    loaded_until = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Marca de agua de reportes"
+        verbose_name_plural = "Marcas de agua de reportes"
+
+    def __str__(self) -> str:
+        return f"{self.report_type} hasta {self.loaded_until:%Y-%m-%d %H:%M}"
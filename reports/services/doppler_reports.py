@@ -1,6 +1,11 @@
 from __future__ import annotations
 
+import hashlib
 import logging
+import os
+import re
+import tempfile
+import threading
 import time
 from datetime import date, datetime, time as dt_time
 from pathlib import Path
@@ -9,8 +14,11 @@ from urllib.parse import parse_qs, urlparse
 
 import requests
 from django.conf import settings
+from requests.adapters import HTTPAdapter
 from django.utils import timezone
 
+from relay.services import circuit_breaker
+
 logger = logging.getLogger(__name__)
 
 VALID_REPORT_TYPES = {
@@ -22,6 +30,7 @@ VALID_REPORT_TYPES = {
     "unsubscribed",
     "sent",
 }
+DEFAULT_CONCURRENCY = 4
 
 
 def _poll_cfg():
@@ -31,18 +40,88 @@ def _poll_cfg():
         "POLL_INITIAL_DELAY": int(cfg.get("POLL_INITIAL_DELAY", 2)),
         "POLL_MAX_DELAY": int(cfg.get("POLL_MAX_DELAY", 60)),
         "POLL_TOTAL_TIMEOUT": int(cfg.get("POLL_TOTAL_TIMEOUT", 15 * 60)),
+        "DOWNLOAD_CHUNK_SIZE": int(cfg.get("DOWNLOAD_CHUNK_SIZE", 1024 * 1024)),
+        "DOWNLOAD_RETRIES": int(cfg.get("DOWNLOAD_RETRIES", 3)),
     }
 
 
+def report_concurrency(account_id: Any = None) -> int:
+    """Llamadas simultáneas a la API de reportes para una cuenta.
+
+    ``CONCURRENCY`` admite un entero global o un dict por cuenta, p. ej.
+    ``{"9518": 8, "default": 2}``.
+    """
+    cfg = getattr(settings, "DOPPLER_REPORTS", {}) or {}
+    raw: Any = cfg.get("CONCURRENCY", DEFAULT_CONCURRENCY)
+    if isinstance(raw, dict):
+        raw = raw.get(str(account_id), raw.get("default", DEFAULT_CONCURRENCY))
+    try:
+        return max(1, int(raw))
+    except (TypeError, ValueError):
+        return DEFAULT_CONCURRENCY
+
+
+# Sesión HTTP compartida del proceso (keep-alive), segura entre hilos
+_SESSION: requests.Session | None = None
+_SESSION_LOCK = threading.Lock()
+
+
+def _session() -> requests.Session:
+    global _SESSION
+    session = _SESSION
+    if session is None:
+        with _SESSION_LOCK:
+            session = _SESSION
+            if session is None:
+                cfg = getattr(settings, "DOPPLER_REPORTS", {}) or {}
+                sizes = cfg.get("CONCURRENCY", DEFAULT_CONCURRENCY)
+                sizes = sizes.values() if isinstance(sizes, dict) else [sizes]
+                pool = max([DEFAULT_CONCURRENCY] + [int(s) for s in sizes if str(s).isdigit()])
+                session = requests.Session()
+                # API + host de archivos externos; sin reintentos de urllib3
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _SESSION = session
+    return session
+
+
+def reset_session() -> None:
+    """Cierra la sesión compartida (p. ej. tras cambiar la configuración)."""
+    global _SESSION
+    with _SESSION_LOCK:
+        session, _SESSION = _SESSION, None
+    if session is not None:
+        session.close()
+
+
+def _forget_session_after_fork() -> None:
+    # Las conexiones heredadas pertenecen al padre: el hijo solo las olvida
+    global _SESSION, _SESSION_LOCK
+    _SESSION = None
+    _SESSION_LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_session_after_fork)
+
+
 def _attachments_root() -> Path:
     return Path(settings.BASE_DIR) / "attachments" / "reports"
 
 
 class ReportError(RuntimeError):
-    def __init__(self, message: str, *, status: int | None = None, payload: Any | None = None) -> None:
+    def __init__(self, message: str, *, status: int | None = None, payload: Any | None = None,
+                 transient: bool = False) -> None:
         super().__init__(message)
         self.status = status
         self.payload = payload
+        # Falla pasajera (red, 5xx, 429, circuito abierto): conviene reintentar más tarde
+        self.transient = transient
+
+
+def is_transient(exc: BaseException) -> bool:
+    return isinstance(exc, requests.RequestException) or bool(getattr(exc, "transient", False))
 
 
 def _require_setting(name: str) -> str:
@@ -96,6 +175,27 @@ def _endpoint() -> str:
     return f"{_base_url()}/reports/reportrequest"
 
 
+def _call(method: str, url: str, **kwargs) -> requests.Response:
+    """Peticion al endpoint de reportes protegida por el circuit breaker de la cuenta."""
+    breaker = circuit_breaker.get_breaker(_account_id(), "reportrequest")
+    if not breaker.allow():
+        raise ReportError(
+            f"Servicio de reportes no disponible; reintentar en {breaker.retry_in():.0f}s",
+            payload=breaker.snapshot(),
+            transient=True,
+        )
+    try:
+        response = _session().request(method, url, **kwargs)
+    except requests.RequestException:
+        breaker.record_failure()
+        raise
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
 def _extract_report_id_from_href(href: str | None) -> str | None:
     if not href:
         return None
@@ -134,7 +234,13 @@ def _extract_report_id(data: Dict[str, Any] | None, *, location: str | None = No
     return None
 
 
-def create_report_request(start_date: date, end_date: date, report_type: str) -> str:
+def _iso_instant(value: datetime) -> str:
+    return timezone.localtime(value).replace(microsecond=0).isoformat()
+
+
+def create_report_request(start_date: date, end_date: date, report_type: str, *,
+                          start_at: datetime | None = None, end_at: datetime | None = None) -> str:
+    """Solicita un reporte de días completos o, con ``start_at``/``end_at``, de una ventana exacta."""
     normalized_type = str(report_type or "").strip().lower()
     if normalized_type not in VALID_REPORT_TYPES:
         raise ReportError(f"Tipo de reporte no soportado: {report_type}")
@@ -144,16 +250,17 @@ def create_report_request(start_date: date, end_date: date, report_type: str) ->
     cfg = _poll_cfg()
 
     body = {
-        "start_date": _iso_datetime(start_date),
-        "end_date": _iso_datetime(end_date, end=True),
+        "start_date": _iso_instant(start_at) if start_at else _iso_datetime(start_date),
+        "end_date": _iso_instant(end_at) if end_at else _iso_datetime(end_date, end=True),
         "resource": normalized_type,
         "accountId": _account_id(),
     }
 
-    logger.info("Solicitando reporte %s de %s a %s", normalized_type, start_date, end_date)
+    logger.info("Solicitando reporte %s de %s a %s", normalized_type, body["start_date"], body["end_date"])
 
     try:
-        response = requests.post(
+        response = _call(
+            "POST",
             _endpoint(),
             json=body,
             headers=_headers("application/json", content_type="application/json"),
@@ -161,7 +268,7 @@ def create_report_request(start_date: date, end_date: date, report_type: str) ->
         )
     except requests.RequestException as exc:
         logger.error("Fallo la peticion de creacion de reporte: %s", exc)
-        raise ReportError(f"Error realizando la peticion HTTP: {exc}") from exc
+        raise ReportError(f"Error realizando la peticion HTTP: {exc}", transient=True) from exc
 
     if response.status_code not in {200, 201, 202}:
         snippet = response.text.strip()[:300]
@@ -170,6 +277,7 @@ def create_report_request(start_date: date, end_date: date, report_type: str) ->
             "Error creando el reporte",
             status=response.status_code,
             payload=snippet or None,
+            transient=response.status_code >= 500 or response.status_code == 429,
         )
 
     data: Dict[str, Any] = {}
@@ -190,13 +298,65 @@ def create_report_request(start_date: date, end_date: date, report_type: str) ->
     return report_id
 
 
+def poll_report_once(report_id: str) -> Dict[str, Any] | None:
+    """Consulta una vez el estado del reporte: payload si ya está procesado, ``None`` si sigue en proceso."""
+    cfg = _poll_cfg()
+    try:
+        response = _call(
+            "GET",
+            _endpoint(),
+            params={"reportRequestId": report_id},
+            headers=_headers("application/json"),
+            timeout=cfg["DEFAULT_TIMEOUT"],
+        )
+    except requests.RequestException as exc:
+        logger.error("Error consultando estado del reporte %s: %s", report_id, exc)
+        raise ReportError(f"Error consultando estado del reporte: {exc}", transient=True) from exc
+
+    if response.status_code not in {200, 202}:
+        snippet = response.text.strip()[:300]
+        logger.error("Respuesta inesperada al consultar estado (%s): %s", response.status_code, snippet)
+        raise ReportError(
+            "Error consultando estado del reporte",
+            status=response.status_code,
+            payload=snippet or None,
+            transient=response.status_code >= 500 or response.status_code == 429,
+        )
+
+    if response.status_code == 202 or not response.content:
+        logger.debug("Reporte %s aun en proceso (HTTP %s)", report_id, response.status_code)
+        return None
+    try:
+        data = response.json()
+    except ValueError as exc:
+        snippet = response.text.strip()[:300]
+        logger.error("Respuesta JSON invalida al consultar estado: %s", snippet)
+        raise ReportError("Respuesta JSON invalida al consultar estado", payload=snippet) from exc
+
+    if data.get("processed"):
+        logger.info("Reporte %s procesado", report_id)
+        return data
+    logger.debug("Reporte %s pendiente segun payload: %s", report_id, data)
+    return None
+
+
+def poll_delay(attempts: int) -> int:
+    """Segundos hasta el próximo poll tras ``attempts`` consultas sin resultado (backoff exponencial)."""
+    cfg = _poll_cfg()
+    return min(cfg["POLL_INITIAL_DELAY"] * 2 ** max(attempts - 1, 0), cfg["POLL_MAX_DELAY"])
+
+
 def wait_until_processed(report_id: str, *, timeout: int | None = None) -> Dict[str, Any]:
+    """Bloquea hasta que el reporte esté procesado (uso interactivo).
+
+    El procesamiento en lote usa ``poll_report_once`` sin dormir
+    (ver ``reports.services.processor``).
+    """
     cfg = _poll_cfg()
     total_timeout = int(timeout if timeout is not None else cfg["POLL_TOTAL_TIMEOUT"])
-    delay = cfg["POLL_INITIAL_DELAY"]
-    max_delay = cfg["POLL_MAX_DELAY"]
     logger.info("Esperando procesamiento del reporte %s", report_id)
     start = time.monotonic()
+    attempts = 0
 
     while True:
         elapsed = time.monotonic() - start
@@ -204,97 +364,196 @@ def wait_until_processed(report_id: str, *, timeout: int | None = None) -> Dict[
             logger.error("Tiempo excedido esperando el reporte %s", report_id)
             raise ReportError("Tiempo de espera excedido al procesar el reporte")
 
-        try:
-            response = requests.get(
-                _endpoint(),
-                params={"reportRequestId": report_id},
-                headers=_headers("application/json"),
-                timeout=cfg["DEFAULT_TIMEOUT"],
-            )
-        except requests.RequestException as exc:
-            logger.error("Error consultando estado del reporte %s: %s", report_id, exc)
-            raise ReportError(f"Error consultando estado del reporte: {exc}") from exc
+        data = poll_report_once(report_id)
+        if data is not None:
+            return data
+        attempts += 1
+        time.sleep(poll_delay(attempts))
 
-        if response.status_code not in {200, 202}:
-            snippet = response.text.strip()[:300]
-            logger.error("Respuesta inesperada al consultar estado (%s): %s", response.status_code, snippet)
-            raise ReportError(
-                "Error consultando estado del reporte",
-                status=response.status_code,
-                payload=snippet or None,
-            )
 
-        if response.status_code == 202 or not response.content:
-            logger.debug("Reporte %s aun en proceso (HTTP %s)", report_id, response.status_code)
-        else:
-            try:
-                data = response.json()
-            except ValueError as exc:
-                snippet = response.text.strip()[:300]
-                logger.error("Respuesta JSON invalida al consultar estado: %s", snippet)
-                raise ReportError("Respuesta JSON invalida al consultar estado", payload=snippet) from exc
+def build_report_filename(report_type: str, report_pk: int | None = None) -> str:
+    timestamp = timezone.now().strftime("%Y%m%d_%H%M")
+    safe_type = report_type or "report"
+    # Con descargas en paralelo dos reportes del mismo tipo caen en el mismo minuto
+    suffix = f"_{report_pk}" if report_pk is not None else ""
+    return f"doppler_{safe_type}_{timestamp}{suffix}.csv"
 
-            if data.get("processed"):
-                logger.info("Reporte %s procesado", report_id)
-                return data
 
-            logger.debug("Reporte %s pendiente segun payload: %s", report_id, data)
+class _ChunkWriter:
+    """Escribe chunks en un archivo ``.part`` acumulando tamaño y SHA-256."""
 
-        time.sleep(delay)
-        delay = min(delay * 2, max_delay)
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self._fh = open(path, "wb")
 
+    def write_from(self, response: requests.Response, chunk_size: int) -> None:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if chunk:
+                self._fh.write(chunk)
+                self.sha256.update(chunk)
+                self.size += len(chunk)
 
-def build_report_filename(report_type: str) -> str:
-    timestamp = timezone.now().strftime("%Y%m%d_%H%M")
-    safe_type = report_type or "report"
-    return f"doppler_{safe_type}_{timestamp}.csv"
+    def restart(self) -> None:
+        self._fh.seek(0)
+        self._fh.truncate()
+        self.sha256 = hashlib.sha256()
+        self.size = 0
 
+    def close(self) -> None:
+        if self._fh.closed:
+            return
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._fh.close()
 
-def download_report_csv(report_id: str) -> bytes:
-    cfg = _poll_cfg()
-    logger.info("Descargando CSV del reporte %s", report_id)
 
-    try:
-        response = requests.get(
-            _endpoint(),
-            params={"reportRequestId": report_id, "format": "csv"},
-            headers=_headers("text/csv"),
-            timeout=cfg["DEFAULT_TIMEOUT"],
-        )
-    except requests.RequestException as exc:
-        logger.error("Error consultando CSV del reporte %s: %s", report_id, exc)
-        raise ReportError(f"Error descargando reporte CSV: {exc}") from exc
+_CONTENT_RANGE_RE = re.compile(r"bytes\s+(?:(\d+)-\d+|\*)/(\d+|\*)", re.IGNORECASE)
 
-    content_type = (response.headers.get("Content-Type") or "").lower()
-    if response.status_code == 200 and "text/csv" in content_type:
-        logger.info("Reporte %s descargado directamente como CSV", report_id)
-        return response.content
 
-    try:
-        data = response.json()
-    except ValueError as exc:
-        snippet = response.text.strip()[:300]
-        logger.error("Respuesta invalida al descargar reporte %s: %s", report_id, snippet)
-        raise ReportError("No se pudo interpretar la respuesta del reporte", payload=snippet) from exc
-
-    file_path = data.get("file_path") or next(
-        (link.get("href") for link in data.get("_links", []) if "files.dopplerrelay.com" in (link.get("href") or "")),
-        None,
-    )
-    if not file_path:
-        snippet = response.text.strip()[:300]
-        logger.error("No se encontro file_path en la respuesta del reporte %s", report_id)
-        raise ReportError("No se encontro el archivo del reporte", payload=snippet or None)
+def _content_range(value: str | None) -> tuple[int | None, int | None] | None:
+    """``(inicio, total)`` de un header ``Content-Range``; ``None`` si no se puede interpretar."""
+    match = _CONTENT_RANGE_RE.fullmatch((value or "").strip())
+    if not match:
+        return None
+    start, total = match.groups()
+    return (int(start) if start else None), (None if total == "*" else int(total))
+
+
+def _download_external(url: str, writer: _ChunkWriter, cfg: Dict[str, int]) -> None:
+    """Descarga el enlace externo; si la conexión se corta se retoma con ``Range``.
 
-    logger.info("Descargando CSV desde enlace externo para reporte %s", report_id)
+    La reanudación envía ``If-Range`` con el ETag (o Last-Modified) de la primera
+    respuesta y solo agrega un 206 si su ``Content-Range`` empieza justo en lo ya
+    escrito (y el total no cambió); si no, descarta lo parcial y vuelve a bajar
+    el archivo completo.
+    """
+    attempts = 0
+    validator = None
+    total = None
+    while True:
+        headers = {}
+        if writer.size:
+            headers["Range"] = f"bytes={writer.size}-"
+            if validator:
+                headers["If-Range"] = validator
+        try:
+            with _session().get(url, headers=headers, stream=True, timeout=cfg["DEFAULT_TIMEOUT"]) as follow:
+                if writer.size and follow.status_code in (206, 416):
+                    start, range_total = _content_range(follow.headers.get("Content-Range")) or (-1, None)
+                    if follow.status_code == 416:
+                        # Ya teníamos el archivo completo (si el servidor informa el total, debe coincidir)
+                        if range_total is None or range_total == writer.size:
+                            return
+                    elif start == writer.size and (total is None or range_total in (None, total)):
+                        writer.write_from(follow, cfg["DOWNLOAD_CHUNK_SIZE"])
+                        return
+                    attempts += 1
+                    if attempts > cfg["DOWNLOAD_RETRIES"]:
+                        raise ReportError(f"Rango inconsistente descargando archivo externo: "
+                                          f"{follow.headers.get('Content-Range')!r} con {writer.size} bytes")
+                    logger.warning("Content-Range %r no continúa los %d bytes descargados; se descarga de nuevo",
+                                   follow.headers.get("Content-Range"), writer.size)
+                    writer.restart()
+                    validator = total = None
+                    continue
+                follow.raise_for_status()
+                if writer.size:
+                    # El servidor ignoró el Range (o el archivo cambió según If-Range): desde cero
+                    logger.info("El enlace externo no retomó el rango; descarga completa")
+                    writer.restart()
+                validator = follow.headers.get("ETag") or follow.headers.get("Last-Modified")
+                length = follow.headers.get("Content-Length") or ""
+                if length.isdigit() and not follow.headers.get("Content-Encoding"):
+                    total = int(length)
+                writer.write_from(follow, cfg["DOWNLOAD_CHUNK_SIZE"])
+                return
+        except requests.RequestException as exc:
+            attempts += 1
+            if attempts > cfg["DOWNLOAD_RETRIES"]:
+                logger.error("Error descargando archivo externo %s: %s", url, exc)
+                raise ReportError(f"Error descargando archivo externo: {exc}") from exc
+            logger.warning("Descarga de %s interrumpida en %d bytes (intento %d): %s",
+                           url, writer.size, attempts, exc)
+            time.sleep(min(2 ** attempts, 30))
+
+
+def download_report_to_file(report_id: str, target: Path) -> Dict[str, Any]:
+    """Descarga el CSV del reporte en streaming directo a ``target``.
+
+    Escribe en ``target.part`` por chunks y al terminar lo renombra de forma
+    atómica, así nunca queda un CSV truncado con el nombre final. Devuelve
+    ``{"path", "size", "sha256"}``.
+    """
+    cfg = _poll_cfg()
+    logger.info("Descargando CSV del reporte %s", report_id)
+    target = Path(target)
+    part = target.with_name(target.name + ".part")
+    writer = _ChunkWriter(part)
     try:
-        follow = requests.get(file_path, timeout=120)
-        follow.raise_for_status()
-    except requests.RequestException as exc:
-        logger.error("Error descargando archivo externo %s: %s", file_path, exc)
-        raise ReportError(f"Error descargando archivo externo: {exc}") from exc
+        try:
+            response = _call(
+                "GET",
+                _endpoint(),
+                params={"reportRequestId": report_id, "format": "csv"},
+                headers=_headers("text/csv"),
+                timeout=cfg["DEFAULT_TIMEOUT"],
+                stream=True,
+            )
+        except requests.RequestException as exc:
+            logger.error("Error consultando CSV del reporte %s: %s", report_id, exc)
+            raise ReportError(f"Error descargando reporte CSV: {exc}") from exc
+
+        with response:
+            content_type = (response.headers.get("Content-Type") or "").lower()
+            if response.status_code == 200 and "text/csv" in content_type:
+                logger.info("Reporte %s descargado directamente como CSV", report_id)
+                try:
+                    writer.write_from(response, cfg["DOWNLOAD_CHUNK_SIZE"])
+                except requests.RequestException as exc:
+                    raise ReportError(f"Error descargando reporte CSV: {exc}") from exc
+                file_path = None
+            else:
+                try:
+                    data = response.json()
+                except ValueError as exc:
+                    snippet = response.text.strip()[:300]
+                    logger.error("Respuesta invalida al descargar reporte %s: %s", report_id, snippet)
+                    raise ReportError("No se pudo interpretar la respuesta del reporte", payload=snippet) from exc
+
+                file_path = data.get("file_path") or next(
+                    (link.get("href") for link in data.get("_links", []) if "files.dopplerrelay.com" in (link.get("href") or "")),
+                    None,
+                )
+                if not file_path:
+                    snippet = response.text.strip()[:300]
+                    logger.error("No se encontro file_path en la respuesta del reporte %s", report_id)
+                    raise ReportError("No se encontro el archivo del reporte", payload=snippet or None)
+
+        if file_path:
+            logger.info("Descargando CSV desde enlace externo para reporte %s", report_id)
+            _download_external(file_path, writer, cfg)
+        writer.close()
+        os.replace(part, target)
+    except BaseException:
+        writer.close()
+        part.unlink(missing_ok=True)
+        raise
+
+    logger.info("Reporte %s guardado en %s (%d bytes)", report_id, target, writer.size)
+    return {"path": str(target), "size": writer.size, "sha256": writer.sha256.hexdigest()}
 
-    return follow.content
+
+def download_report_csv(report_id: str) -> bytes:
+    """Contenido completo del CSV en memoria (compatibilidad).
+
+    Para reportes grandes usar :func:`download_report_to_file`.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        target = Path(tmp) / "report.csv"
+        download_report_to_file(report_id, target)
+        return target.read_bytes()
 
 
 # Expose paths/helpers for consumers
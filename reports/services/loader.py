@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import csv
+import logging
 import re
 from pathlib import Path
 from zoneinfo import ZoneInfo
@@ -12,6 +13,8 @@ from django.utils import timezone
 
 from reports.models import GeneratedReport
 
+logger = logging.getLogger(__name__)
+
 
 def _sanitize_identifier(name: str) -> str:
     s = re.sub(r"\s+", "_", str(name or "").strip())
@@ -288,6 +291,8 @@ def load_report_to_db(generated_report_id: int, target_alias: str = "default") -
         # email y text → string crudo
         return s
 
+    # Último evento del archivo (UTC) para la marca de agua incremental
+    last_event: str | None = None
     for row in data_rows:
         values = [cast_value(row.get(orig, ""), cast_types.get(orig, "text")) for orig in headers]
         # Añadir date_local cuando es summary (CSV Subject/Sender/...)
@@ -296,6 +301,10 @@ def load_report_to_db(generated_report_id: int, target_alias: str = "default") -
                 idx = headers_lower.index("date") if "date" in headers_lower else -1
             except Exception:
                 idx = -1
+            if idx >= 0:
+                event_at = values[idx]
+                if isinstance(event_at, str) and event_at.endswith("+00:00") and (last_event is None or event_at > last_event):
+                    last_event = event_at
             date_local_val = None
             if idx >= 0:
                 date_local_val = to_local_naive(row.get(headers[idx]))
@@ -303,9 +312,22 @@ def load_report_to_db(generated_report_id: int, target_alias: str = "default") -
         else:
             params_iter.append(tuple(values + [rep.pk, created_at]))
 
+    # Reporte incremental: se reemplaza solo su ventana (el solape con la carga previa)
+    if table == 'reports_deliveries' and rep.window_start and rep.window_end:
+        def _utc(value):
+            return value.astimezone(ZoneInfo("UTC")).replace(microsecond=0).isoformat(sep=" ")
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {qn(table)} WHERE {qn("date")} >= ' + ph + ' AND ' + qn('date') + ' <= ' + ph,
+                    [_utc(rep.window_start), _utc(rep.window_end)]
+                )
+        except Exception as exc:
+            logger.warning("No se pudo limpiar la ventana del reporte %s: %s", rep.pk, exc)
+
     # Reemplazo por día (ventana local) cuando se trata de deliveries summary
     try:
-        if table == 'reports_deliveries' and rep.start_date and rep.end_date and rep.start_date == rep.end_date:
+        if table == 'reports_deliveries' and not rep.window_start and rep.start_date and rep.end_date and rep.start_date == rep.end_date:
             from datetime import timedelta, datetime as _dt
             start_local = f"{rep.start_date} 00:00:00"
             end_local = f"{(rep.start_date + timedelta(days=1))} 00:00:00"
@@ -350,6 +372,13 @@ def load_report_to_db(generated_report_id: int, target_alias: str = "default") -
         rep.save(update_fields=["error_details", "updated_at"])
         raise
 
+    # Alimentar el índice de supresión (rebotes/spam/desuscritos) de forma incremental
+    try:
+        from relay.services.suppression import record_report_rows
+        record_report_rows(rep.report_type, data_rows, is_summary=is_summary)
+    except Exception as exc:
+        logger.warning("No se pudo actualizar supresiones desde reporte %s: %s", rep.pk, exc)
+
     # Log resumen de esquema utilizado
     try:
         log_dir = Path("attachments") / "reports" / "schemas"
@@ -365,6 +394,14 @@ def load_report_to_db(generated_report_id: int, target_alias: str = "default") -
     except Exception:
         pass
 
+    # Marca de agua: solo cargas a la BD principal (la que consultan los refrescos)
+    if target_alias == "default":
+        from datetime import datetime as _dt
+        from reports.services.incremental import advance_watermark
+        loaded_until = _dt.fromisoformat(last_event) if last_event else rep.window_end
+        if loaded_until is not None:
+            advance_watermark(rep.report_type, loaded_until)
+
     rep.loaded_to_db = True
     rep.loaded_at = timezone.now()
     rep.rows_inserted = int(rows_inserted)
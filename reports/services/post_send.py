@@ -0,0 +1,158 @@
+"""Planificador de reportería post-envío por día.
+
+En lugar de recorrer cada ``BulkSend`` (consultas por día/tipo y una pasada
+completa del procesador por envío), primero se reúne el conjunto de días
+distintos de todos los envíos elegibles; cada (día, tipo) se solicita y se
+carga una sola vez y al final se marcan todos los envíos afectados con un
+único ``UPDATE``.
+"""
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from datetime import date, timedelta, timezone as dt_timezone
+from typing import Callable, Iterable
+
+from django.db.models import Q
+from django.utils import timezone
+
+from relay.models import BulkSend
+from reports.models import GeneratedReport
+from reports.services.incremental import request_delta
+from reports.services.loader import load_report_to_db
+from reports.services.processor import process_pending_reports
+
+logger = logging.getLogger(__name__)
+
+REPORT_TYPES = ["deliveries"]
+
+
+def bulk_days(bulk: BulkSend) -> set[date]:
+    """Día local y día UTC del envío (cubre desfases por zona horaria)."""
+    local_day = bulk.created_at.date()
+    try:
+        utc_day = bulk.created_at.astimezone(dt_timezone.utc).date()
+    except Exception:
+        utc_day = local_day
+    return {local_day, utc_day}
+
+
+def plan_days(bulks: Iterable[BulkSend]) -> dict[date, list[int]]:
+    """``{día: [ids de BulkSend]}`` para todos los envíos."""
+    days: dict[date, list[int]] = defaultdict(list)
+    for bulk in bulks:
+        for day in bulk_days(bulk):
+            days[day].append(bulk.pk)
+    return dict(days)
+
+
+def _day_reports(days: Iterable[date], report_types: list[str]):
+    return GeneratedReport.objects.filter(
+        report_type__in=report_types, start_date__in=list(days), end_date__in=list(days))
+
+
+def ensure_reports(days: set[date], report_types: list[str], *, full: bool = False,
+                   log: Callable[[str], None] = logger.info) -> int:
+    """Crea lo que falte para cada (día, tipo) una sola vez; devuelve cuántos reportes creó."""
+    existing: dict[tuple[date, str], list[tuple[str, bool]]] = defaultdict(list)
+    for day, rtype, state, loaded in (
+        _day_reports(days, report_types).filter(window_start__isnull=True)
+        .values_list("start_date", "report_type", "state", "loaded_to_db")
+    ):
+        existing[(day, rtype)].append((state, loaded))
+
+    to_create = []
+    stale_days = set()
+    for day in sorted(days):
+        for rtype in report_types:
+            reports = existing.get((day, rtype))
+            if not reports:
+                to_create.append(GeneratedReport(report_type=rtype, start_date=day, end_date=day))
+                log(f"nuevo reporte {rtype} {day}")
+            elif all(state == GeneratedReport.STATE_READY and loaded for state, loaded in reports):
+                stale_days.add((day, rtype))
+
+    created = len(to_create)
+    GeneratedReport.objects.bulk_create(to_create)
+
+    # Refresco de días ya cargados: un delta por tipo (cubre todos los días) o el día completo con --full
+    for rtype in report_types:
+        rtype_days = sorted(day for day, t in stale_days if t == rtype)
+        if not rtype_days:
+            continue
+        if full:
+            GeneratedReport.objects.bulk_create(
+                GeneratedReport(report_type=rtype, start_date=day, end_date=day) for day in rtype_days)
+            created += len(rtype_days)
+            log(f"refresco completo {rtype}: {len(rtype_days)} día(s)")
+            continue
+        delta = request_delta(rtype, day=rtype_days[0])
+        if delta is not None:
+            created += 1
+            log(f"refresco incremental {rtype}: GR {delta.pk} desde {delta.window_start:%Y-%m-%d %H:%M}")
+
+    # Reintento automático de los que quedaron en ERROR
+    reset = _day_reports(days, report_types).filter(state=GeneratedReport.STATE_ERROR).update(
+        state=GeneratedReport.STATE_PENDING, report_request_id="", file_path="", error_details="",
+        polling_since=None, next_poll_at=None, poll_attempts=0, updated_at=timezone.now())
+    if reset:
+        log(f"reiniciando {reset} reporte(s) en ERROR -> PENDING")
+    return created
+
+
+def _report_days(rep: GeneratedReport) -> set[date]:
+    """Días cubiertos por un reporte (un delta puede abarcar varios)."""
+    return {rep.start_date + timedelta(days=n) for n in range((rep.end_date - rep.start_date).days + 1)}
+
+
+def load_ready(days: set[date], report_types: list[str], *, target_alias: str = "default",
+               log: Callable[[str], None] = logger.info) -> tuple[dict[date, int], int]:
+    """Carga una vez cada reporte READY sin cargar de esos días (y los deltas).
+
+    Devuelve las filas insertadas por día y el total por reporte: un delta que
+    abarca varios días suma sus filas a cada uno, pero solo una vez al total.
+    """
+    ready = GeneratedReport.objects.filter(
+        report_type__in=report_types, state=GeneratedReport.STATE_READY, loaded_to_db=False,
+    ).filter(
+        Q(window_start__isnull=False) | Q(start_date__in=list(days), end_date__in=list(days))
+    ).order_by("window_start", "pk")
+    inserted: dict[date, int] = defaultdict(int)
+    total = 0
+    for rep in ready:
+        try:
+            rows = load_report_to_db(rep.pk, target_alias=target_alias)
+        except Exception as exc:
+            # Se reintenta en la próxima pasada
+            log(f"error cargando reporte {rep.pk}: {exc}")
+            continue
+        log(f"cargado reporte {rep.pk} ({rep.report_type} {rep.start_date}..{rep.end_date}): {rows} filas")
+        total += rows
+        for day in _report_days(rep):
+            inserted[day] += rows
+    return dict(inserted), total
+
+
+def run_post_send(bulks: Iterable[BulkSend], *, report_types: list[str] | None = None, full: bool = False,
+                  wait: bool = False, log: Callable[[str], None] = logger.info) -> dict[str, int]:
+    """Planifica, procesa y carga la reportería de ``bulks`` con una sola pasada por (día, tipo).
+
+    Marca ``post_reports_status='done'`` en los envíos cuyos días recibieron
+    filas nuevas. Devuelve ``{"days", "created", "inserted", "bulks"}``.
+    """
+    report_types = report_types or REPORT_TYPES
+    days_map = plan_days(bulks)
+    if not days_map:
+        return {"days": 0, "created": 0, "inserted": 0, "bulks": 0}
+    days = set(days_map)
+    log(f"{len(days)} día(s) para {len({pk for ids in days_map.values() for pk in ids})} envío(s)")
+
+    created = ensure_reports(days, report_types, full=full, log=log)
+    process_pending_reports(wait=wait)
+    inserted, total = load_ready(days, report_types, log=log)
+
+    done_ids = {pk for day, rows in inserted.items() if rows > 0 for pk in days_map.get(day, [])}
+    if done_ids:
+        BulkSend.objects.filter(pk__in=done_ids).update(
+            post_reports_status="done", post_reports_loaded_at=timezone.now())
+    return {"days": len(days), "created": created, "inserted": total, "bulks": len(done_ids)}
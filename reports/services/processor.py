@@ -1,19 +1,28 @@
 from __future__ import annotations
 
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
 from pathlib import Path
+from typing import Any, Callable, Iterator
 
-from django.db import transaction
+from django.db.models import Min, Q
 from django.utils import timezone
 
 from reports.models import GeneratedReport
 from .doppler_reports import (
+    _account_id,
+    _poll_cfg,
     create_report_request,
-    wait_until_processed,
-    download_report_csv,
+    poll_report_once,
+    poll_delay,
+    download_report_to_file,
     build_report_filename,
+    report_concurrency,
     ATTACHMENTS_ROOT,
     ReportError,
+    is_transient,
 )
 
 logger = logging.getLogger(__name__)
@@ -23,55 +32,149 @@ def ensure_dir(path: Path) -> None:
     path.mkdir(parents=True, exist_ok=True)
 
 
-def process_pending_reports() -> None:
-    """Procesa en lote los reportes PENDING/PROCESSING sin depender de requests web."""
-    # 1) Pedir IDs a Doppler para los PENDING
-    pending = GeneratedReport.objects.filter(state=GeneratedReport.STATE_PENDING)
-    for rep in pending.iterator():
-        try:
-            report_id = create_report_request(rep.start_date, rep.end_date, rep.report_type)
-            rep.report_request_id = report_id
-            rep.state = GeneratedReport.STATE_PROCESSING
-            rep.error_details = ""
-            rep.save(update_fields=["report_request_id", "state", "error_details", "updated_at"])
-            logger.info("Reporte %s marcado como PROCESSING con id=%s", rep.pk, report_id)
-        except ReportError as exc:
-            rep.state = GeneratedReport.STATE_ERROR
-            rep.error_details = str(exc)
-            rep.save(update_fields=["state", "error_details", "updated_at"])
-            logger.exception("Error solicitando reporte (id=%s): %s", rep.pk, exc)
-        except Exception as exc:  # safety net
-            rep.state = GeneratedReport.STATE_ERROR
-            rep.error_details = str(exc)
-            rep.save(update_fields=["state", "error_details", "updated_at"])
-            logger.exception("Error inesperado solicitando reporte (id=%s): %s", rep.pk, exc)
-
-    # 2) Poll para los PROCESSING
-    processing = GeneratedReport.objects.filter(state=GeneratedReport.STATE_PROCESSING).exclude(report_request_id="")
-    for rep in processing.iterator():
-        try:
-            _ = wait_until_processed(rep.report_request_id)
-            csv_bytes = download_report_csv(rep.report_request_id)
-
-            ensure_dir(ATTACHMENTS_ROOT)
-            filename = build_report_filename(rep.report_type)
-            target = ATTACHMENTS_ROOT / filename
-            with open(target, "wb") as fh:
-                fh.write(csv_bytes)
-
-            rep.file_path = str(target)
-            rep.state = GeneratedReport.STATE_READY
-            rep.error_details = ""
-            rep.save(update_fields=["file_path", "state", "error_details", "updated_at"])
-            logger.info("Reporte %s listo en %s", rep.pk, target)
-        except ReportError as exc:
-            rep.state = GeneratedReport.STATE_ERROR
-            rep.error_details = str(exc)
-            rep.save(update_fields=["state", "error_details", "updated_at"])
-            logger.exception("Error procesando reporte (id=%s): %s", rep.pk, exc)
-        except Exception as exc:
-            rep.state = GeneratedReport.STATE_ERROR
+def _mark_error(rep: GeneratedReport, exc: Exception) -> None:
+    rep.state = GeneratedReport.STATE_ERROR
+    rep.error_details = str(exc)
+    rep.next_poll_at = None
+    rep.save(update_fields=["state", "error_details", "next_poll_at", "updated_at"])
+
+
+def _fan_out(fn: Callable[[GeneratedReport], Any], reports: list[GeneratedReport]
+             ) -> Iterator[tuple[GeneratedReport, Any, Exception | None]]:
+    """Ejecuta ``fn`` por reporte con hasta ``report_concurrency`` llamadas en vuelo.
+
+    Solo la llamada HTTP (y la escritura del CSV) ocurre en los hilos; los
+    resultados se entregan al hilo que itera, que es el único que toca la BD.
+    """
+    if not reports:
+        return
+    try:
+        account_id = _account_id()
+    except ReportError:
+        account_id = None
+    workers = min(report_concurrency(account_id), len(reports))
+    if workers <= 1:
+        for rep in reports:
+            try:
+                yield rep, fn(rep), None
+            except Exception as exc:
+                yield rep, None, exc
+        return
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reports") as pool:
+        futures = {pool.submit(fn, rep): rep for rep in reports}
+        for future in as_completed(futures):
+            exc = future.exception()
+            yield futures[future], (None if exc else future.result()), exc
+
+
+def _request_pending() -> None:
+    """Pide IDs a Doppler para los PENDING y programa su primer poll."""
+    pending = list(GeneratedReport.objects.filter(state=GeneratedReport.STATE_PENDING))
+    requested = _fan_out(lambda rep: create_report_request(
+        rep.start_date, rep.end_date, rep.report_type, start_at=rep.window_start, end_at=rep.window_end), pending)
+    for rep, report_id, exc in requested:
+        if exc is not None and is_transient(exc):
+            # Red, 5xx, 429 o circuito abierto: sigue PENDING y se pide en el próximo tick
             rep.error_details = str(exc)
-            rep.save(update_fields=["state", "error_details", "updated_at"])
-            logger.exception("Error inesperado procesando reporte (id=%s): %s", rep.pk, exc)
+            rep.save(update_fields=["error_details", "updated_at"])
+            logger.warning("Fallo pasajero solicitando el reporte %s, se reintenta: %s", rep.pk, exc)
+            continue
+        if exc is not None:
+            _mark_error(rep, exc)
+            logger.error("Error solicitando reporte (id=%s): %s", rep.pk, exc, exc_info=exc)
+            continue
+        now = timezone.now()
+        rep.report_request_id = report_id
+        rep.state = GeneratedReport.STATE_PROCESSING
+        rep.error_details = ""
+        rep.polling_since = now
+        rep.poll_attempts = 0
+        rep.next_poll_at = now + timedelta(seconds=poll_delay(0))
+        rep.save(update_fields=["report_request_id", "state", "error_details", "polling_since",
+                                "poll_attempts", "next_poll_at", "updated_at"])
+        logger.info("Reporte %s marcado como PROCESSING con id=%s", rep.pk, report_id)
+
+
+def _download_file(rep: GeneratedReport) -> dict[str, Any]:
+    ensure_dir(ATTACHMENTS_ROOT)
+    target = ATTACHMENTS_ROOT / build_report_filename(rep.report_type, rep.pk)
+    # Streaming a disco: el CSV nunca se carga completo en memoria
+    return download_report_to_file(rep.report_request_id, target)
+
+
+def _mark_ready(rep: GeneratedReport, downloaded: dict[str, Any]) -> None:
+    rep.file_path = downloaded["path"]
+    rep.file_size = downloaded["size"]
+    rep.file_sha256 = downloaded["sha256"]
+    rep.state = GeneratedReport.STATE_READY
+    rep.error_details = ""
+    rep.next_poll_at = None
+    rep.save(update_fields=["file_path", "file_size", "file_sha256", "state", "error_details",
+                            "next_poll_at", "updated_at"])
+    logger.info("Reporte %s listo en %s (%d bytes)", rep.pk, rep.file_path, downloaded["size"])
+
+
+def _poll_due() -> None:
+    """Consulta una vez cada PROCESSING vencido; los que siguen en proceso se reprograman con backoff."""
+    total_timeout = _poll_cfg()["POLL_TOTAL_TIMEOUT"]
+    now = timezone.now()
+    due = (
+        GeneratedReport.objects.filter(state=GeneratedReport.STATE_PROCESSING)
+        .exclude(report_request_id="")
+        .filter(Q(next_poll_at__isnull=True) | Q(next_poll_at__lte=now))
+        .order_by("next_poll_at")
+    )
+    to_poll = []
+    for rep in due:
+        rep.polling_since = rep.polling_since or now
+        if (now - rep.polling_since).total_seconds() > total_timeout:
+            _mark_error(rep, ReportError("Tiempo de espera excedido al procesar el reporte"))
+            logger.error("Tiempo excedido esperando el reporte %s", rep.pk)
+            continue
+        to_poll.append(rep)
+
+    ready = []
+    for rep, data, exc in _fan_out(lambda rep: poll_report_once(rep.report_request_id), to_poll):
+        if exc is not None and not is_transient(exc):
+            # 4xx o payload inválido: reintentar no lo va a arreglar
+            _mark_error(rep, exc)
+            logger.error("Error procesando reporte (id=%s): %s", rep.pk, exc, exc_info=exc)
+        elif data is None:
+            # Sigue en proceso o falla pasajera: se reprograma (POLL_TOTAL_TIMEOUT acota el total)
+            if exc is not None:
+                logger.warning("Fallo pasajero consultando el reporte %s, se reintenta: %s", rep.pk, exc)
+            rep.poll_attempts += 1
+            rep.next_poll_at = timezone.now() + timedelta(seconds=poll_delay(rep.poll_attempts))
+            rep.save(update_fields=["polling_since", "poll_attempts", "next_poll_at", "updated_at"])
+        else:
+            ready.append(rep)
+
+    for rep, downloaded, exc in _fan_out(_download_file, ready):
+        if exc is not None:
+            _mark_error(rep, exc)
+            logger.error("Error descargando reporte (id=%s): %s", rep.pk, exc, exc_info=exc)
+        else:
+            _mark_ready(rep, downloaded)
+
+
+def process_pending_reports(*, wait: bool = False) -> int:
+    """Procesa en lote los reportes PENDING/PROCESSING sin depender de requests web.
+
+    Cada llamada es un tick: solicita los PENDING y consulta una vez cada
+    PROCESSING cuyo ``next_poll_at`` venció, sin dormir, de modo que un reporte
+    lento no bloquea a los demás. Solicitudes, consultas y descargas se hacen
+    en paralelo (hasta ``DOPPLER_REPORTS['CONCURRENCY']`` por cuenta). Con
+    ``wait=True`` repite ticks (durmiendo hasta el próximo poll) hasta que no
+    quede ninguno en proceso.
 
+    Devuelve la cantidad de reportes que siguen en PROCESSING.
+    """
+    _request_pending()
+    while True:
+        _poll_due()
+        processing = GeneratedReport.objects.filter(state=GeneratedReport.STATE_PROCESSING).exclude(report_request_id="")
+        remaining = processing.count()
+        if not wait or not remaining:
+            return remaining
+        next_at = processing.aggregate(m=Min("next_poll_at"))["m"]
+        time.sleep(max(0.5, (next_at - timezone.now()).total_seconds()) if next_at else 0.5)
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import contextlib
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+from django.db import connection
+from django.test import TestCase
+
+from reports.models import GeneratedReport, ReportWatermark
+from reports.services.incremental import request_delta
+from reports.services.loader import load_report_to_db
+
+HEADER = "Subject,Sender,SenderName,Email,Status,Date,Opens,Clicks\n"
+
+
+class IncrementalReportTests(TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        # El loader deja logs de esquema en rutas relativas
+        self.enterContext(contextlib.chdir(self.tmp))
+
+    def _ready(self, name, rows, **fields):
+        path = self.tmp / name
+        path.write_text(HEADER + "".join(f"S,s@b.com,S,{email},Delivered,{at},0,0\n" for email, at in rows))
+        return GeneratedReport.objects.create(
+            report_type="deliveries", state=GeneratedReport.STATE_READY, file_path=str(path), **fields)
+
+    def _emails(self):
+        with connection.cursor() as cur:
+            cur.execute('SELECT "email" FROM reports_deliveries ORDER BY "date"')
+            return [r[0] for r in cur.fetchall()]
+
+    def test_delta_replaces_only_its_window_and_advances_the_watermark(self):
+        day = date(2026, 3, 2)
+        full = self._ready("full.csv", [("a@b.com", "2026-03-02T10:00:00Z"), ("b@b.com", "2026-03-02T11:00:00Z")],
+                           start_date=day, end_date=day)
+        load_report_to_db(full.pk)
+        mark = ReportWatermark.objects.get(report_type="deliveries").loaded_until
+        self.assertEqual(mark, datetime(2026, 3, 2, 11, tzinfo=dt_timezone.utc))
+
+        now = datetime(2026, 3, 2, 12, tzinfo=dt_timezone.utc)
+        delta = request_delta("deliveries", day=day, now=now)
+        self.assertEqual((delta.window_start, delta.window_end), (mark - timedelta(minutes=15), now))
+        # Ya hay un delta sin cargar: no se duplica
+        self.assertIsNone(request_delta("deliveries", day=day, now=now))
+
+        # El delta repite el evento del solape (b) y trae uno nuevo (c)
+        delta.file_path = str(self.tmp / "delta.csv")
+        (self.tmp / "delta.csv").write_text(HEADER + "S,s@b.com,S,b@b.com,Delivered,2026-03-02T11:00:00Z,0,0\n"
+                                            "S,s@b.com,S,c@b.com,Delivered,2026-03-02T11:50:00Z,0,0\n")
+        delta.state = GeneratedReport.STATE_READY
+        delta.save()
+        load_report_to_db(delta.pk)
+
+        self.assertEqual(self._emails(), ["a@b.com", "b@b.com", "c@b.com"])
+        self.assertEqual(ReportWatermark.objects.get(report_type="deliveries").loaded_until,
+                         datetime(2026, 3, 2, 11, 50, tzinfo=dt_timezone.utc))
+
+    def test_empty_delta_advances_the_watermark_to_its_window_end(self):
+        ReportWatermark.objects.create(report_type="deliveries",
+                                       loaded_until=datetime(2026, 3, 2, 11, tzinfo=dt_timezone.utc))
+        window_end = datetime(2026, 3, 2, 12, tzinfo=dt_timezone.utc)
+        delta = self._ready("empty.csv", [], start_date=date(2026, 3, 2), end_date=date(2026, 3, 2),
+                            window_start=datetime(2026, 3, 2, 10, 45, tzinfo=dt_timezone.utc), window_end=window_end)
+
+        self.assertEqual(load_report_to_db(delta.pk), 0)
+        self.assertEqual(ReportWatermark.objects.get(report_type="deliveries").loaded_until, window_end)
+        delta.refresh_from_db()
+        self.assertTrue(delta.loaded_to_db)
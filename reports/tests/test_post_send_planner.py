@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone as dt_timezone
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from relay.models import BulkSend
+from reports.models import GeneratedReport
+from reports.services import post_send
+
+
+class PostSendPlannerTests(TestCase):
+    def _bulk(self, created_at):
+        bulk = BulkSend.objects.create(template_id="tpl", template_name="tpl", subject="Hola", status="done")
+        BulkSend.objects.filter(pk=bulk.pk).update(created_at=created_at)
+        return BulkSend.objects.get(pk=bulk.pk)
+
+    def test_bulks_on_the_same_day_share_one_request_and_one_load(self):
+        # Mediodía UTC: día local y UTC coinciden
+        bulks = [self._bulk(datetime(2026, 3, 2, 12, n, tzinfo=dt_timezone.utc)) for n in range(40)]
+        other = self._bulk(datetime(2026, 3, 5, 12, tzinfo=dt_timezone.utc))
+        GeneratedReport.objects.create(report_type="deliveries", start_date=datetime(2026, 3, 5).date(),
+                                       end_date=datetime(2026, 3, 5).date(), state=GeneratedReport.STATE_ERROR)
+
+        def process(wait=False):
+            GeneratedReport.objects.filter(start_date__day=2).update(state=GeneratedReport.STATE_READY)
+
+        with patch.object(post_send, "process_pending_reports", side_effect=process) as proc, \
+                patch.object(post_send, "load_report_to_db", return_value=5) as load:
+            result = post_send.run_post_send(BulkSend.objects.all())
+
+        proc.assert_called_once()
+        load.assert_called_once()
+        self.assertEqual(result, {"days": 2, "created": 1, "inserted": 5, "bulks": 40})
+        self.assertEqual(GeneratedReport.objects.filter(start_date__day=2).count(), 1)
+        self.assertEqual(GeneratedReport.objects.get(start_date__day=5).state, GeneratedReport.STATE_PENDING)
+        self.assertEqual(BulkSend.objects.filter(post_reports_status="done").count(), len(bulks))
+        other.refresh_from_db()
+        self.assertIsNone(other.post_reports_loaded_at)
+
+    def test_multi_day_delta_counts_its_rows_once(self):
+        first = self._bulk(datetime(2026, 3, 2, 12, tzinfo=dt_timezone.utc))
+        second = self._bulk(datetime(2026, 3, 3, 12, tzinfo=dt_timezone.utc))
+        for day in (2, 3):
+            GeneratedReport.objects.create(report_type="deliveries", start_date=datetime(2026, 3, day).date(),
+                                           end_date=datetime(2026, 3, day).date(),
+                                           state=GeneratedReport.STATE_READY, loaded_to_db=True)
+        GeneratedReport.objects.create(
+            report_type="deliveries", start_date=datetime(2026, 3, 2).date(), end_date=datetime(2026, 3, 3).date(),
+            window_start=datetime(2026, 3, 2, tzinfo=dt_timezone.utc),
+            window_end=datetime(2026, 3, 3, 18, tzinfo=dt_timezone.utc), state=GeneratedReport.STATE_READY)
+
+        with patch.object(post_send, "request_delta", return_value=None), \
+                patch.object(post_send, "process_pending_reports"), \
+                patch.object(post_send, "load_report_to_db", return_value=7) as load:
+            result = post_send.run_post_send(BulkSend.objects.filter(pk__in=[first.pk, second.pk]))
+
+        load.assert_called_once()
+        self.assertEqual((result["inserted"], result["bulks"]), (7, 2))
+
+    def test_error_reports_are_reset_to_pending(self):
+        day = datetime(2026, 3, 2).date()
+        self._bulk(datetime(2026, 3, 2, 12, tzinfo=dt_timezone.utc))
+        failed = GeneratedReport.objects.create(
+            report_type="deliveries", start_date=day, end_date=day, state=GeneratedReport.STATE_ERROR,
+            report_request_id="r1", error_details="fallo", poll_attempts=4)
+
+        created = post_send.ensure_reports({day}, ["deliveries"], log=lambda msg: None)
+
+        self.assertEqual(created, 0)
+        failed.refresh_from_db()
+        self.assertEqual((failed.state, failed.report_request_id, failed.error_details, failed.poll_attempts),
+                         (GeneratedReport.STATE_PENDING, "", "", 0))
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import hashlib
+import shutil
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+import requests
+from django.test import SimpleTestCase
+
+from reports.services import doppler_reports
+
+CSV = b"Email,Status\n" + b"".join(f"u{n}@b.com,Delivered\n".encode() for n in range(50))
+
+
+class _Response:
+    def __init__(self, status_code, *, chunks=(), json_data=None, headers=None, fail_after=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._chunks = list(chunks)
+        self._json = json_data
+        self._fail_after = fail_after
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def json(self):
+        return self._json
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+    def iter_content(self, chunk_size):
+        for n, chunk in enumerate(self._chunks):
+            if n == self._fail_after:
+                raise requests.exceptions.ChunkedEncodingError("conexión cortada")
+            yield chunk
+
+
+class ReportDownloadTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.target = Path(tmp) / "r.csv"
+
+    def test_external_link_resumes_with_range_after_a_cut(self):
+        link = _Response(200, json_data={"file_path": "https://files.dopplerrelay.com/r.csv"})
+        first = _Response(200, chunks=[CSV[:100], CSV[100:]], fail_after=1,
+                          headers={"ETag": '"v1"', "Content-Length": str(len(CSV))})
+        rest = _Response(206, chunks=[CSV[100:]], headers={"Content-Range": f"bytes 100-{len(CSV) - 1}/{len(CSV)}"})
+        with patch.object(doppler_reports, "_call", return_value=link), \
+                patch.object(doppler_reports, "_headers", return_value={}), \
+                patch.object(doppler_reports.time, "sleep"), \
+                patch.object(doppler_reports, "_session") as session:
+            get = session.return_value.get
+            get.side_effect = [first, rest]
+            result = doppler_reports.download_report_to_file("7", self.target)
+
+        self.assertEqual(get.call_args_list[1].kwargs["headers"], {"Range": "bytes=100-", "If-Range": '"v1"'})
+        self.assertEqual(self.target.read_bytes(), CSV)
+        self.assertEqual(result["size"], len(CSV))
+        self.assertEqual(result["sha256"], hashlib.sha256(CSV).hexdigest())
+        self.assertFalse(self.target.with_name("r.csv.part").exists())
+
+    def test_mismatched_content_range_restarts_the_download(self):
+        link = _Response(200, json_data={"file_path": "https://files.dopplerrelay.com/r.csv"})
+        first = _Response(200, chunks=[CSV[:100], CSV[100:]], fail_after=1)
+        # El servidor devuelve otro rango: agregarlo corrompería el archivo
+        wrong = _Response(206, chunks=[CSV[50:]], headers={"Content-Range": f"bytes 50-{len(CSV) - 1}/{len(CSV)}"})
+        full = _Response(200, chunks=[CSV])
+        with patch.object(doppler_reports, "_call", return_value=link), \
+                patch.object(doppler_reports, "_headers", return_value={}), \
+                patch.object(doppler_reports.time, "sleep"), \
+                patch.object(doppler_reports, "_session") as session:
+            get = session.return_value.get
+            get.side_effect = [first, wrong, full]
+            result = doppler_reports.download_report_to_file("7", self.target)
+
+        self.assertEqual(get.call_args_list[2].kwargs["headers"], {})
+        self.assertEqual(self.target.read_bytes(), CSV)
+        self.assertEqual(result["sha256"], hashlib.sha256(CSV).hexdigest())
+
+    def test_failed_download_leaves_no_file(self):
+        direct = _Response(200, chunks=[CSV[:10], CSV[10:]], headers={"Content-Type": "text/csv"}, fail_after=1)
+        with patch.object(doppler_reports, "_call", return_value=direct), \
+                patch.object(doppler_reports, "_headers", return_value={}):
+            with self.assertRaises(doppler_reports.ReportError):
+                doppler_reports.download_report_to_file("7", self.target)
+        self.assertEqual(list(self.target.parent.iterdir()), [])
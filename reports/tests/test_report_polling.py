@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import shutil
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils import timezone
+
+from relay.services.fake_relay import FakeRelayConfig, start_in_thread
+from reports.models import GeneratedReport
+from reports.services import processor
+
+
+class ReportPollingTests(TestCase):
+    def _processing(self, request_id, **fields):
+        return GeneratedReport.objects.create(
+            report_type="deliveries", start_date=date.today(), end_date=date.today(),
+            state=GeneratedReport.STATE_PROCESSING, report_request_id=request_id, **fields)
+
+    def test_one_tick_polls_each_due_report_once_without_sleeping(self):
+        slow = self._processing("slow")
+        fast = [self._processing(f"r{n}") for n in range(3)]
+        later = self._processing("later", next_poll_at=timezone.now() + timedelta(minutes=5))
+        polled = []
+
+        def poll(report_id):
+            polled.append(report_id)
+            return None if report_id == "slow" else {"processed": True}
+
+        download = {"path": "/tmp/x.csv", "size": 10, "sha256": "ab"}
+        with patch.object(processor, "poll_report_once", side_effect=poll), \
+                patch.object(processor, "download_report_to_file", return_value=download), \
+                patch.object(processor.time, "sleep", side_effect=AssertionError("no debe dormir")):
+            remaining = processor.process_pending_reports()
+            # Segundo tick inmediato: el lento todavía no vence
+            processor.process_pending_reports()
+
+        self.assertEqual(sorted(polled), ["r0", "r1", "r2", "slow"])
+        self.assertEqual(remaining, 2)
+        for rep in fast:
+            rep.refresh_from_db()
+            self.assertEqual((rep.state, rep.file_size), (GeneratedReport.STATE_READY, 10))
+        slow.refresh_from_db()
+        self.assertEqual((slow.state, slow.poll_attempts), (GeneratedReport.STATE_PROCESSING, 1))
+        self.assertGreater(slow.next_poll_at, timezone.now())
+        self.assertIsNotNone(slow.polling_since)
+        later.refresh_from_db()
+        self.assertEqual(later.poll_attempts, 0)
+
+    def test_total_timeout_marks_error(self):
+        rep = self._processing("old", polling_since=timezone.now() - timedelta(hours=1))
+        with self.settings(DOPPLER_REPORTS={"POLL_TOTAL_TIMEOUT": 60}), \
+                patch.object(processor, "poll_report_once") as poll:
+            processor.process_pending_reports()
+        poll.assert_not_called()
+        rep.refresh_from_db()
+        self.assertEqual(rep.state, GeneratedReport.STATE_ERROR)
+
+    def test_transient_poll_errors_are_rescheduled(self):
+        flaky = self._processing("flaky")
+        gone = self._processing("gone")
+
+        def poll(report_id):
+            status = 503 if report_id == "flaky" else 404
+            raise processor.ReportError("fallo", status=status, transient=status >= 500)
+
+        with patch.object(processor, "poll_report_once", side_effect=poll):
+            processor.process_pending_reports()
+        flaky.refresh_from_db()
+        gone.refresh_from_db()
+        self.assertEqual((flaky.state, flaky.poll_attempts), (GeneratedReport.STATE_PROCESSING, 1))
+        self.assertGreater(flaky.next_poll_at, timezone.now())
+        self.assertEqual(gone.state, GeneratedReport.STATE_ERROR)
+
+    def test_transient_request_errors_stay_pending(self):
+        flaky, bad = [GeneratedReport.objects.create(report_type="deliveries", start_date=date(2026, 1, day),
+                                                     end_date=date(2026, 1, day)) for day in (1, 2)]
+
+        def create(start_date, end_date, report_type, **kwargs):
+            status = 429 if start_date.day == 1 else 400
+            raise processor.ReportError("fallo", status=status, transient=status == 429)
+
+        with patch.object(processor, "create_report_request", side_effect=create):
+            processor.process_pending_reports()
+        flaky.refresh_from_db()
+        bad.refresh_from_db()
+        self.assertEqual((flaky.state, flaky.error_details), (GeneratedReport.STATE_PENDING, "fallo"))
+        self.assertEqual(bad.state, GeneratedReport.STATE_ERROR)
+
+    def test_pending_reports_fan_out_against_the_fake_api(self):
+        server = start_in_thread(FakeRelayConfig(latency=0.05, report_rows=2))
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        for day in range(6):
+            GeneratedReport.objects.create(report_type="deliveries", start_date=date(2026, 1, day + 1),
+                                           end_date=date(2026, 1, day + 1))
+
+        relay = {"ACCOUNT_ID": 1, "API_KEY": "k", "BASE_URL": server.base_url}
+        with self.settings(DOPPLER_RELAY=relay, DOPPLER_RELAY_BASE_URL=None,
+                           DOPPLER_REPORTS={"POLL_INITIAL_DELAY": 0, "CONCURRENCY": 3}), \
+                patch.object(processor, "ATTACHMENTS_ROOT", Path(media)):
+            self.assertEqual(processor.process_pending_reports(wait=True), 0)
+
+        reports = GeneratedReport.objects.all()
+        self.assertEqual({r.state for r in reports}, {GeneratedReport.STATE_READY})
+        self.assertEqual(len({r.file_path for r in reports}), 6)
+        self.assertEqual(len(server.state.reports), 6)
@@ -7,7 +7,8 @@ from django.urls import path, reverse
 from django.shortcuts import redirect
 from django.conf import settings
 
-from relay.services.doppler_relay import DopplerRelayClient, DopplerRelayError
+from relay.services.doppler_relay import DopplerRelayClient, DopplerRelayError, get_client
+from relay.services.template_cache import invalidate_template
 from .forms import TemplateForm
 from .utils import read_cached_html, write_cached_html
 
@@ -24,7 +25,7 @@ class TemplatesAdminViews:
         return int(getattr(settings, "DOPPLER_RELAY", {}).get("ACCOUNT_ID", 0))
 
     def _client(self) -> DopplerRelayClient:
-        return DopplerRelayClient()
+        return get_client()
 
     # ---- list ----
     def list_view(self, request):
@@ -173,6 +174,7 @@ class TemplatesAdminViews:
                         body_html=form.cleaned_data["body_html"],
                     )
                     write_cached_html(template_id, form.cleaned_data["body_html"])
+                    invalidate_template(self._account_id(), template_id)
                     messages.success(request, "Template updated")
                     return redirect("admin:templates_admin_list")
                 except DopplerRelayError as exc:
@@ -205,6 +207,7 @@ class TemplatesAdminViews:
         try:
             client = self._client()
             client.delete_template(self._account_id(), template_id)
+            invalidate_template(self._account_id(), template_id)
             messages.success(request, "Template deleted")
         except DopplerRelayError as exc:
             messages.error(request, f"API error: {exc}")